@@ -0,0 +1,388 @@
+/* column_table.cpp
+ * Implements a column store of decoded log packets.
+ */
+
+#include "column_table.h"
+
+#include <datetime.h>
+#include <algorithm>
+#include <climits>
+#include <cstdio>
+#include <cstring>
+#include <limits>
+
+// Values of fields, classified by the column kind they fit in
+enum ValueKind {
+    VALUE_NONE = 0,     // skipped
+    VALUE_INT,
+    VALUE_UINT,         // does not fit in int64
+    VALUE_FLOAT,
+    VALUE_DATETIME,
+    VALUE_STRING
+};
+
+struct Value {
+    int kind;
+    long long i;
+    double f;
+    PyObject *obj;
+};
+
+typedef std::vector<std::pair<std::string, PyObject *> > Row;   // borrowed
+
+static long long
+days_from_civil (long long y, unsigned m, unsigned d) {
+    y -= m <= 2;
+    long long era = (y >= 0 ? y : y - 399) / 400;
+    unsigned yoe = (unsigned) (y - era * 400);
+    unsigned doy = (153 * (m + (m > 2 ? -3 : 9)) + 2) / 5 + d - 1;
+    unsigned doe = yoe * 365 + yoe / 4 - yoe / 100 + doy;
+    return era * 146097 + (long long) doe - 719468;
+}
+
+static void
+classify_value (PyObject *obj, Value &v) {
+    v.kind = VALUE_NONE;
+    v.i = 0;
+    v.f = 0.0;
+    v.obj = obj;
+    if (PyInt_Check(obj)) {     // including bool
+        v.kind = VALUE_INT;
+        v.i = PyInt_AS_LONG(obj);
+    } else if (PyLong_Check(obj)) {
+        v.i = PyLong_AsLongLong(obj);
+        if (v.i == -1 && PyErr_Occurred()) {
+            PyErr_Clear();
+            unsigned long long u = PyLong_AsUnsignedLongLong(obj);
+            if (u == (unsigned long long) -1 && PyErr_Occurred()) {
+                PyErr_Clear();
+                return;
+            }
+            v.kind = VALUE_UINT;
+            v.i = (long long) u;
+        } else {
+            v.kind = VALUE_INT;
+        }
+    } else if (PyFloat_Check(obj)) {
+        v.kind = VALUE_FLOAT;
+        v.f = PyFloat_AS_DOUBLE(obj);
+    } else if (PyDateTime_Check(obj)) {
+        v.kind = VALUE_DATETIME;
+        long long days = days_from_civil(PyDateTime_GET_YEAR(obj),
+                                            PyDateTime_GET_MONTH(obj),
+                                            PyDateTime_GET_DAY(obj));
+        long long seconds = days * 86400LL
+                            + PyDateTime_DATE_GET_HOUR(obj) * 3600LL
+                            + PyDateTime_DATE_GET_MINUTE(obj) * 60LL
+                            + PyDateTime_DATE_GET_SECOND(obj);
+        v.i = seconds * 1000000LL + PyDateTime_DATE_GET_MICROSECOND(obj);
+    } else if (PyString_Check(obj) || PyByteArray_Check(obj)) {
+        v.kind = VALUE_STRING;  // raw byte streams are kept as bytes
+    }
+}
+
+static void
+push_default (Column *col) {
+    switch (col->kind) {
+    case COLUMN_INT:
+        col->ints.push_back(0);
+        break;
+    case COLUMN_FLOAT:
+        col->floats.push_back(std::numeric_limits<double>::quiet_NaN());
+        break;
+    case COLUMN_DATETIME:
+        col->ints.push_back(LLONG_MIN);     // NaT
+        break;
+    case COLUMN_STRING:
+        col->strings.push_back(std::string());
+        break;
+    }
+}
+
+// Convert an integer column to float, e.g. when a float value is found.
+static void
+promote_to_float (Column *col) {
+    col->floats.resize(col->ints.size());
+    for (size_t i = 0; i < col->ints.size(); i++) {
+        if (col->is_unsigned)
+            col->floats[i] = (double) (unsigned long long) col->ints[i];
+        else
+            col->floats[i] = (double) col->ints[i];
+    }
+    col->ints.clear();
+    col->kind = COLUMN_FLOAT;
+    col->is_unsigned = false;
+}
+
+// Set the value of the last row of a column. Values of a different kind
+// are converted if possible, or skipped.
+static void
+set_last_value (Column *col, const Value &v) {
+    switch (col->kind) {
+    case COLUMN_INT:
+        if (v.kind == VALUE_INT || v.kind == VALUE_UINT) {
+            col->ints.back() = v.i;
+            if (v.kind == VALUE_UINT)
+                col->is_unsigned = true;
+        } else if (v.kind == VALUE_FLOAT) {
+            promote_to_float(col);
+            col->floats.back() = v.f;
+        }
+        break;
+    case COLUMN_FLOAT:
+        if (v.kind == VALUE_INT)
+            col->floats.back() = (double) v.i;
+        else if (v.kind == VALUE_UINT)
+            col->floats.back() = (double) (unsigned long long) v.i;
+        else if (v.kind == VALUE_FLOAT)
+            col->floats.back() = v.f;
+        break;
+    case COLUMN_DATETIME:
+        if (v.kind == VALUE_DATETIME)
+            col->ints.back() = v.i;
+        break;
+    case COLUMN_STRING:
+        if (v.kind == VALUE_STRING && PyByteArray_Check(v.obj)) {
+            col->strings.back().assign(PyByteArray_AS_STRING(v.obj),
+                                        PyByteArray_GET_SIZE(v.obj));
+        } else if (v.kind == VALUE_STRING) {
+            col->strings.back().assign(PyString_AS_STRING(v.obj),
+                                        PyString_GET_SIZE(v.obj));
+        } else {
+            PyObject *s = PyObject_Str(v.obj);
+            if (s == NULL) {
+                PyErr_Clear();
+                break;
+            }
+            col->strings.back().assign(PyString_AS_STRING(s), PyString_GET_SIZE(s));
+            Py_DECREF(s);
+        }
+        break;
+    }
+}
+
+// Return: the column of the given name, which is created for v if missing
+static Column *
+get_column (struct ColumnTable *ptable, const std::string &name, const Value &v) {
+    std::map<std::string, size_t>::iterator it = ptable->column_index.find(name);
+    if (it != ptable->column_index.end())
+        return ptable->columns[it->second];
+
+    Column *col = new Column;
+    col->name = name;
+    col->is_unsigned = (v.kind == VALUE_UINT);
+    switch (v.kind) {
+    case VALUE_FLOAT:
+        col->kind = COLUMN_FLOAT;
+        break;
+    case VALUE_DATETIME:
+        col->kind = COLUMN_DATETIME;
+        break;
+    case VALUE_STRING:
+        col->kind = COLUMN_STRING;
+        break;
+    default:
+        col->kind = COLUMN_INT;
+        break;
+    }
+    for (size_t i = 0; i < ptable->n_rows; i++)
+        push_default(col);
+    ptable->column_index[name] = ptable->columns.size();
+    ptable->columns.push_back(col);
+    return col;
+}
+
+static void
+emit_row (struct ColumnTable *ptable, const Row &row) {
+    ptable->n_rows++;
+    for (size_t i = 0; i < ptable->columns.size(); i++)
+        push_default(ptable->columns[i]);
+    for (size_t i = 0; i < row.size(); i++) {
+        Value v;
+        classify_value(row[i].second, v);
+        if (v.kind == VALUE_NONE)
+            continue;
+        set_last_value(get_column(ptable, row[i].first, v), v);
+    }
+}
+
+// Return: whether t is a (name, value, type) field of a result list
+static bool
+parse_field (PyObject *t, const char *&name, PyObject *&value, const char *&type_str) {
+    if (!PyTuple_Check(t) || PyTuple_GET_SIZE(t) != 3)
+        return false;
+    PyObject *pyname = PyTuple_GET_ITEM(t, 0);
+    PyObject *pytype = PyTuple_GET_ITEM(t, 2);
+    if (!PyString_Check(pytype))
+        return false;
+    name = (PyString_Check(pyname)? PyString_AS_STRING(pyname): NULL);
+    value = PyTuple_GET_ITEM(t, 1);
+    type_str = PyString_AS_STRING(pytype);
+    return true;
+}
+
+// Append the ordinary fields of a result list to row. Nested dicts are
+// flattened; lists and raw messages are skipped.
+static void
+add_fields (PyObject *result, const std::string &prefix, Row &row) {
+    if (!PyList_Check(result))
+        return;
+    for (Py_ssize_t i = 0; i < PyList_GET_SIZE(result); i++) {
+        const char *name, *type_str;
+        PyObject *value;
+        if (!parse_field(PyList_GET_ITEM(result, i), name, value, type_str)
+                || name == NULL)
+            continue;
+        if (type_str[0] == '\0' || strcmp(type_str, "msg") == 0)
+            row.push_back(std::make_pair(prefix + name, value));
+        else if (strcmp(type_str, "dict") == 0)
+            add_fields(value, prefix + name + ".", row);
+    }
+}
+
+// Walk down the record path from result, and emit a row for each record.
+// Return: number of rows emitted
+static size_t
+collect_rows (struct ColumnTable *ptable, PyObject *result,
+                const std::string &prefix, size_t depth, Row &row) {
+    size_t mark = row.size();
+    size_t n_rows = 0;
+    add_fields(result, prefix, row);
+    if (depth == ptable->record_path.size()) {
+        emit_row(ptable, row);
+        row.resize(mark);
+        return 1;
+    }
+
+    const std::string &list_name = ptable->record_path[depth];
+    std::string list_prefix = prefix + list_name;
+    for (Py_ssize_t i = 0; PyList_Check(result) && i < PyList_GET_SIZE(result); i++) {
+        const char *name, *type_str;
+        PyObject *value;
+        if (!parse_field(PyList_GET_ITEM(result, i), name, value, type_str)
+                || name == NULL || list_name != name
+                || strcmp(type_str, "list") != 0 || !PyList_Check(value))
+            continue;
+        for (Py_ssize_t j = 0; j < PyList_GET_SIZE(value); j++) {
+            const char *item_name, *item_type;
+            PyObject *item;
+            if (!parse_field(PyList_GET_ITEM(value, j), item_name, item, item_type))
+                continue;
+            if (strcmp(item_type, "dict") == 0) {
+                n_rows += collect_rows(ptable, item, list_prefix + ".", depth + 1, row);
+            } else if (depth + 1 == ptable->record_path.size()) {
+                // a list of plain values
+                row.push_back(std::make_pair(list_prefix, item));
+                emit_row(ptable, row);
+                row.pop_back();
+                n_rows++;
+            }
+        }
+        break;
+    }
+    row.resize(mark);
+    return n_rows;
+}
+
+void
+column_table_init (struct ColumnTable *ptable, const std::string &record_path) {
+    ptable->record_path.clear();
+    size_t start = 0;
+    while (!record_path.empty()) {
+        size_t dot = record_path.find('.', start);
+        ptable->record_path.push_back(record_path.substr(start, dot - start));
+        if (dot == std::string::npos)
+            break;
+        start = dot + 1;
+    }
+    ptable->columns.clear();
+    ptable->column_index.clear();
+    ptable->n_rows = 0;
+}
+
+void
+column_table_release (struct ColumnTable *ptable) {
+    for (size_t i = 0; i < ptable->columns.size(); i++)
+        delete ptable->columns[i];
+    ptable->columns.clear();
+    ptable->column_index.clear();
+    ptable->n_rows = 0;
+}
+
+size_t
+column_table_append (struct ColumnTable *ptable, PyObject *result) {
+    if (PyDateTimeAPI == NULL)  // import datetime module
+        PyDateTime_IMPORT;
+    Row row;
+    return collect_rows(ptable, result, "", 0, row);
+}
+
+PyObject *
+column_table_pack (const struct ColumnTable *ptable) {
+    size_t n_columns = ptable->columns.size();
+    std::vector<size_t> widths(n_columns, 8);
+    size_t record_size = 0;
+    PyObject *descr = PyList_New(n_columns);
+    for (size_t i = 0; i < n_columns; i++) {
+        const Column *col = ptable->columns[i];
+        std::string format;
+        switch (col->kind) {
+        case COLUMN_INT:
+            format = (col->is_unsigned? "<u8": "<i8");
+            break;
+        case COLUMN_FLOAT:
+            format = "<f8";
+            break;
+        case COLUMN_DATETIME:
+            format = "<M8[us]";
+            break;
+        case COLUMN_STRING:
+            {
+                size_t width = 1;
+                for (size_t j = 0; j < col->strings.size(); j++)
+                    width = std::max(width, col->strings[j].size());
+                widths[i] = width;
+                char buf[32];
+                sprintf(buf, "S%lu", (unsigned long) width);
+                format = buf;
+                break;
+            }
+        }
+        record_size += widths[i];
+        PyList_SET_ITEM(descr, i, Py_BuildValue("(ss)", col->name.c_str(),
+                                                format.c_str()));
+    }
+
+    PyObject *data = PyString_FromStringAndSize(NULL, record_size * ptable->n_rows);
+    if (data == NULL) {
+        Py_DECREF(descr);
+        return NULL;
+    }
+    char *p = PyString_AS_STRING(data);
+    memset(p, 0, record_size * ptable->n_rows);
+    // Values are stored in host order, which is little-endian on the
+    // platforms supported by dm_collector_c.
+    for (size_t r = 0; r < ptable->n_rows; r++) {
+        for (size_t i = 0; i < n_columns; i++) {
+            const Column *col = ptable->columns[i];
+            switch (col->kind) {
+            case COLUMN_INT:
+            case COLUMN_DATETIME:
+                memcpy(p, &col->ints[r], 8);
+                break;
+            case COLUMN_FLOAT:
+                memcpy(p, &col->floats[r], 8);
+                break;
+            case COLUMN_STRING:
+                memcpy(p, col->strings[r].data(), col->strings[r].size());
+                break;
+            }
+            p += widths[i];
+        }
+    }
+
+    PyObject *ret = Py_BuildValue("(OO)", descr, data);
+    Py_DECREF(descr);
+    Py_DECREF(data);
+    return ret;
+}
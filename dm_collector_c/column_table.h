@@ -0,0 +1,57 @@
+/* column_table.h
+ * Defines a column store of decoded log packets, which is packed into the
+ * records of a NumPy structured array.
+ *
+ * Each row is a packet, or an element of a list field of it (the record
+ * path, e.g. "Subpackets.Records"). Columns are named after the full path
+ * of their fields: nested dicts are flattened as "Sample.Grant received",
+ * and the fields of the elements on the record path are prefixed by the
+ * path, e.g. "Subpackets.Records.HARQ ID". Other list fields are ignored.
+ */
+
+#ifndef __DM_COLLECTOR_C_COLUMN_TABLE_H__
+#define __DM_COLLECTOR_C_COLUMN_TABLE_H__
+
+#include <Python.h>
+
+#include <map>
+#include <string>
+#include <vector>
+
+enum ColumnKind {
+    COLUMN_INT = 0,     // int64, or uint64 if is_unsigned
+    COLUMN_FLOAT,       // float64
+    COLUMN_DATETIME,    // microseconds since 1970-01-01 (datetime64[us])
+    COLUMN_STRING       // fixed-width bytes
+};
+
+struct Column {
+    std::string name;
+    int kind;
+    bool is_unsigned;
+    std::vector<long long> ints;    // COLUMN_INT and COLUMN_DATETIME
+    std::vector<double> floats;
+    std::vector<std::string> strings;
+};
+
+struct ColumnTable {
+    std::vector<std::string> record_path;   // split by "."
+    std::vector<Column *> columns;          // in the order they are found
+    std::map<std::string, size_t> column_index;
+    size_t n_rows;
+};
+
+// Must be called before usage. record_path may be empty.
+void column_table_init (struct ColumnTable *ptable, const std::string &record_path);
+// Must be called before ptable is freed.
+void column_table_release (struct ColumnTable *ptable);
+// Add the rows of a decoded result list (see log_packet.cpp). Values that
+// are not numbers, datetimes or strings are skipped.
+// Return: number of rows added
+size_t column_table_append (struct ColumnTable *ptable, PyObject *result);
+// Pack the table as consecutive little-endian records.
+// Return: New reference to (descr, data), where descr is a list of
+// (name, format) accepted by numpy.dtype(), or NULL on error
+PyObject *column_table_pack (const struct ColumnTable *ptable);
+
+#endif // __DM_COLLECTOR_C_COLUMN_TABLE_H__
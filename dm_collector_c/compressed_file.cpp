@@ -0,0 +1,415 @@
+/* compressed_file.cpp
+ * Implements reading and writing of block-compressed logs.
+ *
+ * Header of a gzip member written by compress_block() (see RFC 1952):
+ *   0x1f 0x8b 0x08, FLG = FEXTRA, MTIME = 0, XFL = 0, OS = 0xff,
+ *   XLEN = 8, subfield "MI" with LEN = 4: u32 size of the whole member
+ */
+
+#include "compressed_file.h"
+#include "hdlc.h"
+
+#include <climits>
+#include <cstring>
+
+#include <zlib.h>
+#ifdef HAVE_ZSTD
+#include <zstd.h>
+#endif
+
+static const size_t GZIP_HEADER_SIZE = 20;
+static const size_t GZIP_TRAILER_SIZE = 8;
+// Size of the chunks returned by compressed_reader_read()
+static const size_t READ_CHUNK_SIZE = 256 * 1024;
+#ifdef HAVE_ZSTD
+static const int ZSTD_LEVEL = 3;
+#endif
+
+static void
+put_uint (char *p, unsigned long long v, int n_bytes) {
+    for (int i = 0; i < n_bytes; i++) {
+        p[i] = char(v & 0xFF);
+        v >>= 8;
+    }
+}
+
+static unsigned long long
+get_uint (const char *p, int n_bytes) {
+    unsigned long long v = 0;
+    for (int i = n_bytes - 1; i >= 0; i--)
+        v = (v << 8) | (unsigned char) p[i];
+    return v;
+}
+
+static bool
+ends_with (const std::string &s, const char *suffix) {
+    size_t n = strlen(suffix);
+    return s.size() >= n && s.compare(s.size() - n, n, suffix) == 0;
+}
+
+int
+detect_compression (const char *b, size_t length) {
+    if (length >= 2 && b[0] == '\x1f' && b[1] == '\x8b')
+        return COMPRESSION_GZIP;
+    if (length >= 4 && memcmp(b, "\x28\xb5\x2f\xfd", 4) == 0)
+        return COMPRESSION_ZSTD;
+    return COMPRESSION_NONE;
+}
+
+int
+compression_from_path (const std::string &path) {
+    if (ends_with(path, ".gz"))
+        return COMPRESSION_GZIP;
+    if (ends_with(path, ".zst"))
+        return COMPRESSION_ZSTD;
+    return COMPRESSION_NONE;
+}
+
+const char *
+compression_extension (int compression) {
+    switch (compression) {
+    case COMPRESSION_GZIP:
+        return ".gz";
+    case COMPRESSION_ZSTD:
+        return ".zst";
+    default:
+        return "";
+    }
+}
+
+bool
+compression_supported (int compression) {
+    switch (compression) {
+    case COMPRESSION_NONE:
+    case COMPRESSION_GZIP:
+        return true;
+#ifdef HAVE_ZSTD
+    case COMPRESSION_ZSTD:
+        return true;
+#endif
+    default:
+        return false;
+    }
+}
+
+static bool
+compress_gzip_block (const char *b, size_t length, std::string &out) {
+    z_stream zs;
+    memset(&zs, 0, sizeof(zs));
+    // Raw deflate, as the header and trailer are written here
+    if (deflateInit2(&zs, Z_DEFAULT_COMPRESSION, Z_DEFLATED, -MAX_WBITS, 8,
+                        Z_DEFAULT_STRATEGY) != Z_OK)
+        return false;
+    size_t start = out.size();
+    size_t bound = deflateBound(&zs, (uLong) length);
+    out.resize(start + GZIP_HEADER_SIZE + bound + GZIP_TRAILER_SIZE);
+    char *header = &out[start];
+    memcpy(header, "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x08\x00MI\x04\x00", 16);
+
+    zs.next_in = (Bytef *) b;
+    zs.avail_in = (uInt) length;
+    zs.next_out = (Bytef *) &out[start + GZIP_HEADER_SIZE];
+    zs.avail_out = (uInt) bound;
+    int ret = deflate(&zs, Z_FINISH);
+    size_t deflated = bound - zs.avail_out;
+    deflateEnd(&zs);
+    if (ret != Z_STREAM_END) {
+        out.resize(start);
+        return false;
+    }
+
+    size_t member_size = GZIP_HEADER_SIZE + deflated + GZIP_TRAILER_SIZE;
+    char *trailer = &out[start + GZIP_HEADER_SIZE + deflated];
+    put_uint(trailer, crc32(crc32(0L, Z_NULL, 0), (const Bytef *) b, (uInt) length), 4);
+    put_uint(trailer + 4, length, 4);
+    put_uint(&out[start + 16], member_size, 4);
+    out.resize(start + member_size);
+    return true;
+}
+
+bool
+compress_block (int compression, const char *b, size_t length, std::string &out) {
+    switch (compression) {
+    case COMPRESSION_GZIP:
+        return compress_gzip_block(b, length, out);
+#ifdef HAVE_ZSTD
+    case COMPRESSION_ZSTD: {
+        size_t start = out.size();
+        out.resize(start + ZSTD_compressBound(length));
+        size_t n = ZSTD_compress(&out[start], out.size() - start, b, length, ZSTD_LEVEL);
+        if (ZSTD_isError(n)) {
+            out.resize(start);
+            return false;
+        }
+        out.resize(start + n);
+        return true;
+    }
+#endif
+    default:
+        return false;
+    }
+}
+
+// Return: the size of the gzip member at b as recorded by compress_block(),
+// or 0 if it is not recorded
+static size_t
+get_gzip_member_size (const char *b, size_t length) {
+    if (length < 12 || (b[3] & 0x04) == 0)  // no FEXTRA
+        return 0;
+    size_t xlen = (size_t) get_uint(b + 10, 2);
+    if (length < 12 + xlen)
+        return 0;
+    const char *p = b + 12;
+    const char *end = p + xlen;
+    while (end - p >= 4) {
+        size_t len = (size_t) get_uint(p + 2, 2);
+        if (p[0] == 'M' && p[1] == 'I' && len == 4 && end - p >= 8)
+            return (size_t) get_uint(p + 4, 4);
+        p += 4 + len;
+    }
+    return 0;
+}
+
+// Locate all blocks of a file without decompressing them.
+// Return: false if the size of some block is unknown
+static bool
+map_blocks (int compression, const char *b, size_t length,
+            std::vector<CompressedBlock> &blocks) {
+    size_t pos = 0;
+    unsigned long long raw_offset = 0;
+    blocks.clear();
+    while (pos < length) {
+        CompressedBlock block;
+        block.offset = pos;
+        block.raw_offset = raw_offset;
+        if (compression == COMPRESSION_GZIP) {
+            if (detect_compression(b + pos, length - pos) != COMPRESSION_GZIP)
+                return false;
+            block.size = get_gzip_member_size(b + pos, length - pos);
+            if (block.size < GZIP_HEADER_SIZE + GZIP_TRAILER_SIZE
+                    || block.size > length - pos)
+                return false;
+            block.raw_size = (size_t) get_uint(b + pos + block.size - 4, 4);
+        } else {
+#ifdef HAVE_ZSTD
+            block.size = ZSTD_findFrameCompressedSize(b + pos, length - pos);
+            if (ZSTD_isError(block.size))
+                return false;
+            unsigned long long raw_size = ZSTD_getFrameContentSize(b + pos, length - pos);
+            if (raw_size == ZSTD_CONTENTSIZE_UNKNOWN || raw_size == ZSTD_CONTENTSIZE_ERROR)
+                return false;
+            block.raw_size = (size_t) raw_size;
+#else
+            return false;
+#endif
+        }
+        blocks.push_back(block);
+        pos += block.size;
+        raw_offset += block.raw_size;
+    }
+    return true;
+}
+
+// Decompress a block located by map_blocks(), and append it to out.
+// Return: successful or not
+static bool
+decompress_block (int compression, const char *b, const CompressedBlock &block,
+                    std::string &out) {
+    size_t start = out.size();
+    out.resize(start + block.raw_size);
+    if (block.raw_size == 0)
+        return true;
+    bool success = false;
+    if (compression == COMPRESSION_GZIP) {
+        z_stream zs;
+        memset(&zs, 0, sizeof(zs));
+        if (inflateInit2(&zs, 16 + MAX_WBITS) == Z_OK) {
+            zs.next_in = (Bytef *) (b + block.offset);
+            zs.avail_in = (uInt) block.size;
+            zs.next_out = (Bytef *) &out[start];
+            zs.avail_out = (uInt) block.raw_size;
+            success = (inflate(&zs, Z_FINISH) == Z_STREAM_END && zs.avail_out == 0);
+            inflateEnd(&zs);
+        }
+    } else {
+#ifdef HAVE_ZSTD
+        size_t n = ZSTD_decompress(&out[start], block.raw_size, b + block.offset, block.size);
+        success = !ZSTD_isError(n) && n == block.raw_size;
+#endif
+    }
+    if (!success)
+        out.resize(start);
+    return success;
+}
+
+bool
+compressed_reader_open (struct CompressedReader *preader, const char *b, size_t length) {
+    preader->compression = detect_compression(b, length);
+    preader->data = b;
+    preader->size = length;
+    preader->stream = NULL;
+    preader->pos = 0;
+    preader->finished = false;
+    preader->window.clear();
+    preader->window_offset = 0;
+    preader->next_block = 0;
+    if (!compression_supported(preader->compression)
+            || preader->compression == COMPRESSION_NONE)
+        return false;
+    if (!map_blocks(preader->compression, b, length, preader->blocks))
+        preader->blocks.clear();
+
+    if (preader->compression == COMPRESSION_GZIP) {
+        z_stream *zs = new z_stream;
+        memset(zs, 0, sizeof(*zs));
+        if (inflateInit2(zs, 16 + MAX_WBITS) != Z_OK) {
+            delete zs;
+            return false;
+        }
+        preader->stream = zs;
+    } else {
+#ifdef HAVE_ZSTD
+        ZSTD_DStream *ds = ZSTD_createDStream();
+        if (ds == NULL)
+            return false;
+        ZSTD_initDStream(ds);
+        preader->stream = ds;
+#endif
+    }
+    return true;
+}
+
+void
+compressed_reader_close (struct CompressedReader *preader) {
+    if (preader->stream != NULL) {
+        if (preader->compression == COMPRESSION_GZIP) {
+            z_stream *zs = (z_stream *) preader->stream;
+            inflateEnd(zs);
+            delete zs;
+        } else {
+#ifdef HAVE_ZSTD
+            ZSTD_freeDStream((ZSTD_DStream *) preader->stream);
+#endif
+        }
+    }
+    preader->stream = NULL;
+    preader->blocks.clear();
+    std::string().swap(preader->window);
+    preader->finished = true;
+}
+
+bool
+compressed_reader_read (struct CompressedReader *preader, std::string &out) {
+    out.resize(READ_CHUNK_SIZE);
+    size_t produced = 0;
+    if (preader->stream == NULL)
+        preader->finished = true;
+
+    if (!preader->finished && preader->compression == COMPRESSION_GZIP) {
+        z_stream *zs = (z_stream *) preader->stream;
+        while (produced == 0 && !preader->finished) {
+            size_t remaining = preader->size - preader->pos;
+            zs->next_in = (Bytef *) (preader->data + preader->pos);
+            zs->avail_in = (uInt) (remaining < UINT_MAX? remaining: UINT_MAX);
+            zs->next_out = (Bytef *) &out[0];
+            zs->avail_out = (uInt) out.size();
+            int ret = inflate(zs, Z_NO_FLUSH);
+            preader->pos = (const char *) zs->next_in - preader->data;
+            produced = out.size() - zs->avail_out;
+            if (ret == Z_STREAM_END) {
+                // Continue with the next member, if any
+                if (detect_compression(preader->data + preader->pos,
+                                        preader->size - preader->pos) == COMPRESSION_GZIP)
+                    inflateReset(zs);
+                else
+                    preader->finished = true;
+            } else if (ret != Z_OK) {   // corrupted or truncated
+                preader->finished = true;
+            }
+        }
+    }
+#ifdef HAVE_ZSTD
+    if (!preader->finished && preader->compression == COMPRESSION_ZSTD) {
+        ZSTD_DStream *ds = (ZSTD_DStream *) preader->stream;
+        ZSTD_inBuffer input = {preader->data, preader->size, preader->pos};
+        ZSTD_outBuffer output = {&out[0], out.size(), 0};
+        while (output.pos == 0) {
+            size_t ret = ZSTD_decompressStream(ds, &output, &input);
+            if (ZSTD_isError(ret) || (output.pos == 0 && input.pos == input.size)) {
+                preader->finished = true;
+                break;
+            }
+        }
+        preader->pos = input.pos;
+        produced = output.pos;
+    }
+#endif
+
+    out.resize(produced);
+    return produced > 0;
+}
+
+// Append the next block (or chunk, if blocks are unknown) to the window.
+// Return: false if there is no more data
+static bool
+extend_window (struct CompressedReader *preader) {
+    if (preader->blocks.empty()) {
+        std::string chunk;
+        if (!compressed_reader_read(preader, chunk))
+            return false;
+        preader->window.append(chunk);
+        return true;
+    }
+    if (preader->next_block >= preader->blocks.size())
+        return false;
+    const CompressedBlock &block = preader->blocks[preader->next_block++];
+    return decompress_block(preader->compression, preader->data, block, preader->window);
+}
+
+// Return: the index of the block containing the given offset of the
+// decompressed stream
+static size_t
+find_block (const std::vector<CompressedBlock> &blocks, unsigned long long offset) {
+    size_t lo = 0, hi = blocks.size();
+    while (hi - lo > 1) {
+        size_t mid = lo + (hi - lo) / 2;
+        if (blocks[mid].raw_offset <= offset)
+            lo = mid;
+        else
+            hi = mid;
+    }
+    return lo;
+}
+
+bool
+compressed_reader_frame_at (struct CompressedReader *preader, unsigned long long offset,
+                            const char *& frame, size_t& frame_length) {
+    unsigned long long window_end = preader->window_offset + preader->window.size();
+    if (!preader->blocks.empty() && (offset < preader->window_offset || offset >= window_end)) {
+        // Jump to the block of the frame
+        size_t i = find_block(preader->blocks, offset);
+        preader->window.clear();
+        preader->window_offset = preader->blocks[i].raw_offset;
+        preader->next_block = i;
+    } else if (offset < preader->window_offset) {
+        return false;
+    }
+    while (true) {
+        // Data before the frame is no longer needed
+        if (offset > preader->window_offset) {
+            size_t skipped = (size_t) (offset - preader->window_offset);
+            if (skipped > preader->window.size())
+                skipped = preader->window.size();
+            preader->window.erase(0, skipped);
+            preader->window_offset += skipped;
+        }
+        if (offset == preader->window_offset) {
+            size_t pos = 0;
+            if (get_next_escaped_frame_from(preader->window.data(), preader->window.size(),
+                                            pos, frame, frame_length))
+                return true;
+        }
+        if (!extend_window(preader))
+            return false;
+    }
+}
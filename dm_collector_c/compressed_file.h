@@ -0,0 +1,90 @@
+/* compressed_file.h
+ * Defines block-compressed logs (gzip or zstd), which can be read as a
+ * stream, or from the middle of the file.
+ *
+ * A compressed log is a sequence of independently compressed blocks: gzip
+ * members or zstd frames, so that zcat and zstdcat can still read it. The
+ * compressed size of a gzip member is kept in an "MI" extra field of its
+ * header, and the decompressed size in its trailer. zstd frames carry both
+ * sizes in their headers. Hence the blocks of a log can be located without
+ * decompressing it.
+ *
+ * zstd is supported only if the module is built with HAVE_ZSTD.
+ */
+
+#ifndef __DM_COLLECTOR_C_COMPRESSED_FILE_H__
+#define __DM_COLLECTOR_C_COMPRESSED_FILE_H__
+
+#include <cstddef>
+#include <string>
+#include <vector>
+
+enum Compression {
+    COMPRESSION_NONE = 0,
+    COMPRESSION_GZIP,
+    COMPRESSION_ZSTD
+};
+
+// Size of the decompressed data in a block written by the export manager
+#define COMPRESSED_BLOCK_SIZE (256 * 1024)
+
+// Return: the compression of a file, told by its first bytes
+int detect_compression (const char *b, size_t length);
+// Return: the compression of a file to be written, told by its extension
+// (".gz" or ".zst")
+int compression_from_path (const std::string &path);
+// Return: the extension of a compressed file (e.g. ".gz"), or "" if
+// compression is COMPRESSION_NONE
+const char *compression_extension (int compression);
+// Return: whether this build can read and write the given compression
+bool compression_supported (int compression);
+
+// Compress b as one block, and append it to out.
+// Return: successful or not
+bool compress_block (int compression, const char *b, size_t length, std::string &out);
+
+struct CompressedBlock {
+    size_t offset;      // offset of the block in the compressed file
+    size_t size;
+    unsigned long long raw_offset;  // offset of its data in the decompressed stream
+    size_t raw_size;
+};
+
+// Reads a compressed file held in memory, e.g. a MappedFile.
+struct CompressedReader {
+    int compression;
+    const char *data;
+    size_t size;
+    // Blocks of the file. Empty if their sizes are unknown (e.g. the file is
+    // compressed by gzip), in which case the file can only be read from the
+    // beginning.
+    std::vector<CompressedBlock> blocks;
+    // Decompression stream for compressed_reader_read()
+    void *stream;
+    size_t pos;         // position of stream in data
+    bool finished;
+    // Decompressed data starting at window_offset, kept by
+    // compressed_reader_frame_at()
+    std::string window;
+    unsigned long long window_offset;
+    size_t next_block;  // the block to be appended to window
+};
+
+// Must be called before usage.
+// Return: successful or not. It fails if the compression of b is unsupported.
+bool compressed_reader_open (struct CompressedReader *preader,
+                                const char *b, size_t length);
+void compressed_reader_close (struct CompressedReader *preader);
+// Decompress the next chunk of the file into out.
+// Return: false at the end of the file, or if the file is corrupted
+bool compressed_reader_read (struct CompressedReader *preader, std::string &out);
+// Locate the escaped frame at the given offset of the decompressed stream,
+// like get_next_escaped_frame_from(). Only the blocks covering the frame are
+// decompressed. Offsets should increase between calls; otherwise a file
+// without known blocks cannot be read. frame is valid until the next call.
+// Return: if there is a frame or not
+bool compressed_reader_frame_at (struct CompressedReader *preader,
+                                    unsigned long long offset,
+                                    const char *& frame, size_t& frame_length);
+
+#endif // __DM_COLLECTOR_C_COMPRESSED_FILE_H__
@@ -0,0 +1,143 @@
+/* decode_stats.cpp
+ * Implements per-type counters of the frames taken out and decoded.
+ */
+
+#include "decode_stats.h"
+#include "consts.h"
+#include "utils.h"
+
+#include <cstdio>
+#include <cstring>
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <sys/time.h>
+#include <time.h>
+#endif
+
+void
+decode_stats_init (struct DecodeStats *pstats) {
+    pstats->enabled = false;
+    pstats->types.clear();
+}
+
+void
+decode_stats_reset (struct DecodeStats *pstats) {
+    pstats->types.clear();
+}
+
+// Return: the counters of type_id, zeroed if not counted yet
+static TypeStats &
+stats_of (struct DecodeStats *pstats, int type_id) {
+    std::map<int, TypeStats>::iterator it = pstats->types.find(type_id);
+    if (it == pstats->types.end()) {
+        TypeStats zero;
+        memset(&zero, 0, sizeof(zero));
+        it = pstats->types.insert(std::make_pair(type_id, zero)).first;
+    }
+    return it->second;
+}
+
+void
+decode_stats_merge (struct DecodeStats *pstats, const struct DecodeStats &other) {
+    for (std::map<int, TypeStats>::const_iterator it = other.types.begin();
+            it != other.types.end(); ++it) {
+        TypeStats &s = stats_of(pstats, it->first);
+        const TypeStats &o = it->second;
+        s.frames_seen += o.frames_seen;
+        s.frames_accepted += o.frames_accepted;
+        s.crc_failures += o.crc_failures;
+        s.bytes += o.bytes;
+        s.frames_decoded += o.frames_decoded;
+        s.decode_ns += o.decode_ns;
+        if (o.max_decode_ns > s.max_decode_ns)
+            s.max_decode_ns = o.max_decode_ns;
+    }
+}
+
+void
+decode_stats_add_frame (struct DecodeStats *pstats, int type_id, size_t escaped_length,
+                        bool crc_checked, bool crc_correct, bool accepted) {
+    TypeStats &s = stats_of(pstats, type_id);
+    s.frames_seen++;
+    s.bytes += escaped_length;
+    if (crc_checked && !crc_correct)
+        s.crc_failures++;
+    if (accepted)
+        s.frames_accepted++;
+}
+
+void
+decode_stats_add_decode (struct DecodeStats *pstats, int type_id,
+                            unsigned long long elapsed_ns) {
+    TypeStats &s = stats_of(pstats, type_id);
+    s.frames_decoded++;
+    s.decode_ns += elapsed_ns;
+    if (elapsed_ns > s.max_decode_ns)
+        s.max_decode_ns = elapsed_ns;
+}
+
+unsigned long long
+decode_stats_now_ns () {
+#ifdef _WIN32
+    static LARGE_INTEGER frequency;
+    LARGE_INTEGER counter;
+    if (frequency.QuadPart == 0)
+        QueryPerformanceFrequency(&frequency);
+    QueryPerformanceCounter(&counter);
+    return (unsigned long long) (counter.QuadPart * 1.0e9 / frequency.QuadPart);
+#elif defined(CLOCK_MONOTONIC)
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (unsigned long long) ts.tv_sec * 1000000000ULL + ts.tv_nsec;
+#else
+    struct timeval tv;
+    gettimeofday(&tv, NULL);
+    return (unsigned long long) tv.tv_sec * 1000000000ULL + tv.tv_usec * 1000ULL;
+#endif
+}
+
+// Return: New reference to the dict key of type_id, or NULL on error
+static PyObject *
+type_key (int type_id) {
+    if (type_id < 0)
+        Py_RETURN_NONE;
+    const char *name = search_name(LogPacketTypeID_To_Name,
+                                    ARRAY_SIZE(LogPacketTypeID_To_Name, ValueName),
+                                    type_id);
+    if (name != NULL)
+        return PyString_FromString(name);
+    char buf[16];
+    sprintf(buf, "0x%04x", type_id);
+    return PyString_FromString(buf);
+}
+
+PyObject *
+decode_stats_to_dict (const struct DecodeStats *pstats) {
+    PyObject *ret = PyDict_New();
+    if (ret == NULL)
+        return NULL;
+    for (std::map<int, TypeStats>::const_iterator it = pstats->types.begin();
+            it != pstats->types.end(); ++it) {
+        const TypeStats &s = it->second;
+        PyObject *key = type_key(it->first);
+        PyObject *value = Py_BuildValue("{s:K,s:K,s:K,s:K,s:K,s:K,s:K}",
+                                        "frames_seen", s.frames_seen,
+                                        "frames_accepted", s.frames_accepted,
+                                        "crc_failures", s.crc_failures,
+                                        "bytes", s.bytes,
+                                        "frames_decoded", s.frames_decoded,
+                                        "decode_ns", s.decode_ns,
+                                        "max_decode_ns", s.max_decode_ns);
+        if (key == NULL || value == NULL || PyDict_SetItem(ret, key, value) < 0) {
+            Py_XDECREF(key);
+            Py_XDECREF(value);
+            Py_DECREF(ret);
+            return NULL;
+        }
+        Py_DECREF(key);
+        Py_DECREF(value);
+    }
+    return ret;
+}
@@ -0,0 +1,54 @@
+/* decode_stats.h
+ * Defines per-type counters of the frames taken out of collectors and
+ * decoded, to find out which packet types dominate the decoding cost.
+ *
+ * Counters are collected only when enabled. Frames taken out without holding
+ * the GIL are counted in a private DecodeStats first, then merged into the
+ * shared one with the GIL held.
+ */
+
+#ifndef __DM_COLLECTOR_C_DECODE_STATS_H__
+#define __DM_COLLECTOR_C_DECODE_STATS_H__
+
+#include <Python.h>
+
+#include <map>
+
+struct TypeStats {
+    unsigned long long frames_seen;     // all frames taken out
+    unsigned long long frames_accepted; // passed the CRC check and the filter
+    unsigned long long crc_failures;
+    unsigned long long bytes;           // escaped size of the frames seen
+    unsigned long long frames_decoded;
+    unsigned long long decode_ns;       // total time spent decoding
+    unsigned long long max_decode_ns;
+};
+
+struct DecodeStats {
+    bool enabled;
+    std::map<int, TypeStats> types;     // by type ID, -1 if not recognized
+};
+
+// Must be called before usage.
+void decode_stats_init (struct DecodeStats *pstats);
+void decode_stats_reset (struct DecodeStats *pstats);
+// Add the counters of other to pstats.
+void decode_stats_merge (struct DecodeStats *pstats, const struct DecodeStats &other);
+
+// Count a frame taken out. crc_checked is false if the frame is dropped by
+// the filter before it is unescaped.
+void decode_stats_add_frame (struct DecodeStats *pstats, int type_id, size_t escaped_length,
+                                bool crc_checked, bool crc_correct, bool accepted);
+// Count the decoding of a frame.
+void decode_stats_add_decode (struct DecodeStats *pstats, int type_id,
+                                unsigned long long elapsed_ns);
+
+// Return: nanoseconds from a monotonic clock
+unsigned long long decode_stats_now_ns ();
+
+// Return: New reference to a dict that maps type names to dicts of counters,
+// or NULL on error. Unrecognized frames are listed under None, and types
+// without a name under their IDs.
+PyObject *decode_stats_to_dict (const struct DecodeStats *pstats);
+
+#endif // __DM_COLLECTOR_C_DECODE_STATS_H__
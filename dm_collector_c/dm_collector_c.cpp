@@ -5,13 +5,24 @@
  */
 
 #include <Python.h>
+#include <pythread.h>
 
+#include "column_table.h"
+#include "compressed_file.h"
 #include "consts.h"
+#include "decode_stats.h"
 #include "hdlc.h"
 #include "log_config.h"
 #include "log_packet.h"
 #include "export_manager.h"
+#include "log_index.h"
+#include "mapped_file.h"
+#include "record.h"
 
+#include <datetime.h>
+
+#include <climits>
+#include <deque>
 #include <string>
 #include <vector>
 #include <algorithm>
@@ -27,20 +38,75 @@
 #include <sys/time.h>
 #endif
 
+#ifdef WITH_THREAD
+// Acquire a lock while holding the GIL. If the lock is busy, the GIL is
+// released while waiting, so that the holder can finish its work.
+#define ACQUIRE_LOCK(lock) do { \
+        if (!PyThread_acquire_lock((lock), 0)) { \
+            Py_BEGIN_ALLOW_THREADS \
+            PyThread_acquire_lock((lock), 1); \
+            Py_END_ALLOW_THREADS \
+        } \
+    } while (0)
+#define RELEASE_LOCK(lock) PyThread_release_lock(lock)
+#else
+#define ACQUIRE_LOCK(lock)
+#define RELEASE_LOCK(lock)
+#endif
+
+// Feeding less data than this does not release the GIL
+#define FEED_GIL_MINSIZE 2048
+// Maximum number of accepted frames taken out of a buffer each time the GIL
+// is released
+#define FRAME_BATCH_SIZE 256
+
 // NOTE: the following number should be updated every time.
-#define DM_COLLECTOR_C_VERSION "1.0.12"
+#define DM_COLLECTOR_C_VERSION "1.0.29"
+
+// State owned by each collector: the reassembly buffer of fed data, the
+// filter and export configuration, and the options of decoding.
+// The lock protects hdlc and emanager, which are used without the GIL.
+struct CollectorState {
+    HdlcBufferState hdlc;
+    ExportManagerState emanager;
+    DecodingOptions decoding;   // only used with the GIL held
+    PyThread_type_lock lock;
+};
+
+// Global collector used by module-level functions
+static CollectorState g_collector;
 
-// Global variable to control exportation of raw log
-static ExportManagerState g_emanager;
+// Counters of all collectors and replays, only used with the GIL held
+static DecodeStats g_stats;
+
+// dm_collector_c.Collector: a Python object that owns a CollectorState, so
+// that several collectors can be used independently in one process.
+typedef struct {
+    PyObject_HEAD
+    CollectorState *state;
+} Collector;
 
 static PyObject *dm_collector_c_disable_logs (PyObject *self, PyObject *args);
 static PyObject *dm_collector_c_enable_logs (PyObject *self, PyObject *args);
 static PyObject *dm_collector_c_set_filtered_export (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_set_export_routes (PyObject *self, PyObject *args);
 static PyObject *dm_collector_c_set_filtered (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_set_strict_crc (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_set_timestamp_format (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_set_byte_stream_format (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_set_record_format (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_get_finished_logs (PyObject *self, PyObject *args);
 static PyObject *dm_collector_c_generate_diag_cfg (PyObject *self, PyObject *args);
 static PyObject *dm_collector_c_feed_binary (PyObject *self, PyObject *args);
 static PyObject *dm_collector_c_reset (PyObject *self, PyObject *args);
 static PyObject *dm_collector_c_receive_log_packet (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_receive_log_packets (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_replay_file (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_index_file (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_decode_frame (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_get_stats (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_reset_stats (PyObject *self, PyObject *args);
+static PyObject *dm_collector_c_set_stats_enabled (PyObject *self, PyObject *args);
 
 static PyMethodDef DmCollectorCMethods[] = {
     {"disable_logs", dm_collector_c_disable_logs, METH_VARARGS,
@@ -68,14 +134,73 @@ static PyMethodDef DmCollectorCMethods[] = {
     {"set_filtered_export", dm_collector_c_set_filtered_export, METH_VARARGS,
         "Configure this moduel to output a filtered log file.\n"
         "\n"
+        "Accepted frames are written through without being re-encoded.\n"
+        "\n"
         "Args:\n"
+        "    path: the path of the output file.\n"
         "    type_names: a sequence of type names.\n"
+        "    buffer_size: size of the write buffer in bytes. 0 means\n"
+        "        unbuffered. Default to 1 MB.\n"
+        "    flush_interval: if positive, a background thread flushes the\n"
+        "        write buffer every flush_interval seconds. Default to 0.\n"
+        "    max_bytes: if positive, roll over to a new file before the\n"
+        "        current one exceeds max_bytes bytes. Default to 0.\n"
+        "    max_seconds: if positive, roll over to a new file when the\n"
+        "        current one has been written for max_seconds seconds.\n"
+        "        Default to 0.\n"
+        "\n"
+        "    buffer_size, flush_interval, max_bytes and max_seconds take\n"
+        "    effect when a new output file is opened. Files roll over at\n"
+        "    frame boundaries. If rotation is enabled, the files are named\n"
+        "    after path, with \"%d\" replaced by a sequence number starting\n"
+        "    from 0, or with \"_N\" inserted before the file extension if\n"
+        "    path contains no \"%d\". See get_finished_logs().\n"
+        "\n"
+        "    If path ends with \".gz\" or \".zst\", the file is compressed\n"
+        "    in independent blocks (gzip members or zstd frames), which can\n"
+        "    be read by replay_file() from the middle of the file. Blocks are\n"
+        "    written every 256 KB of data, or when they are older than\n"
+        "    flush_interval. max_bytes applies to the compressed size, and\n"
+        "    may be exceeded by up to one block.\n"
         "\n"
         "Returns:\n"
         "    Successful or not.\n"
         "\n"
         "Raises\n"
-        "    ValueError: when an unrecognized type name is passed in.\n"
+        "    ValueError: when an unrecognized type name, a negative\n"
+        "        buffer_size, a negative max_bytes or an unsupported\n"
+        "        compression is passed in.\n"
+    },
+    {"set_export_routes", dm_collector_c_set_export_routes, METH_VARARGS,
+        "Export frames of different types to different files.\n"
+        "\n"
+        "Each route writes the frames of its types to its own file, in the\n"
+        "same framing pass as the export set by set_filtered_export(), so a\n"
+        "log can be split into several files by reading it once. Routes do\n"
+        "not affect which packets are decoded. The files of the previous\n"
+        "routes are closed.\n"
+        "\n"
+        "Args:\n"
+        "    routes: a sequence of (path, type_names) pairs. An empty sequence\n"
+        "        removes all routes.\n"
+        "    buffer_size, flush_interval, max_bytes, max_seconds: applied to\n"
+        "        every route. See set_filtered_export().\n"
+        "\n"
+        "Returns:\n"
+        "    Successful or not.\n"
+        "\n"
+        "Raises\n"
+        "    TypeError: when a route is not a (path, type_names) tuple.\n"
+        "    ValueError: when an unrecognized type name, a negative\n"
+        "        buffer_size, a negative max_bytes or an unsupported\n"
+        "        compression is passed in.\n"
+    },
+    {"get_finished_logs", dm_collector_c_get_finished_logs, METH_VARARGS,
+        "Return the exported log files closed by rotation.\n"
+        "\n"
+        "Returns:\n"
+        "    A list of the paths of the files closed since the last call,\n"
+        "    in the order they were closed.\n"
     },
     {"set_filtered", dm_collector_c_set_filtered, METH_VARARGS,
         "Configure this moduel to only decode filtered logs.\n"
@@ -90,7 +215,68 @@ static PyMethodDef DmCollectorCMethods[] = {
         "    ValueError: when an unrecognized type name is passed in.\n"
     },
     {"feed_binary", dm_collector_c_feed_binary, METH_VARARGS,
-        "Feed raw packets."},
+        "Feed raw packets.\n"
+        "\n"
+        "Args:\n"
+        "    b: a str, or any object supporting the buffer protocol (e.g.\n"
+        "        bytearray, memoryview, mmap). The data is copied, so the\n"
+        "        caller may reuse the object after this call returns.\n"
+    },
+    {"set_strict_crc", dm_collector_c_set_strict_crc, METH_VARARGS,
+        "Configure whether frames rejected by the filter are CRC-checked.\n"
+        "\n"
+        "By default, the type of a frame is checked against the filter\n"
+        "before the frame is unescaped, so unwanted frames are dropped\n"
+        "without unescaping or CRC checking. Enable this to unescape and\n"
+        "check every frame, e.g. for strict statistics of corrupted frames.\n"
+        "\n"
+        "Args:\n"
+        "    enabled: True to check every frame, False to restore the default.\n"
+    },
+    {"set_timestamp_format", dm_collector_c_set_timestamp_format, METH_VARARGS,
+        "Configure the format of the timestamps in decoded packets.\n"
+        "\n"
+        "Timestamps are decoded as datetime objects by default. Numeric\n"
+        "formats avoid allocating a datetime for every packet.\n"
+        "\n"
+        "Args:\n"
+        "    format: \"datetime\", \"epoch\" (float seconds since 1970-01-01,\n"
+        "        taking the device time as UTC) or \"ticks\" (int, raw QCDM\n"
+        "        ticks of 1/52428800 second since 1980-01-06).\n"
+        "\n"
+        "Raises\n"
+        "    ValueError: when an unsupported format is passed in.\n"
+    },
+    {"set_byte_stream_format", dm_collector_c_set_byte_stream_format, METH_VARARGS,
+        "Configure the format of byte stream fields (e.g. payloads and masks)\n"
+        "in decoded packets.\n"
+        "\n"
+        "These fields are decoded as hex strings by default. Raw bytes save\n"
+        "formatting bytes that are never read.\n"
+        "\n"
+        "Args:\n"
+        "    format: \"hex\" (a str such as \"0x01ab\") or \"bytes\" (a\n"
+        "        bytearray of the same bytes, in the order of the hex digits).\n"
+        "\n"
+        "Raises\n"
+        "    ValueError: when an unsupported format is passed in.\n"
+    },
+    {"set_record_format", dm_collector_c_set_record_format, METH_VARARGS,
+        "Configure the format of the elements of list fields (e.g. the PDUs\n"
+        "of a subpacket) in packets decoded with output=\"dict\" or \"lazy\".\n"
+        "\n"
+        "These elements are decoded as dicts by default. Records take a\n"
+        "fraction of the memory of dicts, and are read in the same way\n"
+        "(record[\"Sys FN\"], record.get(), record.keys(), ...), or as\n"
+        "attributes (record.sys_fn). They are read-only, and dict(record)\n"
+        "converts one to a dict.\n"
+        "\n"
+        "Args:\n"
+        "    format: \"dict\" or \"record\" (dm_collector_c.Record).\n"
+        "\n"
+        "Raises\n"
+        "    ValueError: when an unsupported format is passed in.\n"
+    },
     {"reset", dm_collector_c_reset, METH_VARARGS,
         "Reset dm_collector."},
     {"generate_diag_cfg", dm_collector_c_generate_diag_cfg, METH_VARARGS,
@@ -112,14 +298,318 @@ static PyMethodDef DmCollectorCMethods[] = {
         "        Default to False.\n"
         "    include_timestamp: Return the time when the message is received.\n"
         "        Default to False.\n"
+        "    output: \"list\", \"dict\" or \"lazy\". Default to \"list\".\n"
         "\n"
         "Returns:\n"
         "    If include_timestamp is True, return (decoded, posix_timestamp);\n"
         "    otherwise only return decoded message.\n"
+        "\n"
+        "    If output is \"list\", decoded is a list of (name, value, type)\n"
+        "    to be passed to DMLogPacket. If output is \"dict\", decoded is\n"
+        "    (dict, raw_msgs, fields): dict is what DMLogPacket.decode()\n"
+        "    returns, except for the raw messages to be dissected by\n"
+        "    Wireshark, which are listed in raw_msgs as (name, value, type),\n"
+        "    and fields is the list that output=\"list\" gives, which keeps\n"
+        "    the order of the fields for DMLogPacket.decode_xml(). If output is\n"
+        "    \"lazy\", decoded is (header, frame, formats): header is a dict of\n"
+        "    the header fields, frame is the unescaped frame, and formats are\n"
+        "    the formats of the collector, to be passed to decode_frame() with\n"
+        "    the frame later. If skip_decoding is also set, \"lazy\" is the\n"
+        "    same as \"dict\".\n"
+        "\n"
+        "Raises\n"
+        "    ValueError: when output is not \"list\", \"dict\" or \"lazy\".\n"
+    },
+    {"receive_log_packets", dm_collector_c_receive_log_packets, METH_VARARGS,
+        "Extract all complete log packets from feeded data.\n"
+        "\n"
+        "Args:\n"
+        "    max_n: the maximum number of packets to return. A value less than\n"
+        "        or equal to 0 means no limit. Default to 0.\n"
+        "    skip_decoding: If set to True, only the header would be decoded.\n"
+        "        Default to False.\n"
+        "    include_timestamp: Return the time when the messages are received.\n"
+        "        Default to False.\n"
+        "    output: \"list\", \"dict\" or \"lazy\", as in\n"
+        "        receive_log_packet().\n"
+        "        Default to \"list\".\n"
+        "\n"
+        "Returns:\n"
+        "    A list of packets in the order they are received. Each item is\n"
+        "    the same as the return value of receive_log_packet(). Corrupted\n"
+        "    or filtered frames are dropped.\n"
+        "\n"
+        "Raises\n"
+        "    ValueError: when output is not \"list\", \"dict\" or \"lazy\".\n"
+    },
+    {"replay_file", dm_collector_c_replay_file, METH_VARARGS,
+        "Iterate over the log packets in a mi2log/qmdl file.\n"
+        "\n"
+        "The file is memory-mapped and framed directly, without going\n"
+        "through feed_binary(). The data fed by feed_binary() is not affected.\n"
+        "Files compressed with gzip or zstd are decompressed on the fly.\n"
+        "\n"
+        "Args:\n"
+        "    path: path of the log file.\n"
+        "    type_names: a sequence of type names to be decoded. If set to\n"
+        "        None, the filter and export set by set_filtered() and\n"
+        "        set_filtered_export() are used. Default to None.\n"
+        "    skip_decoding: If set to True, only the header would be decoded.\n"
+        "        Default to False.\n"
+        "    include_timestamp: Return the time when the message is decoded.\n"
+        "        Default to False.\n"
+        "    start_time: a datetime object. If set, only the packets whose\n"
+        "        device timestamps are not earlier than it are decoded.\n"
+        "        Default to None.\n"
+        "    end_time: a datetime object. If set, only the packets whose\n"
+        "        device timestamps are earlier than it are decoded.\n"
+        "        Default to None.\n"
+        "    output: \"list\", \"dict\" or \"lazy\", as in\n"
+        "        receive_log_packet().\n"
+        "        Default to \"list\".\n"
+        "\n"
+        "    If start_time or end_time is set, the frames are located with the\n"
+        "    index of the file (see index_file()), and the frames of other\n"
+        "    types or out of the time window are skipped without being\n"
+        "    unescaped or checked. Debug messages, which have no device\n"
+        "    timestamp, take the timestamp of the preceding packet.\n"
+        "\n"
+        "Returns:\n"
+        "    An iterator. Each item is the same as the return value of\n"
+        "    receive_log_packet().\n"
+        "\n"
+        "Raises\n"
+        "    IOError: when the file cannot be opened or mapped, or its\n"
+        "        compression is not supported.\n"
+        "    TypeError: when start_time or end_time is not a datetime.\n"
+        "    ValueError: when an unrecognized type name or output is passed in.\n"
+    },
+    {"decode_frame", dm_collector_c_decode_frame, METH_VARARGS,
+        "Decode a frame returned by receive_log_packet() or replay_file()\n"
+        "with output=\"lazy\".\n"
+        "\n"
+        "Args:\n"
+        "    frame: the unescaped frame.\n"
+        "    output: \"list\" or \"dict\", as in receive_log_packet().\n"
+        "        Default to \"list\".\n"
+        "    timestamp_format: as in set_timestamp_format(). Default to\n"
+        "        \"datetime\".\n"
+        "    byte_stream_format: as in set_byte_stream_format(). Default to\n"
+        "        \"hex\".\n"
+        "    record_format: as in set_record_format(). Default to \"dict\".\n"
+        "\n"
+        "Returns:\n"
+        "    The decoded message, or None if the frame is neither a log packet\n"
+        "    nor a debug message.\n"
+        "\n"
+        "Raises\n"
+        "    ValueError: when output is neither \"list\" nor \"dict\", or a\n"
+        "        format is not supported.\n"
+    },
+    {"get_stats", dm_collector_c_get_stats, METH_NOARGS,
+        "Get the counters of frames and decoding collected since the last\n"
+        "reset_stats(), summed over all collectors and replays.\n"
+        "\n"
+        "Counters are only collected after set_stats_enabled(True).\n"
+        "\n"
+        "Returns:\n"
+        "    A dict from type names to dicts of counters:\n"
+        "        frames_seen: frames taken out, including corrupted ones.\n"
+        "        frames_accepted: frames with a correct CRC that pass the\n"
+        "            filter.\n"
+        "        crc_failures: frames with an incorrect CRC. Frames dropped\n"
+        "            by the filter are not checked unless strict CRC checking\n"
+        "            is enabled (see set_strict_crc()).\n"
+        "        bytes: total size of the frames seen, as transferred.\n"
+        "        frames_decoded: number of decodings. A lazy packet is\n"
+        "            counted once when returned and once when decoded.\n"
+        "        decode_ns: total time spent decoding, in nanoseconds.\n"
+        "        max_decode_ns: the longest decoding, in nanoseconds.\n"
+        "    Frames that are not recognized are counted under None, and types\n"
+        "    without a name under their IDs (e.g. \"0x1234\").\n"
+    },
+    {"reset_stats", dm_collector_c_reset_stats, METH_NOARGS,
+        "Clear the counters returned by get_stats().\n"
+    },
+    {"set_stats_enabled", dm_collector_c_set_stats_enabled, METH_VARARGS,
+        "Configure whether the counters returned by get_stats() are\n"
+        "collected. Disabled by default.\n"
+        "\n"
+        "Args:\n"
+        "    enabled: True to collect counters, False to stop. Collected\n"
+        "        counters are kept until reset_stats().\n"
+    },
+    {"index_file", dm_collector_c_index_file, METH_VARARGS,
+        "List the frames in a mi2log/qmdl file, decoding only their headers.\n"
+        "\n"
+        "The index is saved as a sidecar file (path + \".mi2idx\"), which is\n"
+        "reused until the size or the modification time of the log changes.\n"
+        "\n"
+        "Args:\n"
+        "    path: path of the log file.\n"
+        "\n"
+        "Returns:\n"
+        "    A list of (offset, type_name, timestamp), one for each frame.\n"
+        "    offset is the byte offset of the frame in the file (in the\n"
+        "    decompressed data if the file is compressed), timestamp is\n"
+        "    the device timestamp in the packet header (a datetime object).\n"
+        "    type_name is None if the frame is not a log packet or a debug\n"
+        "    message, and timestamp is None if it is not available.\n"
+        "\n"
+        "Raises\n"
+        "    IOError: when the file cannot be opened or mapped, or its\n"
+        "        compression is not supported.\n"
     },
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
+// Methods of dm_collector_c.Collector. They share the implementation of the
+// module-level functions, but work on the state of the Collector object.
+static PyMethodDef CollectorMethods[] = {
+    {"set_filtered_export", dm_collector_c_set_filtered_export, METH_VARARGS,
+        "Configure this collector to output a filtered log file.\n"
+        "See dm_collector_c.set_filtered_export().\n"
+    },
+    {"set_filtered", dm_collector_c_set_filtered, METH_VARARGS,
+        "Configure this collector to only decode filtered logs.\n"
+        "See dm_collector_c.set_filtered().\n"
+    },
+    {"set_strict_crc", dm_collector_c_set_strict_crc, METH_VARARGS,
+        "Configure whether this collector checks the CRC of filtered-out frames.\n"
+        "See dm_collector_c.set_strict_crc().\n"
+    },
+    {"set_timestamp_format", dm_collector_c_set_timestamp_format, METH_VARARGS,
+        "Configure the format of the timestamps decoded by this collector.\n"
+        "See dm_collector_c.set_timestamp_format().\n"
+    },
+    {"set_byte_stream_format", dm_collector_c_set_byte_stream_format, METH_VARARGS,
+        "Configure the format of byte stream fields decoded by this collector.\n"
+        "See dm_collector_c.set_byte_stream_format().\n"
+    },
+    {"set_record_format", dm_collector_c_set_record_format, METH_VARARGS,
+        "Configure the format of list elements decoded by this collector.\n"
+        "See dm_collector_c.set_record_format().\n"
+    },
+    {"set_export_routes", dm_collector_c_set_export_routes, METH_VARARGS,
+        "Export frames of different types to different files in one pass.\n"
+        "See dm_collector_c.set_export_routes().\n"
+    },
+    {"get_finished_logs", dm_collector_c_get_finished_logs, METH_VARARGS,
+        "Return the log files exported by this collector and closed by rotation.\n"
+        "See dm_collector_c.get_finished_logs().\n"
+    },
+    {"feed_binary", dm_collector_c_feed_binary, METH_VARARGS,
+        "Feed raw packets to this collector.\n"
+        "See dm_collector_c.feed_binary().\n"
+    },
+    {"reset", dm_collector_c_reset, METH_VARARGS,
+        "Discard the data fed to this collector."},
+    {"receive_log_packet", dm_collector_c_receive_log_packet, METH_VARARGS,
+        "Extract a log packet from data fed to this collector.\n"
+        "See dm_collector_c.receive_log_packet().\n"
+    },
+    {"receive_log_packets", dm_collector_c_receive_log_packets, METH_VARARGS,
+        "Extract all complete log packets from data fed to this collector.\n"
+        "See dm_collector_c.receive_log_packets().\n"
+    },
+    {"replay_file", dm_collector_c_replay_file, METH_VARARGS,
+        "Iterate over the log packets in a mi2log/qmdl file, using the filter\n"
+        "and export of this collector if type_names is None.\n"
+        "See dm_collector_c.replay_file().\n"
+    },
+    {NULL, NULL, 0, NULL}        /* Sentinel */
+};
+
+static PyObject *
+collector_new (PyTypeObject *type, PyObject *args, PyObject *kwds) {
+    Collector *self = (Collector *) type->tp_alloc(type, 0);
+    if (self == NULL)
+        return NULL;
+    self->state = new CollectorState;
+    hdlc_init_state(&self->state->hdlc);
+    manager_init_state(&self->state->emanager);
+    self->state->decoding = DEFAULT_DECODING_OPTIONS;
+    self->state->lock = NULL;
+#ifdef WITH_THREAD
+    self->state->lock = PyThread_allocate_lock();
+    if (self->state->lock == NULL) {
+        Py_DECREF(self);
+        PyErr_SetString(PyExc_MemoryError, "Unable to allocate lock.");
+        return NULL;
+    }
+#endif
+    return (PyObject *) self;
+}
+
+static void
+collector_dealloc (Collector *self) {
+    if (self->state != NULL) {
+        manager_release_state(&self->state->emanager);
+#ifdef WITH_THREAD
+        if (self->state->lock != NULL)
+            PyThread_free_lock(self->state->lock);
+#endif
+        delete self->state;
+        self->state = NULL;
+    }
+    self->ob_type->tp_free((PyObject *) self);
+}
+
+static PyTypeObject CollectorType = {
+    PyObject_HEAD_INIT(NULL)
+    0,                                      /* ob_size */
+    "dm_collector_c.Collector",             /* tp_name */
+    sizeof(Collector),                      /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    (destructor) collector_dealloc,         /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    "An independent log collector.\n"
+    "\n"
+    "Each Collector owns its reassembly buffer, decoding filter and export\n"
+    "file, so that several collectors (e.g. one per device or per replayed\n"
+    "log) can run side by side in one process.\n",  /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    CollectorMethods,                       /* tp_methods */
+    0,                                      /* tp_members */
+    0,                                      /* tp_getset */
+    0,                                      /* tp_base */
+    0,                                      /* tp_dict */
+    0,                                      /* tp_descr_get */
+    0,                                      /* tp_descr_set */
+    0,                                      /* tp_dictoffset */
+    0,                                      /* tp_init */
+    0,                                      /* tp_alloc */
+    collector_new,                          /* tp_new */
+};
+
+// Return the state a function should work on: the state of a Collector
+// object, or the global one for module-level functions.
+static CollectorState *
+get_collector_state (PyObject *self) {
+    if (self != NULL && PyObject_TypeCheck(self, &CollectorType))
+        return ((Collector *) self)->state;
+    return &g_collector;
+}
+
 // sort, unique and bucketing
 static void
 sort_type_ids(IdVector& type_ids, std::vector<IdVector>& out_vectors) {
@@ -429,15 +919,34 @@ static PyObject *
 dm_collector_c_set_filtered_export (PyObject *self, PyObject *args) {
     const char *path;
     PyObject *sequence = NULL;
+    Py_ssize_t buffer_size = DEFAULT_EXPORT_BUFFER_SIZE;
+    double flush_interval = 0.0;
+    PY_LONG_LONG max_bytes = 0;
+    double max_seconds = 0.0;
     IdVector type_ids;
     bool success = false;
+    CollectorState *pstate = NULL;
 
-    if (!PyArg_ParseTuple(args, "sO", &path, &sequence)) {
+    if (!PyArg_ParseTuple(args, "sO|ndLd", &path, &sequence,
+                                &buffer_size, &flush_interval,
+                                &max_bytes, &max_seconds)) {
         return NULL;
     }
     Py_INCREF(sequence);
 
     // Check arguments
+    if (buffer_size < 0) {
+        PyErr_SetString(PyExc_ValueError, "\'buffer_size\' is negative.");
+        goto raise_exception;
+    }
+    if (max_bytes < 0) {
+        PyErr_SetString(PyExc_ValueError, "\'max_bytes\' is negative.");
+        goto raise_exception;
+    }
+    if (!compression_supported(compression_from_path(path))) {
+        PyErr_Format(PyExc_ValueError, "Compression of \'%s\' is not supported.", path);
+        goto raise_exception;
+    }
     if (!PySequence_Check(sequence)) {
         PyErr_SetString(PyExc_TypeError, "\'type_names\' is not a sequence.");
         goto raise_exception;
@@ -450,7 +959,15 @@ dm_collector_c_set_filtered_export (PyObject *self, PyObject *args) {
     }
     Py_DECREF(sequence);
 
-    manager_change_config(&g_emanager, path, type_ids);
+    pstate = get_collector_state(self);
+    ACQUIRE_LOCK(pstate->lock);
+    // Closing the old file may wait for its flush thread
+    Py_BEGIN_ALLOW_THREADS
+    manager_set_buffering(&pstate->emanager, (size_t) buffer_size, flush_interval);
+    manager_set_rotation(&pstate->emanager, (unsigned long long) max_bytes, max_seconds);
+    manager_change_config(&pstate->emanager, path, type_ids);
+    Py_END_ALLOW_THREADS
+    RELEASE_LOCK(pstate->lock);
     Py_RETURN_TRUE;
 
     raise_exception:
@@ -458,12 +975,90 @@ dm_collector_c_set_filtered_export (PyObject *self, PyObject *args) {
         return NULL;
 }
 
+// Return: successful or not
+static PyObject *
+dm_collector_c_set_export_routes (PyObject *self, PyObject *args) {
+    PyObject *routes = NULL;
+    Py_ssize_t buffer_size = DEFAULT_EXPORT_BUFFER_SIZE;
+    double flush_interval = 0.0;
+    PY_LONG_LONG max_bytes = 0;
+    double max_seconds = 0.0;
+    std::vector<std::string> paths;
+    std::vector<IdVector> whitelists;
+    CollectorState *pstate = NULL;
+
+    if (!PyArg_ParseTuple(args, "O|ndLd", &routes,
+                                &buffer_size, &flush_interval,
+                                &max_bytes, &max_seconds)) {
+        return NULL;
+    }
+
+    // Check arguments
+    if (buffer_size < 0) {
+        PyErr_SetString(PyExc_ValueError, "\'buffer_size\' is negative.");
+        return NULL;
+    }
+    if (max_bytes < 0) {
+        PyErr_SetString(PyExc_ValueError, "\'max_bytes\' is negative.");
+        return NULL;
+    }
+    if (!PySequence_Check(routes)) {
+        PyErr_SetString(PyExc_TypeError, "\'routes\' is not a sequence.");
+        return NULL;
+    }
+    Py_ssize_t n = PySequence_Length(routes);
+    for (Py_ssize_t i = 0; i < n; i++) {
+        PyObject *route = PySequence_GetItem(routes, i);
+        const char *path = NULL;
+        PyObject *sequence = NULL;
+        if (route == NULL)
+            return NULL;
+        if (!PyArg_ParseTuple(route, "sO", &path, &sequence)) {
+            Py_DECREF(route);
+            PyErr_SetString(PyExc_TypeError,
+                            "A route is not a (path, type_names) tuple.");
+            return NULL;
+        }
+        if (!compression_supported(compression_from_path(path))) {
+            PyErr_Format(PyExc_ValueError, "Compression of \'%s\' is not supported.", path);
+            Py_DECREF(route);
+            return NULL;
+        }
+        if (!PySequence_Check(sequence)) {
+            PyErr_SetString(PyExc_TypeError, "\'type_names\' is not a sequence.");
+            Py_DECREF(route);
+            return NULL;
+        }
+        IdVector type_ids;
+        if (!map_typenames_to_ids(sequence, type_ids)) {
+            PyErr_SetString(PyExc_ValueError, "Wrong type name.");
+            Py_DECREF(route);
+            return NULL;
+        }
+        paths.push_back(path);
+        whitelists.push_back(type_ids);
+        Py_DECREF(route);
+    }
+
+    pstate = get_collector_state(self);
+    ACQUIRE_LOCK(pstate->lock);
+    // Closing the old files may wait for their flush threads
+    Py_BEGIN_ALLOW_THREADS
+    manager_set_routes(&pstate->emanager, paths, whitelists,
+                        (size_t) buffer_size, flush_interval,
+                        (unsigned long long) max_bytes, max_seconds);
+    Py_END_ALLOW_THREADS
+    RELEASE_LOCK(pstate->lock);
+    Py_RETURN_TRUE;
+}
+
 // Return: successful or not
 static PyObject *
 dm_collector_c_set_filtered (PyObject *self, PyObject *args) {
     PyObject *sequence = NULL;
     IdVector type_ids;
     bool success = false;
+    CollectorState *pstate = NULL;
 
     if (!PyArg_ParseTuple(args, "O", &sequence)) {
         return NULL;
@@ -483,7 +1078,10 @@ dm_collector_c_set_filtered (PyObject *self, PyObject *args) {
     }
     Py_DECREF(sequence);
 
-    manager_change_config(&g_emanager, NULL, type_ids);
+    pstate = get_collector_state(self);
+    ACQUIRE_LOCK(pstate->lock);
+    manager_change_config(&pstate->emanager, NULL, type_ids);
+    RELEASE_LOCK(pstate->lock);
     Py_RETURN_TRUE;
 
     raise_exception:
@@ -565,34 +1163,173 @@ dm_collector_c_generate_diag_cfg (PyObject *self, PyObject *args) {
 // Return: None
 static PyObject *
 dm_collector_c_feed_binary (PyObject *self, PyObject *args) {
-    const char *b;
-    int length;
-    if (!PyArg_ParseTuple(args, "s#", &b, &length)){
+    Py_buffer view;
+    // "s*" accepts str and any object supporting the buffer protocol
+    // (bytearray, memoryview, mmap, ...), without creating a str copy.
+    if (!PyArg_ParseTuple(args, "s*", &view)){
         // printf("dm_collector_c_feed_binary returns NULL\n");
         return NULL;
     }
-    feed_binary(b, length);
+    CollectorState *pstate = get_collector_state(self);
+    ACQUIRE_LOCK(pstate->lock);
+    if (view.len >= FEED_GIL_MINSIZE) {
+        Py_BEGIN_ALLOW_THREADS
+        feed_binary(&pstate->hdlc, (const char *) view.buf, (int) view.len);
+        Py_END_ALLOW_THREADS
+    } else {
+        feed_binary(&pstate->hdlc, (const char *) view.buf, (int) view.len);
+    }
+    RELEASE_LOCK(pstate->lock);
+    PyBuffer_Release(&view);
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+dm_collector_c_set_strict_crc (PyObject *self, PyObject *args) {
+    PyObject *arg_enabled = NULL;
+    if (!PyArg_ParseTuple(args, "O:set_strict_crc", &arg_enabled))
+        return NULL;
+    int enabled = PyObject_IsTrue(arg_enabled);
+    if (enabled < 0)
+        return NULL;
+    CollectorState *pstate = get_collector_state(self);
+    ACQUIRE_LOCK(pstate->lock);
+    pstate->emanager.strict_crc = (enabled != 0);
+    RELEASE_LOCK(pstate->lock);
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+dm_collector_c_get_stats (PyObject *self, PyObject *args) {
+    return decode_stats_to_dict(&g_stats);
+}
+
+static PyObject *
+dm_collector_c_reset_stats (PyObject *self, PyObject *args) {
+    decode_stats_reset(&g_stats);
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+dm_collector_c_set_stats_enabled (PyObject *self, PyObject *args) {
+    PyObject *arg_enabled = NULL;
+    if (!PyArg_ParseTuple(args, "O:set_stats_enabled", &arg_enabled))
+        return NULL;
+    int enabled = PyObject_IsTrue(arg_enabled);
+    if (enabled < 0)
+        return NULL;
+    g_stats.enabled = (enabled != 0);
+    Py_RETURN_NONE;
+}
+
+// Names of TimestampFormat, ByteStreamFormat and RecordFormat, in the order
+// of values
+static const char *TimestampFormatNames[] = {"datetime", "epoch", "ticks"};
+static const char *ByteStreamFormatNames[] = {"hex", "bytes"};
+static const char *RecordFormatNames[] = {"dict", "record"};
+
+// Parse the name of a format. If arg_format is NULL, the first format is
+// chosen.
+// Return: successful or not. A ValueError is set on failure.
+static bool
+parse_format_arg (const char *arg_format, const char *names[], int n_names,
+                    const char *kind, int &format) {
+    if (arg_format == NULL) {
+        format = 0;
+        return true;
+    }
+    for (int i = 0; i < n_names; i++) {
+        if (strcmp(arg_format, names[i]) == 0) {
+            format = i;
+            return true;
+        }
+    }
+    PyErr_Format(PyExc_ValueError, "Unsupported %s format \'%s\'.", kind, arg_format);
+    return false;
+}
+
+// Return: New reference to (timestamp_format, byte_stream_format,
+// record_format), which can be passed to decode_frame().
+static PyObject *
+decoding_options_to_tuple (const DecodingOptions &options) {
+    return Py_BuildValue("(sss)", TimestampFormatNames[options.timestamp_format],
+                            ByteStreamFormatNames[options.byte_stream_format],
+                            RecordFormatNames[options.record_format]);
+}
+
+static PyObject *
+dm_collector_c_set_timestamp_format (PyObject *self, PyObject *args) {
+    const char *arg_format = NULL;
+    int timestamp_format;
+    if (!PyArg_ParseTuple(args, "s:set_timestamp_format", &arg_format))
+        return NULL;
+    if (!parse_format_arg(arg_format, TimestampFormatNames,
+                            ARRAY_SIZE(TimestampFormatNames, const char *),
+                            "timestamp", timestamp_format))
+        return NULL;
+    get_collector_state(self)->decoding.timestamp_format = timestamp_format;
     Py_RETURN_NONE;
 }
 
 static PyObject *
-dm_collector_c_reset (PyObject *self, PyObject *args) {
-    reset_binary();
+dm_collector_c_set_byte_stream_format (PyObject *self, PyObject *args) {
+    const char *arg_format = NULL;
+    int byte_stream_format;
+    if (!PyArg_ParseTuple(args, "s:set_byte_stream_format", &arg_format))
+        return NULL;
+    if (!parse_format_arg(arg_format, ByteStreamFormatNames,
+                            ARRAY_SIZE(ByteStreamFormatNames, const char *),
+                            "byte stream", byte_stream_format))
+        return NULL;
+    get_collector_state(self)->decoding.byte_stream_format = byte_stream_format;
     Py_RETURN_NONE;
 }
 
+static PyObject *
+dm_collector_c_set_record_format (PyObject *self, PyObject *args) {
+    const char *arg_format = NULL;
+    int record_format;
+    if (!PyArg_ParseTuple(args, "s:set_record_format", &arg_format))
+        return NULL;
+    if (!parse_format_arg(arg_format, RecordFormatNames,
+                            ARRAY_SIZE(RecordFormatNames, const char *),
+                            "record", record_format))
+        return NULL;
+    get_collector_state(self)->decoding.record_format = record_format;
+    Py_RETURN_NONE;
+}
 
-// Return: decoded_list or None
+// Return: a list of paths
 static PyObject *
-dm_collector_c_receive_log_packet (PyObject *self, PyObject *args) {
-    std::string frame;
-    bool crc_correct = false;
-    bool skip_decoding = false, include_timestamp = false;  // default values
-    PyObject *arg_skip_decoding = NULL;
-    PyObject *arg_include_timestamp = NULL;
-    if (!PyArg_ParseTuple(args, "|OO:receive_log_packet",
-                                &arg_skip_decoding, &arg_include_timestamp))
+dm_collector_c_get_finished_logs (PyObject *self, PyObject *args) {
+    std::vector<std::string> finished;
+    CollectorState *pstate = get_collector_state(self);
+    ACQUIRE_LOCK(pstate->lock);
+    manager_take_finished(&pstate->emanager, finished);
+    RELEASE_LOCK(pstate->lock);
+
+    PyObject *ret = PyList_New(finished.size());
+    if (ret == NULL)
         return NULL;
+    for (size_t i = 0; i < finished.size(); i++)
+        PyList_SET_ITEM(ret, i, PyString_FromString(finished[i].c_str()));
+    return ret;
+}
+
+static PyObject *
+dm_collector_c_reset (PyObject *self, PyObject *args) {
+    CollectorState *pstate = get_collector_state(self);
+    ACQUIRE_LOCK(pstate->lock);
+    reset_binary(&pstate->hdlc);
+    RELEASE_LOCK(pstate->lock);
+    Py_RETURN_NONE;
+}
+
+
+// Parse the optional skip_decoding and include_timestamp arguments.
+static void
+parse_decoding_args (PyObject *arg_skip_decoding, PyObject *arg_include_timestamp,
+                        bool &skip_decoding, bool &include_timestamp) {
     if (arg_skip_decoding != NULL) {
         Py_INCREF(arg_skip_decoding);
         skip_decoding = (PyObject_IsTrue(arg_skip_decoding) == 1);
@@ -603,30 +1340,178 @@ dm_collector_c_receive_log_packet (PyObject *self, PyObject *args) {
         include_timestamp = (PyObject_IsTrue(arg_include_timestamp) == 1);
         Py_DECREF(arg_include_timestamp);
     }
-    // printf("skip_decoding=%d, include_timestamp=%d\n", skip_decoding, include_timestamp);
-    double posix_timestamp = (include_timestamp? get_posix_timestamp(): -1.0);
+}
 
-    bool success = get_next_frame(frame, crc_correct);
-    // printf("success=%d crc_correct=%d is_log_packet=%d\n", success, crc_correct, is_log_packet(frame.c_str(), frame.size()));
-    // if (success && crc_correct && is_log_packet(frame.c_str(), frame.size())) {
-    if (success && crc_correct) {
-        // manager_export_binary(&g_emanager, frame.c_str(), frame.size());
-        if (!manager_export_binary(&g_emanager, frame.c_str(), frame.size())) {
-            Py_RETURN_NONE;
+// Formats of decoded packets
+enum DecodingOutput {
+    OUTPUT_LIST = 0,    // result list, to be parsed by DMLogPacket
+    OUTPUT_DICT,        // (dict, raw_msgs, fields), see result_list_to_dict()
+    OUTPUT_LAZY         // (header dict, frame), see decode_frame()
+};
+
+// Parse the optional output argument ("list", "dict" or "lazy").
+// Return: successful or not. A ValueError is set on failure.
+static bool
+parse_output_arg (const char *arg_output, int &output) {
+    if (arg_output == NULL || strcmp(arg_output, "list") == 0) {
+        output = OUTPUT_LIST;
+    } else if (strcmp(arg_output, "dict") == 0) {
+        output = OUTPUT_DICT;
+    } else if (strcmp(arg_output, "lazy") == 0) {
+        output = OUTPUT_LAZY;
+    } else {
+        PyErr_Format(PyExc_ValueError, "Unsupported output \'%s\'.", arg_output);
+        return false;
+    }
+    return true;
+}
+
+// Where frames are taken from: the reassembly buffer of a collector, or a
+// mapped file.
+struct FrameSource {
+    HdlcBufferState *hdlc;      // NULL if frames are read from file
+    const MappedFile *file;
+    size_t *pos;
+    // If not NULL, only the frames at these offsets of the file are read, and
+    // pos is the position in offsets.
+    const std::vector<size_t> *offsets;
+    // If the file is compressed, it is read through reader: by offsets if
+    // any, otherwise it is decompressed into hdlc chunk by chunk.
+    CompressedReader *reader;
+};
+
+// Take frames out of src, then filter and export them using pstate. Frames
+// with a correct CRC that pass the filter are appended to accepted.
+// Unless pstate->strict_crc is set, the type of a frame is checked against the
+// filter before it is unescaped, and unwanted frames are dropped without
+// further work.
+// Stops after max_accepted frames are accepted, or after max_frames frames are
+// taken out (no limit if max_frames <= 0).
+// If pstats is not NULL, the frames taken out are counted in it.
+// This function does not touch Python objects, so that it can be called
+// without holding the GIL.
+// Return: false if src has no more complete frame
+static bool
+take_frames (const FrameSource &src, struct ExportManagerState *pstate,
+                int max_frames, int max_accepted,
+                std::vector<std::string> &accepted,
+                struct DecodeStats *pstats = NULL) {
+    std::string frame, chunk;
+    bool crc_correct = false;
+    int n_frames = 0;
+    int n_accepted = 0;
+    while (max_frames <= 0 || n_frames < max_frames) {
+        const char *escaped = NULL;
+        size_t escaped_length = 0;
+        bool has_frame;
+        if (src.hdlc != NULL) {
+            has_frame = get_next_escaped_frame(src.hdlc, escaped, escaped_length);
+            while (!has_frame && src.reader != NULL
+                    && compressed_reader_read(src.reader, chunk)) {
+                feed_binary(src.hdlc, chunk.data(), (int) chunk.size());
+                has_frame = get_next_escaped_frame(src.hdlc, escaped, escaped_length);
+            }
+        } else if (src.offsets != NULL) {
+            has_frame = false;
+            if (*src.pos < src.offsets->size()) {
+                size_t offset = (*src.offsets)[(*src.pos)++];
+                if (src.reader != NULL)
+                    has_frame = compressed_reader_frame_at(src.reader, offset,
+                                                            escaped, escaped_length);
+                else
+                    has_frame = get_next_escaped_frame_from(src.file->data, src.file->size,
+                                                            offset, escaped, escaped_length);
+            }
+        } else {
+            has_frame = get_next_escaped_frame_from(src.file->data, src.file->size,
+                                                    *src.pos, escaped, escaped_length);
+        }
+        if (!has_frame)
+            return false;
+        n_frames++;
+        if (!pstate->strict_crc) {
+            char header[FRAME_TYPE_HEADER_SIZE];
+            size_t header_length = unescape_prefix(escaped, escaped_length,
+                                                    header, sizeof(header));
+            if (!manager_accepts_header(pstate, header, header_length)) {
+                if (pstats != NULL)
+                    decode_stats_add_frame(pstats, get_log_type(header, header_length),
+                                            escaped_length, false, false, false);
+                continue;
+            }
+        }
+        unpack_frame(escaped, escaped_length, frame, crc_correct);
+        // printf("crc_correct=%d is_log_packet=%d\n", crc_correct, is_log_packet(frame.c_str(), frame.size()));
+        bool is_accepted = crc_correct
+                            && manager_export_binary(pstate, frame.c_str(), frame.size(),
+                                                        escaped, escaped_length);
+        if (pstats != NULL)
+            decode_stats_add_frame(pstats, get_log_type(frame.c_str(), frame.size()),
+                                    escaped_length, true, crc_correct, is_accepted);
+        if (is_accepted) {
+            accepted.push_back(frame);
+            n_accepted++;
+            if (n_accepted >= max_accepted)
+                break;
         }
-        else if(is_log_packet(frame.c_str(), frame.size())){
+    }
+    return true;
+}
+
+// Convert a decoded result list to the requested output, and attach the
+// time when it is received. frame and options are only used by OUTPUT_LAZY.
+// Return: New reference, or NULL on error. decoded is released.
+static PyObject *
+finish_decoded (PyObject *decoded, int output,
+                const std::string &frame, const DecodingOptions &options,
+                bool include_timestamp, double posix_timestamp) {
+    if (output == OUTPUT_DICT || output == OUTPUT_LAZY) {
+        PyObject *converted = result_list_to_dict(decoded, options);
+        Py_DECREF(decoded);
+        decoded = converted;
+        if (decoded == NULL)
+            return NULL;
+    }
+    if (output == OUTPUT_LAZY) {
+        // The header has no raw messages
+        PyObject *lazy = Py_BuildValue("(Os#N)", PyTuple_GET_ITEM(decoded, 0),
+                                        frame.c_str(), (int) frame.size(),
+                                        decoding_options_to_tuple(options));
+        Py_DECREF(decoded);
+        decoded = lazy;
+        if (decoded == NULL)
+            return NULL;
+    }
+    if (include_timestamp) {
+        PyObject *ret = Py_BuildValue("(Od)", decoded, posix_timestamp);
+        Py_DECREF(decoded);
+        return ret;
+    } else {
+        return decoded;
+    }
+}
+
+// Decode a frame, see decode_accepted_frame().
+static PyObject *
+decode_unpacked_frame (const std::string &frame, bool skip_decoding,
+                        bool include_timestamp, double posix_timestamp,
+                        int output, const DecodingOptions &options) {
+    if (output == OUTPUT_LAZY) {
+        if (skip_decoding)  // nothing to be decoded later
+            output = OUTPUT_DICT;
+        else
+            skip_decoding = true;
+    }
+    {
+        if(is_log_packet(frame.c_str(), frame.size())){
             const char *s = frame.c_str();
             // printf("%x %x %x %x\n",s[0],s[1],s[2],s[3]);
             PyObject *decoded = decode_log_packet(  s + 2,  // skip first two bytes
                                                     frame.size() - 2,
-                                                    skip_decoding);
-            if (include_timestamp) {
-                PyObject *ret = Py_BuildValue("(Od)", decoded, posix_timestamp);
-                Py_DECREF(decoded);
-                return ret;
-            } else {
-                return decoded;
-            }
+                                                    skip_decoding,
+                                                    options);
+            return finish_decoded(decoded, output, frame, options,
+                                    include_timestamp, posix_timestamp);
 
         }
         else if(is_debug_packet(frame.c_str(), frame.size())){
@@ -646,7 +1531,8 @@ dm_collector_c_receive_log_packet (PyObject *self, PyObject *args) {
             char *s = new char[n_size];
             memmove(s,tmp,sizeof(char)*14);
             memmove(s+sizeof(char)*14,frame.c_str(),frame.size());
-            PyObject *decoded = decode_log_packet_modem(s, n_size, skip_decoding);
+            PyObject *decoded = decode_log_packet_modem(s, n_size, skip_decoding,
+                                                        options);
 
             // char *s = new char[n_size];
             // memset(s,0,sizeof(char)*n_size);
@@ -666,23 +1552,693 @@ dm_collector_c_receive_log_packet (PyObject *self, PyObject *args) {
             //                                         frame.size() - 2,
             //                                         skip_decoding);
 
-            if (include_timestamp) {
-                PyObject *ret = Py_BuildValue("(Od)", decoded, posix_timestamp);
-                Py_DECREF(decoded);
-                // delete [] s; //Yuanjie: bug for it on Android, but no problem on laptop
-                return ret;
-            } else {
-                // delete [] s; //Yuanjie: bug for it on Android, but no problem on laptop
-                return decoded;
-            }
+            // delete [] s; //Yuanjie: bug for it on Android, but no problem on laptop
+            return finish_decoded(decoded, output, frame, options,
+                                    include_timestamp, posix_timestamp);
         }
         else {
             Py_RETURN_NONE;
         }
+    }
+}
 
-    } else {
+// Decode a frame accepted by take_frames(). With OUTPUT_LAZY, only the
+// header is decoded, and the frame is returned to be decoded later.
+// The decoding is timed in g_stats if enabled.
+// Return: New reference to the decoded result, or to None if the frame is
+// neither a log packet nor a debug message.
+static PyObject *
+decode_accepted_frame (const std::string &frame, bool skip_decoding,
+                        bool include_timestamp, double posix_timestamp,
+                        int output, const DecodingOptions &options) {
+    if (!g_stats.enabled)
+        return decode_unpacked_frame(frame, skip_decoding, include_timestamp,
+                                        posix_timestamp, output, options);
+    unsigned long long start = decode_stats_now_ns();
+    PyObject *decoded = decode_unpacked_frame(frame, skip_decoding, include_timestamp,
+                                                posix_timestamp, output, options);
+    if (decoded != NULL && decoded != Py_None)
+        decode_stats_add_decode(&g_stats, get_log_type(frame.c_str(), frame.size()),
+                                decode_stats_now_ns() - start);
+    return decoded;
+}
+
+// Take frames out of a collector's buffer without holding the GIL.
+// Return: false if the buffer has no more complete frame
+static bool
+take_frames_from_collector (struct CollectorState *pstate,
+                            int max_frames, int max_accepted,
+                            std::vector<std::string> &accepted) {
+    FrameSource src = {&pstate->hdlc, NULL, NULL, NULL, NULL};
+    DecodeStats stats;
+    decode_stats_init(&stats);
+    DecodeStats *pstats = (g_stats.enabled? &stats: NULL);
+    bool more;
+    ACQUIRE_LOCK(pstate->lock);
+    Py_BEGIN_ALLOW_THREADS
+    more = take_frames(src, &pstate->emanager, max_frames, max_accepted, accepted,
+                        pstats);
+    Py_END_ALLOW_THREADS
+    RELEASE_LOCK(pstate->lock);
+    if (pstats != NULL)
+        decode_stats_merge(&g_stats, stats);
+    return more;
+}
+
+// Return: decoded_list or None
+static PyObject *
+dm_collector_c_receive_log_packet (PyObject *self, PyObject *args) {
+    bool skip_decoding = false, include_timestamp = false;  // default values
+    std::vector<std::string> accepted;
+    int output = OUTPUT_LIST;
+    PyObject *arg_skip_decoding = NULL;
+    PyObject *arg_include_timestamp = NULL;
+    const char *arg_output = NULL;
+    if (!PyArg_ParseTuple(args, "|OOs:receive_log_packet",
+                                &arg_skip_decoding, &arg_include_timestamp,
+                                &arg_output))
+        return NULL;
+    parse_decoding_args(arg_skip_decoding, arg_include_timestamp,
+                        skip_decoding, include_timestamp);
+    if (!parse_output_arg(arg_output, output))
+        return NULL;
+    // printf("skip_decoding=%d, include_timestamp=%d\n", skip_decoding, include_timestamp);
+    double posix_timestamp = (include_timestamp? get_posix_timestamp(): -1.0);
+
+    // Take one frame, which is decoded only if accepted
+    (void) take_frames_from_collector(get_collector_state(self), 1, 1, accepted);
+    if (accepted.empty()) {
         Py_RETURN_NONE;
     }
+    return decode_accepted_frame(accepted[0], skip_decoding, include_timestamp,
+                                    posix_timestamp, output,
+                                    get_collector_state(self)->decoding);
+}
+
+// Return: a list of decoded results (possibly empty)
+static PyObject *
+dm_collector_c_receive_log_packets (PyObject *self, PyObject *args) {
+    int max_n = 0;
+    bool skip_decoding = false, include_timestamp = false;  // default values
+    bool more = true;
+    int output = OUTPUT_LIST;
+    std::vector<std::string> accepted;
+    PyObject *arg_skip_decoding = NULL;
+    PyObject *arg_include_timestamp = NULL;
+    const char *arg_output = NULL;
+    if (!PyArg_ParseTuple(args, "|iOOs:receive_log_packets",
+                                &max_n, &arg_skip_decoding, &arg_include_timestamp,
+                                &arg_output))
+        return NULL;
+    parse_decoding_args(arg_skip_decoding, arg_include_timestamp,
+                        skip_decoding, include_timestamp);
+    if (!parse_output_arg(arg_output, output))
+        return NULL;
+    double posix_timestamp = (include_timestamp? get_posix_timestamp(): -1.0);
+
+    CollectorState *pstate = get_collector_state(self);
+    PyObject *ret = PyList_New(0);
+    while (more && (max_n <= 0 || PyList_GET_SIZE(ret) < max_n)) {
+        int batch = FRAME_BATCH_SIZE;
+        if (max_n > 0)
+            batch = std::min(batch, max_n - (int) PyList_GET_SIZE(ret));
+        accepted.clear();
+        more = take_frames_from_collector(pstate, 0, batch, accepted);
+        for (size_t i = 0; i < accepted.size(); i++) {
+            PyObject *decoded = decode_accepted_frame(accepted[i], skip_decoding,
+                                                        include_timestamp,
+                                                        posix_timestamp, output,
+                                                        pstate->decoding);
+            if (decoded == NULL) {
+                Py_DECREF(ret);
+                return NULL;
+            }
+            if (decoded != Py_None) {
+                PyList_Append(ret, decoded);
+            }
+            Py_DECREF(decoded);
+        }
+    }
+    return ret;
+}
+
+// Return: decoded_list or None
+static PyObject *
+dm_collector_c_decode_frame (PyObject *self, PyObject *args) {
+    const char *frame;
+    int length;
+    int output = OUTPUT_LIST;
+    DecodingOptions options;
+    const char *arg_output = NULL;
+    const char *arg_timestamp_format = NULL;
+    const char *arg_byte_stream_format = NULL;
+    const char *arg_record_format = NULL;
+    if (!PyArg_ParseTuple(args, "s#|ssss:decode_frame", &frame, &length, &arg_output,
+                                &arg_timestamp_format, &arg_byte_stream_format,
+                                &arg_record_format))
+        return NULL;
+    if (!parse_output_arg(arg_output, output)
+            || !parse_format_arg(arg_timestamp_format, TimestampFormatNames,
+                                    ARRAY_SIZE(TimestampFormatNames, const char *),
+                                    "timestamp", options.timestamp_format)
+            || !parse_format_arg(arg_byte_stream_format, ByteStreamFormatNames,
+                                    ARRAY_SIZE(ByteStreamFormatNames, const char *),
+                                    "byte stream", options.byte_stream_format)
+            || !parse_format_arg(arg_record_format, RecordFormatNames,
+                                    ARRAY_SIZE(RecordFormatNames, const char *),
+                                    "record", options.record_format))
+        return NULL;
+    if (output == OUTPUT_LAZY) {
+        PyErr_SetString(PyExc_ValueError, "A frame cannot be decoded lazily.");
+        return NULL;
+    }
+    return decode_accepted_frame(std::string(frame, length), false, false, -1.0,
+                                    output, options);
+}
+
+// Split a QCDM timestamp into seconds and microseconds since 1980-01-06, in
+// the same way as the "timestamp" field of decoded packets.
+static void
+split_qcdm_timestamp (unsigned long long timestamp, int &seconds, int &useconds) {
+    const double PER_SECOND = 52428800.0;
+    const double PER_USECOND = 52428800.0 / 1.0e6;
+    seconds = int(double(timestamp) / PER_SECOND);
+    useconds = (double(timestamp) / PER_USECOND) - double(seconds) * 1.0e6;
+}
+
+// Convert a QCDM timestamp to a datetime object.
+// Return: New reference
+static PyObject *
+qcdm_timestamp_to_datetime (unsigned long long timestamp) {
+    int seconds, useconds;
+    split_qcdm_timestamp(timestamp, seconds, useconds);
+    PyObject *epoch = PyDateTime_FromDateAndTime(1980, 1, 6, 0, 0, 0, 0);
+    PyObject *delta = PyDelta_FromDSU(0, seconds, useconds);
+    PyObject *ret = PyNumber_Add(epoch, delta);
+    Py_DECREF(epoch);
+    Py_DECREF(delta);
+    return ret;
+}
+
+// Convert a datetime object (or None) to microseconds since 1980-01-06.
+// If obj is None, usec is set to default_usec.
+// Return: successful or not. A TypeError is set on failure.
+static bool
+datetime_to_qcdm_usec (PyObject *obj, const char *arg_name,
+                        long long default_usec, long long &usec) {
+    if (obj == NULL || obj == Py_None) {
+        usec = default_usec;
+        return true;
+    }
+    if (PyDateTimeAPI == NULL)  // import datetime module
+        PyDateTime_IMPORT;
+    if (!PyDateTime_Check(obj)) {
+        PyErr_Format(PyExc_TypeError, "\'%s\' is not a datetime.", arg_name);
+        return false;
+    }
+    PyObject *epoch = PyDateTime_FromDateAndTime(1980, 1, 6, 0, 0, 0, 0);
+    PyObject *delta = PyNumber_Subtract(obj, epoch);
+    Py_DECREF(epoch);
+    if (delta == NULL)  // e.g. an aware datetime
+        return false;
+    PyDateTime_Delta *d = (PyDateTime_Delta *) delta;
+    usec = ((long long) d->days * 86400LL + d->seconds) * 1000000LL
+            + d->microseconds;
+    Py_DECREF(delta);
+    return true;
+}
+
+// Select the frames in a log index whose types are in whitelist and whose
+// device timestamps are within [start_usec, end_usec). Frames without a
+// device timestamp (e.g. debug messages) take the timestamp of the preceding
+// frame.
+static void
+select_indexed_frames (const LogIndex &index, const TypeBitmap &whitelist,
+                        long long start_usec, long long end_usec,
+                        std::vector<size_t> &offsets) {
+    long long usec = LLONG_MIN;
+    for (size_t i = 0; i < index.size(); i++) {
+        const LogIndexEntry &entry = index[i];
+        if (entry.timestamp != 0) {
+            int seconds, useconds;
+            split_qcdm_timestamp(entry.timestamp, seconds, useconds);
+            usec = (long long) seconds * 1000000LL + useconds;
+        }
+        if (usec >= start_usec && usec < end_usec
+                && entry.type_id >= 0 && whitelist.test(entry.type_id))
+            offsets.push_back((size_t) entry.offset);
+    }
+}
+
+// Iterator returned by replay_file().
+typedef struct {
+    PyObject_HEAD
+    MappedFile file;
+    size_t pos;
+    // Offsets of the frames selected with the index of the file, or NULL if
+    // the whole file is read. If not NULL, pos is the position in offsets.
+    std::vector<size_t> *offsets;
+    // Reader of a compressed file, or NULL. If the whole file is read, it is
+    // decompressed into hdlc.
+    CompressedReader *reader;
+    HdlcBufferState *hdlc;
+    // Accepted frames that have not been decoded yet
+    std::deque<std::string> *pending;
+    // Points to the state of the collector (kept alive by owner), or to a
+    // private state if types are specified.
+    ExportManagerState *emanager;
+    PyThread_type_lock emanager_lock;   // NULL if emanager is private
+    bool owns_emanager;
+    PyObject *owner;    // the Collector object, or NULL
+    bool skip_decoding;
+    bool include_timestamp;
+    int output;
+    DecodingOptions decoding;
+    PyThread_type_lock lock;    // protects file, pos, offsets, reader, hdlc and pending
+} ReplayIterator;
+
+static void
+replay_iterator_close_file (ReplayIterator *self) {
+    if (self->reader != NULL) {
+        compressed_reader_close(self->reader);
+        delete self->reader;
+        self->reader = NULL;
+    }
+    delete self->hdlc;
+    self->hdlc = NULL;
+    mapped_file_close(&self->file);
+    self->pos = 0;
+}
+
+static void
+replay_iterator_dealloc (ReplayIterator *self) {
+    replay_iterator_close_file(self);
+    delete self->offsets;
+    delete self->pending;
+    if (self->owns_emanager) {
+        manager_release_state(self->emanager);
+        delete self->emanager;
+    }
+    Py_XDECREF(self->owner);
+#ifdef WITH_THREAD
+    if (self->lock != NULL)
+        PyThread_free_lock(self->lock);
+#endif
+    self->ob_type->tp_free((PyObject *) self);
+}
+
+static PyObject *
+replay_iterator_iternext (ReplayIterator *self) {
+    std::vector<std::string> accepted;
+    std::string frame;
+    while (true) {
+        ACQUIRE_LOCK(self->lock);
+        if (self->pending->empty() && self->file.data != NULL) {
+            // Frame the next batch without holding the GIL
+            FrameSource src = {self->hdlc, &self->file, &self->pos, self->offsets,
+                                self->reader};
+            DecodeStats stats;
+            decode_stats_init(&stats);
+            DecodeStats *pstats = (g_stats.enabled? &stats: NULL);
+            bool more;
+            if (self->emanager_lock != NULL)
+                ACQUIRE_LOCK(self->emanager_lock);
+            Py_BEGIN_ALLOW_THREADS
+            more = take_frames(src, self->emanager, 0, FRAME_BATCH_SIZE, accepted,
+                                pstats);
+            Py_END_ALLOW_THREADS
+            if (self->emanager_lock != NULL)
+                RELEASE_LOCK(self->emanager_lock);
+            if (pstats != NULL)
+                decode_stats_merge(&g_stats, stats);
+            self->pending->insert(self->pending->end(), accepted.begin(), accepted.end());
+            accepted.clear();
+            if (!more) {
+                // Release the mapping as soon as the file is exhausted.
+                replay_iterator_close_file(self);
+            }
+        }
+        if (self->pending->empty()) {
+            RELEASE_LOCK(self->lock);
+            return NULL;    // StopIteration
+        }
+        frame.swap(self->pending->front());
+        self->pending->pop_front();
+        RELEASE_LOCK(self->lock);
+
+        double posix_timestamp = (self->include_timestamp? get_posix_timestamp(): -1.0);
+        PyObject *decoded = decode_accepted_frame(frame, self->skip_decoding,
+                                                    self->include_timestamp,
+                                                    posix_timestamp, self->output,
+                                                    self->decoding);
+        if (decoded != Py_None)
+            return decoded;
+        Py_DECREF(decoded);
+    }
+}
+
+static PyTypeObject ReplayIteratorType = {
+    PyObject_HEAD_INIT(NULL)
+    0,                                      /* ob_size */
+    "dm_collector_c.ReplayIterator",        /* tp_name */
+    sizeof(ReplayIterator),                 /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    (destructor) replay_iterator_dealloc,   /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    "Iterator over the log packets in a mi2log/qmdl file.",  /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    PyObject_SelfIter,                      /* tp_iter */
+    (iternextfunc) replay_iterator_iternext,    /* tp_iternext */
+};
+
+// dm_collector_c.ColumnTable
+typedef struct {
+    PyObject_HEAD
+    struct ColumnTable *table;
+} PyColumnTable;
+
+static PyObject *
+column_table_new (PyTypeObject *type, PyObject *args, PyObject *kwds) {
+    const char *record_path = "";
+    if (!PyArg_ParseTuple(args, "|z:ColumnTable", &record_path))
+        return NULL;
+    PyColumnTable *self = (PyColumnTable *) type->tp_alloc(type, 0);
+    if (self == NULL)
+        return NULL;
+    self->table = new ColumnTable;
+    column_table_init(self->table, record_path == NULL? "": record_path);
+    return (PyObject *) self;
+}
+
+static void
+column_table_dealloc (PyColumnTable *self) {
+    if (self->table != NULL) {
+        column_table_release(self->table);
+        delete self->table;
+    }
+    self->ob_type->tp_free((PyObject *) self);
+}
+
+static Py_ssize_t
+column_table_length (PyColumnTable *self) {
+    return (Py_ssize_t) self->table->n_rows;
+}
+
+// Return: number of rows added
+static PyObject *
+column_table_append_packet (PyColumnTable *self, PyObject *args) {
+    PyObject *decoded;
+    if (!PyArg_ParseTuple(args, "O:append", &decoded))
+        return NULL;
+    // (decoded, posix_timestamp) if include_timestamp is True
+    if (PyTuple_Check(decoded) && PyTuple_GET_SIZE(decoded) == 2)
+        decoded = PyTuple_GET_ITEM(decoded, 0);
+    if (!PyList_Check(decoded)) {
+        PyErr_SetString(PyExc_TypeError, "\'decoded\' is not a result list.");
+        return NULL;
+    }
+    return Py_BuildValue("n", (Py_ssize_t) column_table_append(self->table, decoded));
+}
+
+// Return: (descr, data)
+static PyObject *
+column_table_pack_rows (PyColumnTable *self, PyObject *args) {
+    return column_table_pack(self->table);
+}
+
+static PyMethodDef ColumnTableMethods[] = {
+    {"append", (PyCFunction) column_table_append_packet, METH_VARARGS,
+        "Add the rows of a decoded log packet.\n"
+        "\n"
+        "Args:\n"
+        "    decoded: a packet returned by receive_log_packet() or\n"
+        "        replay_file() with output=\"list\" (the default).\n"
+        "\n"
+        "Returns:\n"
+        "    The number of rows added.\n"
+        "\n"
+        "Raises\n"
+        "    TypeError: when decoded is not a result list.\n"
+    },
+    {"pack", (PyCFunction) column_table_pack_rows, METH_NOARGS,
+        "Pack all rows as the records of a NumPy structured array.\n"
+        "\n"
+        "Returns:\n"
+        "    (descr, data). descr is a list of (name, format) that can be\n"
+        "    passed to numpy.dtype(), and data is a string of packed\n"
+        "    little-endian records, e.g. for numpy.frombuffer().\n"
+        "    Integers are int64 (or uint64 if they do not fit), floats are\n"
+        "    float64, datetimes are datetime64[us], and strings are\n"
+        "    fixed-width. Missing values are 0, NaN, NaT or empty strings.\n"
+    },
+    {NULL, NULL, 0, NULL}        /* Sentinel */
+};
+
+static PySequenceMethods ColumnTableAsSequence = {
+    (lenfunc) column_table_length,          /* sq_length */
+};
+
+static PyTypeObject ColumnTableType = {
+    PyObject_HEAD_INIT(NULL)
+    0,                                      /* ob_size */
+    "dm_collector_c.ColumnTable",           /* tp_name */
+    sizeof(PyColumnTable),                  /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    (destructor) column_table_dealloc,      /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    &ColumnTableAsSequence,                 /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    "ColumnTable(record_path=None)\n"
+    "\n"
+    "Collects decoded log packets of one type as columns, to be analyzed\n"
+    "as a NumPy structured array.\n"
+    "\n"
+    "Each packet is a row, unless record_path names a list field (e.g.\n"
+    "\"Records\" or \"Subpackets.RLCUL PDUs\"), in which case each element\n"
+    "of the list is a row. Columns are named after the path of their\n"
+    "fields, e.g. \"Subpackets.Sample.Grant received\"; the fields of the\n"
+    "enclosing packet and list elements are repeated in every row. Other\n"
+    "list fields are ignored.\n",        /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    ColumnTableMethods,                     /* tp_methods */
+    0,                                      /* tp_members */
+    0,                                      /* tp_getset */
+    0,                                      /* tp_base */
+    0,                                      /* tp_dict */
+    0,                                      /* tp_descr_get */
+    0,                                      /* tp_descr_set */
+    0,                                      /* tp_dictoffset */
+    0,                                      /* tp_init */
+    0,                                      /* tp_alloc */
+    column_table_new,                       /* tp_new */
+};
+
+// Return: an iterator of decoded results
+static PyObject *
+dm_collector_c_replay_file (PyObject *self, PyObject *args) {
+    const char *path;
+    PyObject *sequence = Py_None;
+    bool skip_decoding = false, include_timestamp = false;  // default values
+    PyObject *arg_skip_decoding = NULL;
+    PyObject *arg_include_timestamp = NULL;
+    PyObject *arg_start_time = Py_None;
+    PyObject *arg_end_time = Py_None;
+    const char *arg_output = NULL;
+    int output = OUTPUT_LIST;
+    long long start_usec, end_usec;
+    IdVector type_ids;
+    ReplayIterator *it = NULL;
+
+    if (!PyArg_ParseTuple(args, "s|OOOOOs:replay_file", &path, &sequence,
+                                &arg_skip_decoding, &arg_include_timestamp,
+                                &arg_start_time, &arg_end_time, &arg_output))
+        return NULL;
+    parse_decoding_args(arg_skip_decoding, arg_include_timestamp,
+                        skip_decoding, include_timestamp);
+    if (!parse_output_arg(arg_output, output))
+        return NULL;
+    if (!datetime_to_qcdm_usec(arg_start_time, "start_time", LLONG_MIN, start_usec)
+            || !datetime_to_qcdm_usec(arg_end_time, "end_time", LLONG_MAX, end_usec))
+        return NULL;
+
+    // Check arguments
+    if (sequence != Py_None) {
+        if (!PySequence_Check(sequence)) {
+            PyErr_SetString(PyExc_TypeError, "\'type_names\' is not a sequence.");
+            return NULL;
+        }
+        if (!map_typenames_to_ids(sequence, type_ids)) {
+            PyErr_SetString(PyExc_ValueError, "Wrong type name.");
+            return NULL;
+        }
+    }
+
+    it = PyObject_New(ReplayIterator, &ReplayIteratorType);
+    if (it == NULL)
+        return NULL;
+    it->file.data = NULL;
+    it->file.size = 0;
+    it->pos = 0;
+    it->offsets = NULL;
+    it->reader = NULL;
+    it->hdlc = NULL;
+    it->pending = new std::deque<std::string>;
+    it->skip_decoding = skip_decoding;
+    it->include_timestamp = include_timestamp;
+    it->output = output;
+    it->decoding = get_collector_state(self)->decoding;
+    it->owner = NULL;
+    it->lock = NULL;
+#ifdef WITH_THREAD
+    it->lock = PyThread_allocate_lock();
+    if (it->lock == NULL) {
+        it->emanager = NULL;
+        it->owns_emanager = false;
+        Py_DECREF(it);
+        PyErr_SetString(PyExc_MemoryError, "Unable to allocate lock.");
+        return NULL;
+    }
+#endif
+    if (sequence != Py_None) {
+        it->emanager = new ExportManagerState;
+        it->emanager_lock = NULL;
+        it->owns_emanager = true;
+        manager_init_state(it->emanager);
+        manager_change_config(it->emanager, NULL, type_ids);
+    } else {
+        CollectorState *pstate = get_collector_state(self);
+        it->emanager = &pstate->emanager;
+        it->emanager_lock = pstate->lock;
+        it->owns_emanager = false;
+        if (self != NULL && PyObject_TypeCheck(self, &CollectorType)) {
+            it->owner = self;
+            Py_INCREF(self);
+        }
+    }
+    if (!mapped_file_open(&it->file, path)) {
+        PyErr_SetFromErrnoWithFilename(PyExc_IOError, (char *) path);
+        Py_DECREF(it);
+        return NULL;
+    }
+    if (detect_compression(it->file.data, it->file.size) != COMPRESSION_NONE) {
+        it->reader = new CompressedReader;
+        if (!compressed_reader_open(it->reader, it->file.data, it->file.size)) {
+            PyErr_Format(PyExc_IOError, "Compression of \'%s\' is not supported.", path);
+            Py_DECREF(it);
+            return NULL;
+        }
+        if (arg_start_time == Py_None && arg_end_time == Py_None) {
+            it->hdlc = new HdlcBufferState;
+            hdlc_init_state(it->hdlc);
+        }
+    }
+    if (arg_start_time != Py_None || arg_end_time != Py_None) {
+        // Seek to the selected frames only, using the index of the file
+        TypeBitmap whitelist;
+        if (it->emanager_lock != NULL)
+            ACQUIRE_LOCK(it->emanager_lock);
+        // Frames exported by routes are selected as well
+        whitelist = it->emanager->export_whitelist;
+        if (it->emanager_lock != NULL)
+            RELEASE_LOCK(it->emanager_lock);
+        it->offsets = new std::vector<size_t>;
+        Py_BEGIN_ALLOW_THREADS
+        LogIndex index;
+        get_log_index(path, &it->file, index);
+        select_indexed_frames(index, whitelist, start_usec, end_usec, *it->offsets);
+        Py_END_ALLOW_THREADS
+    }
+    return (PyObject *) it;
+}
+
+// Return: a list of (offset, type_name, timestamp)
+static PyObject *
+dm_collector_c_index_file (PyObject *self, PyObject *args) {
+    const char *path;
+    MappedFile file;
+    LogIndex index;
+
+    if (!PyArg_ParseTuple(args, "s:index_file", &path))
+        return NULL;
+    if (PyDateTimeAPI == NULL)  // import datetime module
+        PyDateTime_IMPORT;
+
+    if (!mapped_file_open(&file, path)) {
+        PyErr_SetFromErrnoWithFilename(PyExc_IOError, (char *) path);
+        return NULL;
+    }
+    if (!compression_supported(detect_compression(file.data, file.size))) {
+        mapped_file_close(&file);
+        PyErr_Format(PyExc_IOError, "Compression of \'%s\' is not supported.", path);
+        return NULL;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    get_log_index(path, &file, index);
+    Py_END_ALLOW_THREADS
+    mapped_file_close(&file);
+
+    PyObject *ret = PyList_New(index.size());
+    if (ret == NULL)
+        return NULL;
+    for (size_t i = 0; i < index.size(); i++) {
+        const LogIndexEntry &entry = index[i];
+        PyObject *type_name = Py_None;
+        PyObject *timestamp = Py_None;
+        Py_INCREF(Py_None);
+        Py_INCREF(Py_None);
+        if (entry.type_id >= 0) {
+            const char *name = search_name(LogPacketTypeID_To_Name,
+                                            ARRAY_SIZE(LogPacketTypeID_To_Name, ValueName),
+                                            entry.type_id);
+            Py_DECREF(type_name);
+            type_name = PyString_FromString(name != NULL? name: "Unsupported");
+        }
+        if (entry.timestamp != 0) {
+            Py_DECREF(timestamp);
+            timestamp = qcdm_timestamp_to_datetime(entry.timestamp);
+        }
+        PyObject *item = Py_BuildValue("(KNN)", entry.offset, type_name, timestamp);
+        if (item == NULL) {
+            Py_DECREF(ret);
+            return NULL;
+        }
+        PyList_SET_ITEM(ret, i, item);
+    }
+    return ret;
 }
 
 // Init the module
@@ -743,5 +2299,29 @@ initdm_collector_c(void)
     PyObject_SetAttrString(dm_collector_c, "version", pystr);
     Py_DECREF(pystr);
 
-    manager_init_state(&g_emanager);
+    hdlc_init_state(&g_collector.hdlc);
+    manager_init_state(&g_collector.emanager);
+    g_collector.decoding = DEFAULT_DECODING_OPTIONS;
+    decode_stats_init(&g_stats);
+    g_collector.lock = NULL;
+#ifdef WITH_THREAD
+    g_collector.lock = PyThread_allocate_lock();
+    if (g_collector.lock == NULL)
+        return;
+#endif
+
+    if (PyType_Ready(&ReplayIteratorType) < 0)
+        return;
+    if (PyType_Ready(&CollectorType) < 0)
+        return;
+    Py_INCREF(&CollectorType);
+    PyModule_AddObject(dm_collector_c, "Collector", (PyObject *) &CollectorType);
+    if (PyType_Ready(&ColumnTableType) < 0)
+        return;
+    Py_INCREF(&ColumnTableType);
+    PyModule_AddObject(dm_collector_c, "ColumnTable", (PyObject *) &ColumnTableType);
+    if (!record_type_ready())
+        return;
+    Py_INCREF(&RecordType);
+    PyModule_AddObject(dm_collector_c, "Record", (PyObject *) &RecordType);
 }
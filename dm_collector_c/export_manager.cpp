@@ -7,15 +7,26 @@
 
 #include <Python.h>
 
+#include "compressed_file.h"
 #include "consts.h"
 #include "export_manager.h"
 #include "hdlc.h"
 #include "log_packet.h"
 #include "log_packet_helper.h"
 
+#include <sstream>
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <unistd.h>
+#endif
+
+// The flush thread checks whether it should exit at this interval
+#define FLUSHER_POLL_MS 50
+
 // A simple but dirty function to retrieve type ID.
-// Return -1 if the packet is not recognized
-static int
+int
 get_log_type(const char *b, size_t length) {
     int type_id = -1;
     if (is_log_packet(b, length) && length >= 8) {
@@ -28,23 +39,346 @@ get_log_type(const char *b, size_t length) {
     return type_id;
 }
 
+static void
+sleep_ms (int ms) {
+#ifdef _WIN32
+    Sleep(ms);
+#else
+    usleep(ms * 1000);
+#endif
+}
+
+#ifdef WITH_THREAD
+// Body of the background flush thread. It never touches Python objects.
+static void
+flusher_main (void *arg) {
+    struct ExportManagerState *pstate = (struct ExportManagerState *) arg;
+    int waited_ms = 0;
+    while (!pstate->flusher_stop) {
+        sleep_ms(FLUSHER_POLL_MS);
+        waited_ms += FLUSHER_POLL_MS;
+        if (waited_ms >= pstate->flush_interval * 1000) {
+            // stdio streams are locked internally, but log_fp may be replaced
+            // when rolling over
+            PyThread_acquire_lock(pstate->fp_lock, WAIT_LOCK);
+            if (pstate->log_fp != NULL)
+                fflush(pstate->log_fp);
+            PyThread_release_lock(pstate->fp_lock);
+            waited_ms = 0;
+        }
+    }
+    PyThread_release_lock(pstate->flusher_done);
+}
+#endif
+
+static void
+start_flusher (struct ExportManagerState *pstate) {
+#ifdef WITH_THREAD
+    if (pstate->flusher_running || pstate->flush_interval <= 0)
+        return;
+    if (pstate->flusher_done == NULL)
+        pstate->flusher_done = PyThread_allocate_lock();
+    if (pstate->fp_lock == NULL)
+        pstate->fp_lock = PyThread_allocate_lock();
+    if (pstate->flusher_done == NULL || pstate->fp_lock == NULL)
+        return;
+    PyThread_acquire_lock(pstate->flusher_done, WAIT_LOCK);
+    pstate->flusher_stop = false;
+    if (PyThread_start_new_thread(flusher_main, pstate) == -1) {
+        PyThread_release_lock(pstate->flusher_done);
+        return;
+    }
+    pstate->flusher_running = true;
+#endif
+}
+
+// Wait for the flush thread to exit
+static void
+stop_flusher (struct ExportManagerState *pstate) {
+#ifdef WITH_THREAD
+    if (!pstate->flusher_running)
+        return;
+    pstate->flusher_stop = true;
+    PyThread_acquire_lock(pstate->flusher_done, WAIT_LOCK);
+    PyThread_release_lock(pstate->flusher_done);
+    pstate->flusher_running = false;
+#endif
+}
+
+static bool
+rotation_enabled (const struct ExportManagerState *pstate) {
+    return pstate->max_bytes > 0 || pstate->max_seconds > 0;
+}
+
+// Return: the path of the index-th log file of a rotated export
+static std::string
+rotated_path (const std::string &pattern, int index) {
+    std::ostringstream n;
+    n << index;
+    size_t p = pattern.find("%d");
+    if (p != std::string::npos)
+        return pattern.substr(0, p) + n.str() + pattern.substr(p + 2);
+    // Insert before the extension of the file name, if any. The extension of
+    // a compressed log includes that of the log, e.g. ".mi2log.gz".
+    std::string suffix = compression_extension(compression_from_path(pattern));
+    std::string base = pattern.substr(0, pattern.size() - suffix.size());
+    size_t dot = base.rfind('.');
+    size_t sep = base.find_last_of("/\\");
+    if (dot == std::string::npos || (sep != std::string::npos && dot < sep)
+            || dot == 0 || (sep != std::string::npos && dot == sep + 1))
+        return base + "_" + n.str() + suffix;
+    return base.substr(0, dot) + "_" + n.str() + base.substr(dot) + suffix;
+}
+
+// Open a log file, using the write buffer of the export if any.
+static void
+open_log_file (struct ExportManagerState *pstate, const std::string &path) {
+    pstate->log_fp = fopen(path.c_str(), "wb");
+    pstate->filename = path;
+    pstate->file_bytes = 0;
+    pstate->file_start = time(NULL);
+    pstate->block.clear();
+    if (pstate->log_fp != NULL) {
+        if (pstate->write_buffer != NULL)
+            setvbuf(pstate->log_fp, pstate->write_buffer, _IOFBF, pstate->buffer_size);
+        else
+            setvbuf(pstate->log_fp, NULL, _IONBF, 0);
+    }
+}
+
+// Compress the pending data of a compressed log into a block, and write it.
+static void
+write_block (struct ExportManagerState *pstate) {
+    if (pstate->block.empty())
+        return;
+    std::string out;
+    if (compress_block(pstate->compression, pstate->block.data(), pstate->block.size(), out))
+        pstate->file_bytes += fwrite(out.data(), sizeof(char), out.size(), pstate->log_fp);
+    pstate->block.clear();
+}
+
+// Write bytes to the current log file, compressing them if necessary.
+static void
+write_log (struct ExportManagerState *pstate, const char *b, size_t length) {
+    if (pstate->compression == COMPRESSION_NONE) {
+        pstate->file_bytes += fwrite(b, sizeof(char), length, pstate->log_fp);
+        return;
+    }
+    if (pstate->block.empty())
+        pstate->block_start = time(NULL);
+    pstate->block.append(b, length);
+    if (pstate->block.size() >= COMPRESSED_BLOCK_SIZE
+            || (pstate->flush_interval > 0
+                && difftime(time(NULL), pstate->block_start) >= pstate->flush_interval))
+        write_block(pstate);
+}
+
+static void
+close_log_file (struct ExportManagerState *pstate) {
+    write_block(pstate);
+    fclose(pstate->log_fp);
+    pstate->log_fp = NULL;
+}
+
+// Start exporting to path, with a write buffer of buffer_size bytes.
+static void
+open_export_file (struct ExportManagerState *pstate, const char *path) {
+    pstate->path_pattern = path;
+    pstate->compression = compression_from_path(pstate->path_pattern);
+    pstate->file_index = 0;
+    // Some C libraries ignore the size if no buffer is provided
+    if (pstate->buffer_size > 0)
+        pstate->write_buffer = new char[pstate->buffer_size];
+    if (rotation_enabled(pstate))
+        open_log_file(pstate, rotated_path(pstate->path_pattern, 0));
+    else
+        open_log_file(pstate, pstate->path_pattern);
+    if (pstate->log_fp != NULL)
+        start_flusher(pstate);
+}
+
+static void
+close_export_file (struct ExportManagerState *pstate) {
+    stop_flusher(pstate);
+    if (pstate->log_fp != NULL)
+        close_log_file(pstate);
+    delete [] pstate->write_buffer;
+    pstate->write_buffer = NULL;
+    pstate->filename = "";
+    pstate->path_pattern = "";
+}
+
+// Roll over to the next log file if writing length more bytes would exceed
+// the limits of the current one.
+static void
+rotate_if_needed (struct ExportManagerState *pstate, size_t length) {
+    if (!rotation_enabled(pstate) || (pstate->file_bytes == 0 && pstate->block.empty()))
+        return;
+    bool full;
+    if (pstate->compression == COMPRESSION_NONE)
+        full = pstate->max_bytes > 0
+                    && pstate->file_bytes + length > pstate->max_bytes;
+    else    // the compressed size of a frame is unknown until its block is written
+        full = pstate->max_bytes > 0 && pstate->file_bytes >= pstate->max_bytes;
+    bool expired = pstate->max_seconds > 0
+                    && difftime(time(NULL), pstate->file_start) >= pstate->max_seconds;
+    if (!full && !expired)
+        return;
+
+#ifdef WITH_THREAD
+    if (pstate->fp_lock != NULL)
+        PyThread_acquire_lock(pstate->fp_lock, WAIT_LOCK);
+#endif
+    close_log_file(pstate);
+    pstate->finished.push_back(pstate->filename);
+    pstate->file_index++;
+    open_log_file(pstate, rotated_path(pstate->path_pattern, pstate->file_index));
+#ifdef WITH_THREAD
+    if (pstate->fp_lock != NULL)
+        PyThread_release_lock(pstate->fp_lock);
+#endif
+}
+
+// Recompute the union of the whitelists of pstate and its routes
+static void
+update_export_whitelist (struct ExportManagerState *pstate) {
+    pstate->export_whitelist = pstate->whitelist;
+    for (size_t i = 0; i < pstate->routes.size(); i++)
+        pstate->export_whitelist |= pstate->routes[i]->whitelist;
+}
+
+// Close the files of all routes, keeping the log files they have finished.
+static void
+release_routes (struct ExportManagerState *pstate) {
+    for (size_t i = 0; i < pstate->routes.size(); i++) {
+        struct ExportManagerState *route = pstate->routes[i];
+        pstate->finished.insert(pstate->finished.end(),
+                                route->finished.begin(), route->finished.end());
+        manager_release_state(route);
+        delete route;
+    }
+    pstate->routes.clear();
+}
+
 void
 manager_init_state (struct ExportManagerState *pstate) {
     pstate->log_fp = NULL;
     pstate->filename = "";
-    pstate->whitelist.clear();
+    pstate->path_pattern = "";
+    pstate->whitelist.reset();
+    pstate->strict_crc = false;
+    pstate->buffer_size = DEFAULT_EXPORT_BUFFER_SIZE;
+    pstate->write_buffer = NULL;
+    pstate->flush_interval = 0.0;
+    pstate->flusher_done = NULL;
+    pstate->flusher_running = false;
+    pstate->flusher_stop = false;
+    pstate->fp_lock = NULL;
+    pstate->compression = COMPRESSION_NONE;
+    pstate->block.clear();
+    pstate->block_start = 0;
+    pstate->max_bytes = 0;
+    pstate->max_seconds = 0.0;
+    pstate->file_index = 0;
+    pstate->file_bytes = 0;
+    pstate->file_start = 0;
+    pstate->finished.clear();
+    pstate->routes.clear();
+    pstate->export_whitelist.reset();
     return;
 }
 
+void
+manager_release_state (struct ExportManagerState *pstate) {
+    close_export_file(pstate);
+    release_routes(pstate);
+    pstate->whitelist.reset();
+    pstate->export_whitelist.reset();
+    pstate->finished.clear();
+#ifdef WITH_THREAD
+    if (pstate->flusher_done != NULL) {
+        PyThread_free_lock(pstate->flusher_done);
+        pstate->flusher_done = NULL;
+    }
+    if (pstate->fp_lock != NULL) {
+        PyThread_free_lock(pstate->fp_lock);
+        pstate->fp_lock = NULL;
+    }
+#endif
+}
+
+void
+manager_set_buffering (struct ExportManagerState *pstate,
+                        size_t buffer_size, double flush_interval) {
+    pstate->buffer_size = buffer_size;
+    pstate->flush_interval = flush_interval;
+}
+
+void
+manager_set_rotation (struct ExportManagerState *pstate,
+                        unsigned long long max_bytes, double max_seconds) {
+    pstate->max_bytes = max_bytes;
+    pstate->max_seconds = max_seconds;
+}
+
+void
+manager_set_routes (struct ExportManagerState *pstate,
+                    const std::vector<std::string> &paths,
+                    const std::vector<IdVector> &whitelists,
+                    size_t buffer_size, double flush_interval,
+                    unsigned long long max_bytes, double max_seconds) {
+    release_routes(pstate);
+    for (size_t i = 0; i < paths.size() && i < whitelists.size(); i++) {
+        struct ExportManagerState *route = new ExportManagerState;
+        manager_init_state(route);
+        manager_set_buffering(route, buffer_size, flush_interval);
+        manager_set_rotation(route, max_bytes, max_seconds);
+        manager_change_config(route, paths[i].c_str(), whitelists[i]);
+        pstate->routes.push_back(route);
+    }
+    update_export_whitelist(pstate);
+}
+
+void
+manager_take_finished (struct ExportManagerState *pstate,
+                        std::vector<std::string> &out) {
+    out.insert(out.end(), pstate->finished.begin(), pstate->finished.end());
+    pstate->finished.clear();
+    for (size_t i = 0; i < pstate->routes.size(); i++)
+        manager_take_finished(pstate->routes[i], out);
+}
+
+bool
+manager_accepts_header (const struct ExportManagerState *pstate,
+                        const char *b, size_t length) {
+    int type_id = get_log_type(b, length);
+    return type_id >= 0 && pstate->export_whitelist.test(type_id);
+}
+
 bool
-manager_export_binary (struct ExportManagerState *pstate, const char *b, size_t length) {
+manager_export_binary (struct ExportManagerState *pstate, const char *b, size_t length,
+                        const char *escaped, size_t escaped_length) {
 
     int type_id = get_log_type(b, length);
-    if (pstate->whitelist.count(type_id) > 0) { // filter
+    if (type_id >= 0 && pstate->export_whitelist.test(type_id)) {
+        for (size_t i = 0; i < pstate->routes.size(); i++)
+            manager_export_binary(pstate->routes[i], b, length, escaped, escaped_length);
+    }
+    if (type_id >= 0 && pstate->whitelist.test(type_id)) { // filter
 
         if (pstate->log_fp != NULL) {
-            std::string frame = encode_hdlc_frame(b, (int) length);
-            size_t cnt = fwrite(frame.c_str(), sizeof(char), frame.size(), pstate->log_fp);
+            if (escaped != NULL) {
+                rotate_if_needed(pstate, escaped_length + 1);
+                if (pstate->log_fp != NULL) {
+                    write_log(pstate, escaped, escaped_length);
+                    write_log(pstate, "\x7e", 1);
+                }
+            } else {
+                std::string frame = encode_hdlc_frame(b, (int) length);
+                rotate_if_needed(pstate, frame.size());
+                if (pstate->log_fp != NULL)
+                    write_log(pstate, frame.c_str(), frame.size());
+            }
         }
         return true;
     }
@@ -55,15 +389,17 @@ manager_export_binary (struct ExportManagerState *pstate, const char *b, size_t
 void
 manager_change_config (struct ExportManagerState *pstate,
                         const char *new_path, const IdVector &whitelist) {
-    if (pstate->log_fp != NULL && new_path != NULL && pstate->filename != new_path) {   // close old file
-        fclose(pstate->log_fp);
-        pstate->log_fp = NULL;
-        pstate->filename = "";
+    if (pstate->log_fp != NULL && new_path != NULL && pstate->path_pattern != new_path) {   // close old file
+        close_export_file(pstate);
     }
     if (pstate->log_fp == NULL && new_path != NULL) {   // open new file if necessary
-        pstate->log_fp = fopen(new_path, "wb");
-        pstate->filename = new_path;
+        close_export_file(pstate);  // release the buffer if the last open failed
+        open_export_file(pstate, new_path);
+    }
+    pstate->whitelist.reset();
+    for (size_t i = 0; i < whitelist.size(); i++) {
+        if (whitelist[i] >= 0 && whitelist[i] < (int) pstate->whitelist.size())
+            pstate->whitelist.set(whitelist[i]);
     }
-    pstate->whitelist.clear();
-    pstate->whitelist.insert(whitelist.begin(), whitelist.end());
+    update_export_whitelist(pstate);
 }
@@ -3,23 +3,117 @@
 
 #include "utils.h"
 
-#include <set>
+#include <Python.h>
+#include <pythread.h>
+
+#include <bitset>
 #include <string>
+#include <vector>
 #include <cstdio>
+#include <ctime>
+
+// Type IDs are 16-bit, so the whitelist is a bitmap of all possible IDs.
+typedef std::bitset<65536> TypeBitmap;
+
+// Number of leading bytes of a frame needed to tell its type
+#define FRAME_TYPE_HEADER_SIZE 8
+// Default size of the write buffer of exported logs
+#define DEFAULT_EXPORT_BUFFER_SIZE (1024 * 1024)
 
 // Manage the output of logs.
 struct ExportManagerState {
     FILE *log_fp;   // Point to the current log.
     std::string filename;
-    std::set<int> whitelist;
+    // Path given by the user. If rotation is enabled, log files are named
+    // after it with a sequence number (see manager_set_rotation()).
+    std::string path_pattern;
+    TypeBitmap whitelist;
+    // If set, all frames are unescaped and CRC-checked, including those
+    // rejected by the whitelist.
+    bool strict_crc;
+    size_t buffer_size;     // size of the write buffer of log_fp
+    char *write_buffer;     // the write buffer of log_fp, or NULL
+    // Interval (in seconds) between flushes of log_fp by a background
+    // thread. No thread is started if it is not positive.
+    double flush_interval;
+    // Held by the flush thread until it exits. The thread is stopped before
+    // the export is closed.
+    PyThread_type_lock flusher_done;
+    volatile bool flusher_running;
+    volatile bool flusher_stop;
+    // Protects log_fp against the flush thread when rolling over
+    PyThread_type_lock fp_lock;
+    // Compression of the log files (see compressed_file.h), chosen by the
+    // extension of path_pattern
+    int compression;
+    std::string block;      // data not yet compressed
+    time_t block_start;     // when block was started
+    // Rotation limits of each log file. 0 means no limit.
+    unsigned long long max_bytes;
+    double max_seconds;
+    int file_index;             // sequence number of the current log file
+    unsigned long long file_bytes;  // bytes written to the current log file
+    time_t file_start;
+    // Log files closed by rotation, not yet taken by manager_take_finished()
+    std::vector<std::string> finished;
+    // Additional exports, each to its own file with its own whitelist (see
+    // manager_set_routes()). Their whitelists do not affect decoding.
+    std::vector<struct ExportManagerState *> routes;
+    // Union of the whitelists of this export and its routes
+    TypeBitmap export_whitelist;
 };
 
 // Must be called before usage
 void manager_init_state (struct ExportManagerState *pstate);
+// Close the export file, if any
+void manager_release_state (struct ExportManagerState *pstate);
+// If new_path ends with ".gz" or ".zst", the export is compressed in blocks
+// of COMPRESSED_BLOCK_SIZE bytes. A block is also closed when it is older
+// than the flush interval.
 void manager_change_config (struct ExportManagerState *pstate,
                             const char *new_path, const IdVector &whitelist);
+// Set the write buffer size and background flush interval, which take effect
+// the next time an export file is opened.
+void manager_set_buffering (struct ExportManagerState *pstate,
+                            size_t buffer_size, double flush_interval);
+// Set the size and age limits of each log file, which take effect the next
+// time an export file is opened. If any limit is set, the export rolls over
+// to a new file at a frame boundary when the limit is reached. The files are
+// named after the given path, with "%d" replaced by a sequence number
+// starting from 0, or with "_N" inserted before the file extension if there
+// is no "%d". The size limit of compressed logs applies to their compressed
+// size, which may exceed it by up to one block.
+void manager_set_rotation (struct ExportManagerState *pstate,
+                            unsigned long long max_bytes, double max_seconds);
+// Replace the routes of an export. The i-th route writes the frames whose
+// types are in whitelists[i] to paths[i], with the given buffering and
+// rotation settings. All routes are written in the same pass as the export
+// itself. The files of the old routes are closed.
+void manager_set_routes (struct ExportManagerState *pstate,
+                            const std::vector<std::string> &paths,
+                            const std::vector<IdVector> &whitelists,
+                            size_t buffer_size, double flush_interval,
+                            unsigned long long max_bytes, double max_seconds);
+// Move the paths of the log files closed by rotation, including those of
+// routes, into out.
+void manager_take_finished (struct ExportManagerState *pstate,
+                            std::vector<std::string> &out);
 
-// Export raw msgs that are in the whitelist
-bool manager_export_binary (struct ExportManagerState *pstate, const char *b, size_t length);
+// Return: type ID of an unescaped frame (or of its first
+// FRAME_TYPE_HEADER_SIZE bytes), or -1 if the frame is not recognized
+int get_log_type (const char *b, size_t length);
+// Check the type of a frame against the whitelists of the export and its
+// routes, given only the first FRAME_TYPE_HEADER_SIZE bytes of the unescaped
+// frame (or less if the frame is shorter). Frames rejected here are also
+// rejected by manager_export_binary().
+bool manager_accepts_header (const struct ExportManagerState *pstate,
+                                const char *b, size_t length);
+// Export raw msgs that are in the whitelist, and pass them to the routes
+// that accept them.
+// If the escaped frame (without the delimiter) is given, it is written
+// through unchanged instead of re-encoding the message.
+// Return: whether the msg is in the whitelist of pstate
+bool manager_export_binary (struct ExportManagerState *pstate, const char *b, size_t length,
+                            const char *escaped = NULL, size_t escaped_length = 0);
 
 #endif // __DM_COLLECTOR_C_EXPORT_MANAGER_H__
@@ -2,6 +2,8 @@
 
 #include "hdlc.h"
 
+#include <algorithm>
+#include <cstring>
 #include <string>
 
 static const int ESCAPE_XOR = 0x20;
@@ -12,12 +14,9 @@ typedef unsigned short     UINT16;
 typedef unsigned int       UINT32;
 typedef unsigned long long UINT64;
 
-// Automatically generated CRC function
+// Automatically generated CRC table
 // polynomial: 0x11021, bit reverse algorithm
-static UINT16
-calc_crc (UINT8 *data, size_t len, UINT16 crc)
-{
-    static const UINT16 table[256] = {
+static const UINT16 crc_table[256] = {
     0x0000U,0x1189U,0x2312U,0x329BU,0x4624U,0x57ADU,0x6536U,0x74BFU,
     0x8C48U,0x9DC1U,0xAF5AU,0xBED3U,0xCA6CU,0xDBE5U,0xE97EU,0xF8F7U,
     0x1081U,0x0108U,0x3393U,0x221AU,0x56A5U,0x472CU,0x75B7U,0x643EU,
@@ -50,12 +49,42 @@ calc_crc (UINT8 *data, size_t len, UINT16 crc)
     0x6B46U,0x7ACFU,0x4854U,0x59DDU,0x2D62U,0x3CEBU,0x0E70U,0x1FF9U,
     0xF78FU,0xE606U,0xD49DU,0xC514U,0xB1ABU,0xA022U,0x92B9U,0x8330U,
     0x7BC7U,0x6A4EU,0x58D5U,0x495CU,0x3DE3U,0x2C6AU,0x1EF1U,0x0F78U,
-    };
+};
+
+// Tables for slicing-by-8: crc_slices[k][x] is the CRC of byte x followed by
+// k zero bytes, so that 8 bytes can be processed by 8 independent lookups.
+static UINT16 crc_slices[8][256];
+
+static struct CrcSlicesInit {
+    CrcSlicesInit () {
+        for (int i = 0; i < 256; i++)
+            crc_slices[0][i] = crc_table[i];
+        for (int k = 1; k < 8; k++) {
+            for (int i = 0; i < 256; i++) {
+                UINT16 c = crc_slices[k - 1][i];
+                crc_slices[k][i] = crc_table[c & 0xFF] ^ (c >> 8);
+            }
+        }
+    }
+} crc_slices_init;
 
+static UINT16
+calc_crc (const UINT8 *data, size_t len, UINT16 crc)
+{
     crc = crc ^ 0xFFFFU;
+    while (len >= 8)
+    {
+        crc = crc_slices[7][data[0] ^ (UINT8)crc] ^
+                crc_slices[6][data[1] ^ (UINT8)(crc >> 8)] ^
+                crc_slices[5][data[2]] ^ crc_slices[4][data[3]] ^
+                crc_slices[3][data[4]] ^ crc_slices[2][data[5]] ^
+                crc_slices[1][data[6]] ^ crc_slices[0][data[7]];
+        data += 8;
+        len -= 8;
+    }
     while (len > 0)
     {
-        crc = table[*data ^ (UINT8)crc] ^ (crc >> 8);
+        crc = crc_table[*data ^ (UINT8)crc] ^ (crc >> 8);
         data++;
         len--;
     }
@@ -63,81 +92,209 @@ calc_crc (UINT8 *data, size_t len, UINT16 crc)
     return crc;
 }
 
+// Copy [b, b + length) to out, escaping 0x7d and 0x7e.
+// out must have room for 2 * length bytes.
+// Return: number of bytes written
+static size_t
+escape (const char *b, size_t length, char *out) {
+    size_t n = 0;
+    for (size_t i = 0; i < length; i++) {
+        char c = b[i];
+        if (c == '\x7d' || c == '\x7e') {
+            out[n++] = '\x7d';
+            out[n++] = char(c ^ ESCAPE_XOR);   // 0x7d: 0x7d5d, 0x7e: 0x7e5e
+        } else {
+            out[n++] = c;
+        }
+    }
+    return n;
+}
+
 std::string
 encode_hdlc_frame (const char *payld, int length) {
-    std::string retstr;
-    UINT16 crc16 = calc_crc((UINT8 *)payld, length, 0);
-    for (int i = 0; i < length + 2; i++) {
-        char c;
-        if (i < length)
-            c = payld[i];
-        else if (i == length)   // little endian
-            c = crc16 & 0x00FF;
-        else
-            c = (crc16 & 0xFF00) >> 8;
+    UINT16 crc16 = calc_crc((const UINT8 *)payld, length, 0);
+    char crc_bytes[2];
+    crc_bytes[0] = crc16 & 0x00FF;  // little endian
+    crc_bytes[1] = (crc16 & 0xFF00) >> 8;
 
-        if (c == '\x7d' || c == '\x7e') {
-            retstr.append(1, '\x7d');
-            retstr.append(1, c ^ ESCAPE_XOR);   // 0x7d: 0x7d5d, 0x7e: 0x7e5e
-        } else
-            retstr.append(1, c);
-    }
-    retstr.append(1, '\x7e');
+    // Escaping at most doubles the size
+    std::string retstr(2 * (length + 2) + 1, '\0');
+    char *out = &retstr[0];
+    size_t n = escape(payld, length, out);
+    n += escape(crc_bytes, 2, out + n);
+    out[n++] = '\x7e';
+    retstr.resize(n);
     return retstr;
 }
 
-static std::string buffer;
+void
+hdlc_init_state (struct HdlcBufferState *pstate) {
+    pstate->buffer.clear();
+    pstate->head = 0;
+    pstate->scanned = 0;
+}
 
 void
-feed_binary (const char *b, int length) {
+feed_binary (struct HdlcBufferState *pstate, const char *b, int length) {
+    std::string &buffer = pstate->buffer;
+    if (pstate->head == buffer.size()) {
+        buffer.clear();
+        pstate->head = 0;
+        pstate->scanned = 0;
+    } else if (pstate->head > 0 && pstate->head >= buffer.size() - pstate->head) {
+        // At least half of the buffer is consumed, so moving the rest to the
+        // front costs no more than the bytes already consumed.
+        buffer.erase(0, pstate->head);
+        pstate->scanned -= pstate->head;
+        pstate->head = 0;
+    }
     buffer.append(b, length);
 }
 
 void
-reset_binary() {
-    buffer.clear();
+reset_binary (struct HdlcBufferState *pstate) {
+    hdlc_init_state(pstate);
 }
 
+// Copy [b, b + length) to frame, removing escape sequences on the fly.
+// Runs of bytes between escape bytes are located with memchr and copied as
+// a whole.
 static void
-unescape (std::string& frame) {
-    bool esc = false;
-    std::string output;
-    for (size_t i = 0; i < frame.size(); i++) {
-        if (esc) {
-            output.append(1, char(frame[i] ^ ESCAPE_XOR));
-            esc = false;
-        } else if (frame[i] == '\x7d') {
-            esc = true;
-        } else {
-            output.append(1, frame[i]);
-        }
+unescape (const char *b, size_t length, std::string& frame) {
+    frame.resize(length);   // unescaped frame is never longer
+    char *out = &frame[0];
+    const char *end = b + length;
+    size_t n = 0;
+    while (b < end) {
+        const char *esc = (const char *) memchr(b, '\x7d', end - b);
+        if (esc == NULL)
+            esc = end;
+        memcpy(out + n, b, esc - b);
+        n += esc - b;
+        if (end - esc < 2)  // no escaped byte follows
+            break;
+        out[n++] = char(esc[1] ^ ESCAPE_XOR);
+        b = esc + 2;
     }
-    frame = output;
+    frame.resize(n);
     return;
 }
 
-// Return: if there is new frame or not
-bool
-get_next_frame (std::string& output_frame, bool& crc_correct) {
-    size_t delim = buffer.find('\x7e');
-    if (delim == std::string::npos)
-        return false;
-    output_frame = buffer.substr(0, delim);
-    buffer.erase(0, delim + 1);
-
-    unescape(output_frame);
+// Unescape an escaped frame (without its delimiter) and check its CRC.
+// The trailing CRC bytes are removed from output_frame.
+void
+unpack_frame (const char *b, size_t length, std::string& output_frame, bool& crc_correct) {
+    unescape(b, length, output_frame);
     if (output_frame.size() <= 2) {
         crc_correct = false;
-        return true;
+        return;
     }
     // little endian
     UINT16 b1 = output_frame[output_frame.size() - 1] & 0xFF;
     UINT16 b2 = output_frame[output_frame.size() - 2] & 0xFF;
     UINT16 frame_crc16 = (b1 << 8) + b2;
-    output_frame.erase(output_frame.size() - 2);
+    output_frame.resize(output_frame.size() - 2);
 
-    UINT16 crc16 = calc_crc((UINT8 *) output_frame.c_str(), output_frame.size(), 0);
+    UINT16 crc16 = calc_crc((const UINT8 *) output_frame.data(), output_frame.size(), 0);
 
     crc_correct = (frame_crc16 == crc16);
+}
+
+// Unescape the first bytes (at most max_len) of an escaped frame into prefix.
+// Return: number of bytes written
+size_t
+unescape_prefix (const char *b, size_t length, char *prefix, size_t max_len) {
+    const char *end = b + length;
+    size_t n = 0;
+    for (const char *p = b; p < end && n < max_len; p++) {
+        if (*p == '\x7d') {
+            if (p + 1 == end)
+                break;
+            p++;
+            prefix[n++] = char(*p ^ ESCAPE_XOR);
+        } else {
+            prefix[n++] = *p;
+        }
+    }
+    return n;
+}
+
+// Return: if there is new frame or not
+bool
+get_next_escaped_frame (struct HdlcBufferState *pstate,
+                        const char *& frame, size_t& frame_length) {
+    const std::string &buffer = pstate->buffer;
+    size_t start = std::max(pstate->head, pstate->scanned);
+    const char *delim = NULL;
+    if (start < buffer.size())
+        delim = (const char *) memchr(buffer.data() + start, '\x7e', buffer.size() - start);
+    if (delim == NULL) {
+        pstate->scanned = buffer.size();
+        return false;
+    }
+    size_t delim_pos = delim - buffer.data();
+    frame = buffer.data() + pstate->head;
+    frame_length = delim_pos - pstate->head;
+    pstate->head = delim_pos + 1;
+    pstate->scanned = pstate->head;
+    return true;
+}
+
+// Locate the frame starting at b[pos] in a memory region. On success pos is
+// moved past the frame delimiter.
+// Return: if there is new frame or not
+bool
+get_next_escaped_frame_from (const char *b, size_t length, size_t& pos,
+                                const char *& frame, size_t& frame_length) {
+    if (pos >= length)
+        return false;
+    const char *delim = (const char *) memchr(b + pos, '\x7e', length - pos);
+    if (delim == NULL)
+        return false;
+    frame = b + pos;
+    frame_length = delim - frame;
+    pos = delim - b + 1;
+    return true;
+}
+
+// Return: if there is new frame or not
+bool
+get_next_frame (struct HdlcBufferState *pstate, std::string& output_frame, bool& crc_correct) {
+    const char *frame;
+    size_t frame_length;
+    if (!get_next_escaped_frame(pstate, frame, frame_length))
+        return false;
+    unpack_frame(frame, frame_length, output_frame, crc_correct);
+    return true;
+}
+
+// Extract the frame starting at b[pos] from a memory region, without copying
+// the region into the reassembly buffer. On success pos is moved past the
+// frame delimiter.
+// Return: if there is new frame or not
+bool
+get_next_frame_from (const char *b, size_t length, size_t& pos,
+                        std::string& output_frame, bool& crc_correct) {
+    const char *frame;
+    size_t frame_length;
+    if (!get_next_escaped_frame_from(b, length, pos, frame, frame_length))
+        return false;
+    unpack_frame(frame, frame_length, output_frame, crc_correct);
+    return true;
+}
+
+// Locate the frame starting at b[pos] like get_next_frame_from(), but only
+// unescape its first bytes (at most prefix_len) into prefix. The CRC is not
+// checked. On success pos is moved past the frame delimiter, and prefix_len
+// is set to the number of bytes written.
+// Return: if there is new frame or not
+bool
+peek_next_frame_from (const char *b, size_t length, size_t& pos,
+                        char *prefix, size_t& prefix_len) {
+    const char *frame;
+    size_t frame_length;
+    if (!get_next_escaped_frame_from(b, length, pos, frame, frame_length))
+        return false;
+    prefix_len = unescape_prefix(frame, frame_length, prefix, prefix_len);
     return true;
 }
@@ -3,9 +3,42 @@
 
 #include <string>
 
+// Reassembly buffer of a HDLC stream. Bytes before head have already been
+// consumed; they are discarded lazily in feed_binary(), so that taking a frame
+// out of the buffer only moves a cursor instead of shifting the remaining
+// bytes.
+struct HdlcBufferState {
+    std::string buffer;
+    size_t head;
+    // Position up to which buffer has been scanned for a delimiter without
+    // success. Avoids re-scanning a partial frame every time we are polled.
+    size_t scanned;
+};
+
 std::string encode_hdlc_frame (const char *payld, int length);
-void feed_binary (const char *b, int length);
-void reset_binary ();
-bool get_next_frame (std::string& output_frame, bool& crc_correct);
+
+// Must be called before usage
+void hdlc_init_state (struct HdlcBufferState *pstate);
+void feed_binary (struct HdlcBufferState *pstate, const char *b, int length);
+void reset_binary (struct HdlcBufferState *pstate);
+bool get_next_frame (struct HdlcBufferState *pstate,
+                        std::string& output_frame, bool& crc_correct);
+bool get_next_frame_from (const char *b, size_t length, size_t& pos,
+                            std::string& output_frame, bool& crc_correct);
+bool peek_next_frame_from (const char *b, size_t length, size_t& pos,
+                            char *prefix, size_t& prefix_len);
+
+// Take out a frame without unescaping it, so that unwanted frames can be
+// dropped after looking at their first bytes only (see unescape_prefix()).
+// The escaped frame is unpacked later with unpack_frame(). The pointer
+// returned by get_next_escaped_frame() is valid until the next call to
+// feed_binary() or reset_binary().
+bool get_next_escaped_frame (struct HdlcBufferState *pstate,
+                                const char *& frame, size_t& frame_length);
+bool get_next_escaped_frame_from (const char *b, size_t length, size_t& pos,
+                                    const char *& frame, size_t& frame_length);
+size_t unescape_prefix (const char *b, size_t length, char *prefix, size_t max_len);
+void unpack_frame (const char *b, size_t length,
+                    std::string& output_frame, bool& crc_correct);
 
 #endif  // __DM_COLLECTOR_C_HDLC_H__
@@ -0,0 +1,188 @@
+/* log_index.cpp
+ * Builds, saves and loads the sidecar index (.mi2idx) of mi2log files.
+ * Offsets of frames in compressed logs refer to the decompressed stream.
+ *
+ * Sidecar format (all integers are little endian):
+ *   header: "MI2IDX" 0x01 0x00, u64 log size, i64 log mtime (in nanoseconds
+ *           where available), u64 n_entries
+ *   entry:  u64 offset, u16 type_id, u64 timestamp
+ */
+
+#include <Python.h>
+
+#include "compressed_file.h"
+#include "consts.h"
+#include "hdlc.h"
+#include "log_index.h"
+#include "log_packet.h"
+
+#include <cstdio>
+#include <cstring>
+#include <sys/stat.h>
+
+static const char INDEX_MAGIC[8] = {'M', 'I', '2', 'I', 'D', 'X', 0x01, 0x00};
+static const size_t INDEX_HEADER_SIZE = 32;
+static const size_t INDEX_ENTRY_SIZE = 18;
+// 2 (0x10 0x00) + 2 (len1) + 2 (log_msg_len) + 2 (type_id) + 8 (timestamp)
+static const size_t LOG_HEADER_SIZE = 16;
+
+static void
+put_uint (char *p, unsigned long long v, int n_bytes) {
+    for (int i = 0; i < n_bytes; i++) {
+        p[i] = char(v & 0xFF);
+        v >>= 8;
+    }
+}
+
+static unsigned long long
+get_uint (const char *p, int n_bytes) {
+    unsigned long long v = 0;
+    for (int i = n_bytes - 1; i >= 0; i--)
+        v = (v << 8) | (unsigned char) p[i];
+    return v;
+}
+
+// Return: the modification time of a file, in nanoseconds if the platform
+// provides it
+static long long
+get_mtime (const struct stat &st) {
+    long long mtime = (long long) st.st_mtime * 1000000000LL;
+#if defined(__APPLE__)
+    mtime += st.st_mtimespec.tv_nsec;
+#elif defined(__linux__)
+    mtime += st.st_mtim.tv_nsec;
+#endif
+    return mtime;
+}
+
+std::string
+log_index_path (const char *log_path) {
+    return std::string(log_path) + ".mi2idx";
+}
+
+// Append the complete frames in b to index. base is the offset of b in the
+// log.
+// Return: the position after the last complete frame in b
+static size_t
+index_frames (const char *b, size_t length, unsigned long long base, LogIndex &index) {
+    char header[LOG_HEADER_SIZE];
+    size_t pos = 0;
+    while (true) {
+        LogIndexEntry entry;
+        size_t header_len = LOG_HEADER_SIZE;
+        entry.offset = base + pos;
+        if (!peek_next_frame_from(b, length, pos, header, header_len))
+            break;
+        entry.type_id = -1;
+        entry.timestamp = 0;
+        if (is_log_packet(header, header_len) && header_len >= 8) {
+            entry.type_id = (int) get_uint(header + 6, 2);
+            if (header_len >= LOG_HEADER_SIZE)
+                entry.timestamp = get_uint(header + 8, 8);
+        } else if (is_debug_packet(header, header_len)) {
+            entry.type_id = Modem_debug_message;
+        }
+        index.push_back(entry);
+    }
+    return pos;
+}
+
+void
+build_log_index (const char *b, size_t length, LogIndex &index) {
+    index.clear();
+    if (detect_compression(b, length) == COMPRESSION_NONE) {
+        index_frames(b, length, 0, index);
+        return;
+    }
+
+    // Decompress the log chunk by chunk. Frames may span chunks.
+    CompressedReader reader;
+    std::string chunk, buffer;
+    unsigned long long base = 0;    // offset of buffer in the decompressed log
+    if (!compressed_reader_open(&reader, b, length))
+        return;
+    while (compressed_reader_read(&reader, chunk)) {
+        buffer.append(chunk);
+        size_t consumed = index_frames(buffer.data(), buffer.size(), base, index);
+        buffer.erase(0, consumed);
+        base += consumed;
+    }
+    compressed_reader_close(&reader);
+}
+
+// Return: successful or not
+static bool
+load_log_index (const std::string &path, unsigned long long log_size,
+                long long log_mtime, LogIndex &index) {
+    FILE *fp = fopen(path.c_str(), "rb");
+    if (fp == NULL)
+        return false;
+    char header[INDEX_HEADER_SIZE];
+    bool success = false;
+    if (fread(header, 1, INDEX_HEADER_SIZE, fp) == INDEX_HEADER_SIZE
+            && memcmp(header, INDEX_MAGIC, sizeof(INDEX_MAGIC)) == 0
+            && get_uint(header + 8, 8) == log_size
+            && (long long) get_uint(header + 16, 8) == log_mtime) {
+        size_t n = (size_t) get_uint(header + 24, 8);
+        std::vector<char> buf(n * INDEX_ENTRY_SIZE + 1);
+        // The extra byte detects trailing garbage
+        if (fread(&buf[0], 1, buf.size(), fp) == n * INDEX_ENTRY_SIZE) {
+            index.resize(n);
+            for (size_t i = 0; i < n; i++) {
+                const char *p = &buf[i * INDEX_ENTRY_SIZE];
+                index[i].offset = get_uint(p, 8);
+                index[i].type_id = (int) get_uint(p + 8, 2);
+                if (index[i].type_id == 0xFFFF)
+                    index[i].type_id = -1;
+                index[i].timestamp = get_uint(p + 10, 8);
+            }
+            success = true;
+        }
+    }
+    fclose(fp);
+    return success;
+}
+
+// Return: successful or not
+static bool
+save_log_index (const std::string &path, unsigned long long log_size,
+                long long log_mtime, const LogIndex &index) {
+    FILE *fp = fopen(path.c_str(), "wb");
+    if (fp == NULL)
+        return false;
+    std::vector<char> buf(INDEX_HEADER_SIZE + index.size() * INDEX_ENTRY_SIZE);
+    memcpy(&buf[0], INDEX_MAGIC, sizeof(INDEX_MAGIC));
+    put_uint(&buf[8], log_size, 8);
+    put_uint(&buf[16], (unsigned long long) log_mtime, 8);
+    put_uint(&buf[24], index.size(), 8);
+    for (size_t i = 0; i < index.size(); i++) {
+        char *p = &buf[INDEX_HEADER_SIZE + i * INDEX_ENTRY_SIZE];
+        put_uint(p, index[i].offset, 8);
+        put_uint(p + 8, (unsigned long long) (index[i].type_id & 0xFFFF), 2);
+        put_uint(p + 10, index[i].timestamp, 8);
+    }
+    bool success = (fwrite(&buf[0], 1, buf.size(), fp) == buf.size());
+    success = (fclose(fp) == 0) && success;
+    if (!success)
+        remove(path.c_str());
+    return success;
+}
+
+void
+get_log_index (const char *log_path, const struct MappedFile *pfile,
+                LogIndex &index) {
+    std::string path = log_index_path(log_path);
+    struct stat st;
+    if (stat(log_path, &st) != 0 || (unsigned long long) st.st_size != pfile->size) {
+        // Cannot tell whether a sidecar is up to date
+        build_log_index(pfile->data, pfile->size, index);
+        return;
+    }
+    long long mtime = get_mtime(st);
+    if (load_log_index(path, pfile->size, mtime, index))
+        return;
+    build_log_index(pfile->data, pfile->size, index);
+    // The index is still usable if it cannot be saved, e.g. in a read-only
+    // directory
+    (void) save_log_index(path, pfile->size, mtime, index);
+}
@@ -0,0 +1,36 @@
+/* log_index.h
+ * Defines the sidecar index of a mi2log file. The index lists the offset,
+ * type ID and device timestamp of every frame, so that a log can be sliced
+ * by time and type without decoding the whole file.
+ */
+
+#ifndef __DM_COLLECTOR_C_LOG_INDEX_H__
+#define __DM_COLLECTOR_C_LOG_INDEX_H__
+
+#include "mapped_file.h"
+
+#include <string>
+#include <vector>
+
+struct LogIndexEntry {
+    unsigned long long offset;      // offset of the escaped frame in the log
+    int type_id;                    // -1 if the frame is not recognized
+    unsigned long long timestamp;   // QCDM timestamp, 0 if not available
+};
+
+typedef std::vector<LogIndexEntry> LogIndex;
+
+// Return: the path of the sidecar index of a log
+std::string log_index_path (const char *log_path);
+
+// Walk through all frames of a log, decoding only packet headers. Compressed
+// logs (see compressed_file.h) are decompressed on the fly.
+void build_log_index (const char *b, size_t length, LogIndex &index);
+
+// Load the sidecar index of a log if it is up to date, i.e. the size and
+// modification time of the log are unchanged. Otherwise build the index from
+// the mapped log, and try to save it as the new sidecar.
+void get_log_index (const char *log_path, const struct MappedFile *pfile,
+                    LogIndex &index);
+
+#endif // __DM_COLLECTOR_C_LOG_INDEX_H__
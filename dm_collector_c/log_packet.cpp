@@ -5,14 +5,17 @@
 
 #include <Python.h>
 #include <datetime.h>
+#include <algorithm>
 #include <map>
 #include <string>
 #include <sstream>
 #include <fstream>
+#include <vector>
 
 #include "consts.h"
 #include "log_packet.h"
 #include "log_packet_helper.h"
+#include "record.h"
 #include "1xev_rx_partial_multirlp_packet.h"
 #include "1xev_connected_state_search_info.h"
 #include "1xev_connection_attempt.h"
@@ -272,7 +275,7 @@ _decode_lte_rrc_serv_cell_info(const char *b, int offset, size_t length,
     return offset - start;
 }
 
-static size_t
+static int
 _decode_lte_nas_plain(const char *b, int offset, size_t length,
                         PyObject *result) {
     int start = offset;
@@ -5028,41 +5031,22 @@ is_debug_packet (const char *b, size_t length) {
     // return length >=2 && (b[0] ==  '\x79');
 }
 
-PyObject *
-decode_log_packet (const char *b, size_t length, bool skip_decoding) {
+// Decodes the rest of a log packet after its fixed fields.
+// Return: number of bytes consumed
+typedef int (*PayloadDecoder) (const char *b, int offset, size_t length,
+                                PyObject *result);
 
-    if (PyDateTimeAPI == NULL)  // import datetime module
-        PyDateTime_IMPORT;
-
-    PyObject *result = NULL;
-    int offset = 0;
-
-    // Parse Header
-    result = PyList_New(0);
-    offset = 0;
-    offset += _decode_by_fmt(LogPacketHeaderFmt, ARRAY_SIZE(LogPacketHeaderFmt, Fmt),
-                                b, offset, length, result);
-    // PyObject *old_result = result;
-    // result = PyList_GetSlice(result, 1, 4); // remove the duplicate "len1" field
-    // Py_DECREF(old_result);
-    // old_result = NULL;
+struct LogPacketDecoder {
+    int type_id;
+    const Fmt *fmt;     // fixed fields of the payload, or NULL
+    int n_fmt;
+    PayloadDecoder decode_payload;  // or NULL
+};
 
-    // Differentiate using type ID
-    LogPacketType type_id = (LogPacketType) _map_result_field_to_name(
-                                result,
-                                "type_id",
-                                LogPacketTypeID_To_Name,
-                                ARRAY_SIZE(LogPacketTypeID_To_Name, ValueName),
-                                "Unsupported");
-
-    if (skip_decoding) {    // skip further decoding
-        return result;
-    }
-
-    switch (type_id) {
-    case CDMA_Paging_Channel_Message:
-        // Not decoded yet.
-        break;
+// How to decode each supported type of log packet.
+static const struct LogPacketDecoder LogPacketDecoders [] = {
+    // Not decoded yet.
+    {CDMA_Paging_Channel_Message, NULL, 0, NULL},
 
     // // Yuanjie: Incomplete support. Disable it temporarily
     // case _1xEV_Signaling_Control_Channel_Broadcast:
@@ -5070,455 +5054,586 @@ decode_log_packet (const char *b, size_t length, bool skip_decoding) {
     //                                 ARRAY_SIZE(_1xEVSignalingFmt, Fmt),
     //                                 b, offset, length, result);
     //     break;
+    {WCDMA_CELL_ID, WcdmaCellIdFmt, ARRAY_SIZE(WcdmaCellIdFmt, Fmt), NULL},
+    {WCDMA_Signaling_Messages,
+        WcdmaSignalingMessagesFmt, ARRAY_SIZE(WcdmaSignalingMessagesFmt, Fmt),
+        _decode_wcdma_signaling_messages},
+    {UMTS_NAS_GMM_State,
+        UmtsNasGmmStateFmt, ARRAY_SIZE(UmtsNasGmmStateFmt, Fmt),
+        _decode_umts_nas_gmm_state},
+    {UMTS_NAS_MM_State,
+        UmtsNasMmStateFmt, ARRAY_SIZE(UmtsNasMmStateFmt, Fmt),
+        _decode_umts_nas_mm_state},
+    {UMTS_NAS_MM_REG_State, UmtsNasMmRegStateFmt, ARRAY_SIZE(UmtsNasMmRegStateFmt, Fmt), NULL},
+    {UMTS_NAS_OTA, UmtsNasOtaFmt, ARRAY_SIZE(UmtsNasOtaFmt, Fmt), _decode_umts_nas_ota},
+    {LTE_RRC_OTA_Packet,
+        LteRrcOtaPacketFmt, ARRAY_SIZE(LteRrcOtaPacketFmt, Fmt),
+        _decode_lte_rrc_ota},
+    {LTE_RRC_MIB_Message_Log_Packet,
+        LteRrcMibMessageLogPacketFmt, ARRAY_SIZE(LteRrcMibMessageLogPacketFmt, Fmt),
+        _decode_lte_rrc_mib},
+    {LTE_RRC_Serv_Cell_Info_Log_Packet,
+        LteRrcServCellInfoLogPacketFmt, ARRAY_SIZE(LteRrcServCellInfoLogPacketFmt, Fmt),
+        _decode_lte_rrc_serv_cell_info},
+    {LTE_NAS_ESM_Plain_OTA_Incoming_Message,
+        LteNasPlainFmt, ARRAY_SIZE(LteNasPlainFmt, Fmt),
+        _decode_lte_nas_plain},
+    {LTE_NAS_ESM_Plain_OTA_Outgoing_Message,
+        LteNasPlainFmt, ARRAY_SIZE(LteNasPlainFmt, Fmt),
+        _decode_lte_nas_plain},
+    {LTE_NAS_EMM_Plain_OTA_Incoming_Message,
+        LteNasPlainFmt, ARRAY_SIZE(LteNasPlainFmt, Fmt),
+        _decode_lte_nas_plain},
+    {LTE_NAS_EMM_Plain_OTA_Outgoing_Message,
+        LteNasPlainFmt, ARRAY_SIZE(LteNasPlainFmt, Fmt),
+        _decode_lte_nas_plain},
+    {LTE_NAS_EMM_State,
+        LteNasEmmStateFmt, ARRAY_SIZE(LteNasEmmStateFmt, Fmt),
+        _decode_lte_nas_emm_state},
+    {LTE_NAS_ESM_State,
+        LteNasEsmStateFmt, ARRAY_SIZE(LteNasEsmStateFmt, Fmt),
+        _decode_lte_nas_esm_state},
+    {LTE_PHY_PDSCH_Demapper_Configuration,
+        LtePhyPdschDemapperConfigFmt, ARRAY_SIZE(LtePhyPdschDemapperConfigFmt, Fmt),
+        _decode_lte_phy_pdsch_demapper_config},
+    {LTE_PHY_Connected_Mode_LTE_Intra_Freq_Meas_Results,
+        LtePhyCmlifmrFmt, ARRAY_SIZE(LtePhyCmlifmrFmt, Fmt),
+        _decode_lte_phy_cmlifmr},
+    {LTE_PHY_Serving_Cell_Measurement_Result,
+        LtePhySubpktFmt, ARRAY_SIZE(LtePhySubpktFmt, Fmt),
+        _decode_lte_phy_subpkt},
+    {LTE_PHY_IRAT_MDB, LtePhyIratFmt, ARRAY_SIZE(LtePhyIratFmt, Fmt), _decode_lte_phy_irat_subpkt},
+    //It shares similar packet format as LTE_PHY_IRAT_MDB
+    {LTE_PHY_CDMA_MEAS,
+        LtePhyIratFmt, ARRAY_SIZE(LtePhyIratFmt, Fmt),
+        _decode_lte_phy_irat_cdma_subpkt},
+    {LTE_PDCP_DL_SRB_Integrity_Data_PDU,
+        LtePdcpDlSrbIntegrityDataPduFmt, ARRAY_SIZE(LtePdcpDlSrbIntegrityDataPduFmt, Fmt),
+        _decode_lte_pdcp_dl_srb_integrity_data_pdu},
+    {LTE_PDCP_UL_SRB_Integrity_Data_PDU,
+        LtePdcpUlSrbIntegrityDataPduFmt, ARRAY_SIZE(LtePdcpUlSrbIntegrityDataPduFmt, Fmt),
+        _decode_lte_pdcp_ul_srb_integrity_data_pdu},
+    {LTE_MAC_Configuration,
+        LteMacConfigurationFmt, ARRAY_SIZE(LteMacConfigurationFmt, Fmt),
+        _decode_lte_mac_configuration_subpkt},  // Jie
+    {LTE_MAC_UL_Transport_Block,
+        LteMacULTransportBlockFmt, ARRAY_SIZE(LteMacULTransportBlockFmt, Fmt),
+        _decode_lte_mac_ul_transportblock_subpkt},  // Jie
+    {LTE_MAC_DL_Transport_Block,
+        LteMacDLTransportBlockFmt, ARRAY_SIZE(LteMacDLTransportBlockFmt, Fmt),
+        _decode_lte_mac_dl_transportblock_subpkt},  // Jie
+    {LTE_MAC_UL_Buffer_Status_Internal,
+        LteMacULBufferStatusInternalFmt, ARRAY_SIZE(LteMacULBufferStatusInternalFmt, Fmt),
+        _decode_lte_mac_ul_bufferstatusinternal_subpkt},  // Jie
+    {LTE_MAC_UL_Tx_Statistics,
+        LteMacULTxStatisticsFmt, ARRAY_SIZE(LteMacULTxStatisticsFmt, Fmt),
+        _decode_lte_mac_ul_txstatistics_subpkt},  // Jie
+    {LTE_RLC_UL_Config_Log_Packet,
+        LteRlcUlConfigLogPacketFmt, ARRAY_SIZE(LteRlcUlConfigLogPacketFmt, Fmt),
+        _decode_lte_rlc_ul_config_log_packet_subpkt},
+    {LTE_RLC_DL_Config_Log_Packet,
+        LteRlcDlConfigLogPacketFmt, ARRAY_SIZE(LteRlcDlConfigLogPacketFmt, Fmt),
+        _decode_lte_rlc_dl_config_log_packet_subpkt},
+    {LTE_RLC_UL_AM_All_PDU,
+        LteRlcUlAmAllPduFmt, ARRAY_SIZE(LteRlcUlAmAllPduFmt, Fmt),
+        _decode_lte_rlc_ul_am_all_pdu_subpkt},
+    {LTE_RLC_DL_AM_All_PDU,
+        LteRlcDlAmAllPduFmt, ARRAY_SIZE(LteRlcDlAmAllPduFmt, Fmt),
+        _decode_lte_rlc_dl_am_all_pdu_subpkt},
+    {LTE_MAC_Rach_Trigger,
+        LteMacRachTriggerFmt, ARRAY_SIZE(LteMacRachTriggerFmt, Fmt),
+        _decode_lte_mac_rach_trigger_subpkt},
+    {LTE_MAC_Rach_Attempt,
+        LteMacRachAttempt_Fmt, ARRAY_SIZE(LteMacRachAttempt_Fmt, Fmt),
+        _decode_lte_mac_rach_attempt_subpkt},
+    {LTE_PDCP_DL_Config,
+        LtePdcpDlConfig_Fmt, ARRAY_SIZE(LtePdcpDlConfig_Fmt, Fmt),
+        _decode_lte_pdcp_dl_config_subpkt},
+    {LTE_PDCP_UL_Config,
+        LtePdcpUlConfig_Fmt, ARRAY_SIZE(LtePdcpUlConfig_Fmt, Fmt),
+        _decode_lte_pdcp_ul_config_subpkt},
+    {LTE_PDCP_UL_Data_PDU,
+        LtePdcpUlDataPdu_Fmt, ARRAY_SIZE(LtePdcpUlDataPdu_Fmt, Fmt),
+        _decode_lte_pdcp_ul_data_pdu_subpkt},
+    {LTE_PDCP_DL_Stats,
+        LtePdcpDlStats_Fmt, ARRAY_SIZE(LtePdcpDlStats_Fmt, Fmt),
+        _decode_lte_pdcp_dl_stats_subpkt},
+    {LTE_PDCP_UL_Stats,
+        LtePdcpUlStats_Fmt, ARRAY_SIZE(LtePdcpUlStats_Fmt, Fmt),
+        _decode_lte_pdcp_ul_stats_subpkt},
+    {LTE_RLC_UL_Stats,
+        LteRlcUlStats_Fmt, ARRAY_SIZE(LteRlcUlStats_Fmt, Fmt),
+        _decode_lte_rlc_ul_stats_subpkt},
+    {LTE_RLC_DL_Stats,
+        LteRlcDlStats_Fmt, ARRAY_SIZE(LteRlcDlStats_Fmt, Fmt),
+        _decode_lte_rlc_dl_stats_subpkt},
+    {LTE_PDCP_DL_Ctrl_PDU,
+        LtePdcpDlCtrlPdu_Fmt, ARRAY_SIZE(LtePdcpDlCtrlPdu_Fmt, Fmt),
+        _decode_lte_pdcp_dl_ctrl_pdu_subpkt},
+    {LTE_PDCP_UL_Ctrl_PDU,
+        LtePdcpDlCtrlPdu_Fmt, ARRAY_SIZE(LtePdcpDlCtrlPdu_Fmt, Fmt),
+        _decode_lte_pdcp_ul_ctrl_pdu_subpkt},
+    {LTE_PUCCH_Power_Control,
+        LtePucchPowerControl_Fmt, ARRAY_SIZE(LtePucchPowerControl_Fmt, Fmt),
+        _decode_lte_pucch_power_control_payload},
+    {LTE_PUSCH_Power_Control,
+        LtePuschPowerControl_Fmt, ARRAY_SIZE(LtePuschPowerControl_Fmt, Fmt),
+        _decode_lte_pusch_power_control_payload},
+    {LTE_PDCCH_PHICH_Indication_Report,
+        LtePdcchPhichIndicationReport_Fmt, ARRAY_SIZE(LtePdcchPhichIndicationReport_Fmt, Fmt),
+        _decode_lte_pdcch_phich_indication_report_payload},
+    {_1xEV_Rx_Partial_MultiRLP_Packet,
+        _1xEVRxPartialMultiRLPPacket_Fmt, ARRAY_SIZE(_1xEVRxPartialMultiRLPPacket_Fmt, Fmt),
+        _decode_1xev_rx_partial_multirlp_packet_payload},
+    {_1xEV_Connected_State_Search_Info,
+        _1xEVConnectedStateSearchInfo_Fmt, ARRAY_SIZE(_1xEVConnectedStateSearchInfo_Fmt, Fmt),
+        _decode_1xev_connected_state_search_info_payload},
+    {_1xEV_Connection_Attempt,
+        _1xEVConnectionAttempt_Fmt, ARRAY_SIZE(_1xEVConnectionAttempt_Fmt, Fmt),
+        _decode_1xev_connection_attempt_payload},
+    {_1xEV_Connection_Release,
+        _1xEVConnectionRelease_Fmt, ARRAY_SIZE(_1xEVConnectionRelease_Fmt, Fmt),
+        _decode_1xev_connection_release_payload},
+    {LTE_PDSCH_Stat_Indication,
+        LtePdschStatIndication_Fmt, ARRAY_SIZE(LtePdschStatIndication_Fmt, Fmt),
+        _decode_lte_pdsch_stat_indication_payload},
+    {LTE_PHY_System_Scan_Results,
+        LtePhySystemScanResults_Fmt, ARRAY_SIZE(LtePhySystemScanResults_Fmt, Fmt),
+        _decode_lte_phy_system_scan_results_payload},
+    {LTE_PHY_BPLMN_Cell_Request,
+        LtePhyBplmnCellRequest_Fmt, ARRAY_SIZE(LtePhyBplmnCellRequest_Fmt, Fmt),
+        _decode_lte_phy_bplmn_cell_request_payload},
+    {LTE_PHY_BPLMN_Cell_Confirm,
+        LtePhyBplmnCellConfirm_Fmt, ARRAY_SIZE(LtePhyBplmnCellConfirm_Fmt, Fmt),
+        _decode_lte_phy_bplmn_cell_confirm_payload},
+    {LTE_PHY_Serving_Cell_COM_Loop,
+        LtePhyServingCellComLoop_Fmt, ARRAY_SIZE(LtePhyServingCellComLoop_Fmt, Fmt),
+        _decode_lte_phy_serving_cell_com_loop_payload},
+    {LTE_PHY_PDCCH_Decoding_Result,
+        LtePhyPdcchDecodingResult_Fmt, ARRAY_SIZE(LtePhyPdcchDecodingResult_Fmt, Fmt),
+        _decode_lte_phy_pdcch_decoding_result_payload},
+    {LTE_PHY_PDSCH_Decoding_Result,
+        LtePhyPdschDecodingResult_Fmt, ARRAY_SIZE(LtePhyPdschDecodingResult_Fmt, Fmt),
+        _decode_lte_phy_pdsch_decoding_result_payload},
+    {LTE_PHY_PUSCH_Tx_Report,
+        LtePhyPuschTxReport_Fmt, ARRAY_SIZE(LtePhyPuschTxReport_Fmt, Fmt),
+        _decode_lte_phy_pusch_tx_report_payload},
+    {LTE_PHY_RLM_Report,
+        LtePhyRlmReport_Fmt, ARRAY_SIZE(LtePhyRlmReport_Fmt, Fmt),
+        _decode_lte_phy_rlm_report_payload},
+    {LTE_PHY_PUSCH_CSF,
+        LtePhyPuschCsf_Fmt, ARRAY_SIZE(LtePhyPuschCsf_Fmt, Fmt),
+        _decode_lte_phy_pusch_csf_payload},
+    {LTE_PHY_CDRX_Events_Info,
+        LtePhyCdrxEventsInfo_Fmt, ARRAY_SIZE(LtePhyCdrxEventsInfo_Fmt, Fmt),
+        _decode_lte_phy_cdrx_events_info_payload},
+    {WCDMA_RRC_States, NULL, 0, _decode_wcdma_rrc_states_payload},
+    {LTE_PHY_Idle_Neighbor_Cell_Meas,
+        LtePhyIncm_Fmt, ARRAY_SIZE(LtePhyIncm_Fmt, Fmt),
+        _decode_lte_phy_idle_neighbor_cell_meas_payload},
+    {WCDMA_Search_Cell_Reselection_Rank,
+        WcdmaScrr_Fmt, ARRAY_SIZE(WcdmaScrr_Fmt, Fmt),
+        _decode_wcdma_scrr_payload},
+    {GSM_RR_Cell_Information,
+        GsmRrCellInfo_Fmt, ARRAY_SIZE(GsmRrCellInfo_Fmt, Fmt),
+        _decode_gsm_rci_payload},
+    {GSM_Surround_Cell_BA_List,
+        GsmScbl_Fmt, ARRAY_SIZE(GsmScbl_Fmt, Fmt),
+        _decode_gsm_scbl_payload},
+    {GSM_RR_Cell_Reselection_Meas,
+        GsmRrCellResMeas_Fmt, ARRAY_SIZE(GsmRrCellResMeas_Fmt, Fmt),
+        _decode_gsm_rcrm_payload},
+    {Srch_TNG_1x_Searcher_Dump,
+        SrchTng1xsd_Fmt, ARRAY_SIZE(SrchTng1xsd_Fmt, Fmt),
+        _decode_srch_tng_1xsd_payload},
+    {_1xEVDO_Multi_Carrier_Pilot_Sets,
+        _1xEvdoMcps_Fmt, ARRAY_SIZE(_1xEvdoMcps_Fmt, Fmt),
+        _decode_1xevdo_mcps_payload},
+    {LTE_PHY_PUCCH_Tx_Report,
+        LtePhyPucchTxReport_Fmt, ARRAY_SIZE(LtePhyPucchTxReport_Fmt, Fmt),
+        _decode_lte_phy_pucch_tx_report_payload},
+    {LTE_PDCP_DL_Cipher_Data_PDU,
+        LtePdcpDlCipherDataPdu_Fmt, ARRAY_SIZE(LtePdcpDlCipherDataPdu_Fmt, Fmt),
+        _decode_lte_pdcp_dl_cipher_data_pdu_payload},
+    {LTE_PDCP_UL_Cipher_Data_PDU,
+        LtePdcpUlCipherDataPdu_Fmt, ARRAY_SIZE(LtePdcpUlCipherDataPdu_Fmt, Fmt),
+        _decode_lte_pdcp_ul_cipher_data_pdu_payload},
+    {LTE_PHY_PUCCH_CSF,
+        LtePhyPucchCsf_Fmt, ARRAY_SIZE(LtePhyPucchCsf_Fmt, Fmt),
+        _decode_lte_phy_pucch_csf_payload},
+};
+
+// Slot of each type ID in LogPacketDecoders, plus one. 0 means unsupported.
+static unsigned char LogPacketDecoderSlots [65536];
+static bool LogPacketDecoderSlotsBuilt = false;
+
+// Must be called with the GIL held.
+// Return: how to decode the given type of log packet, or NULL if unsupported
+static const struct LogPacketDecoder *
+find_log_packet_decoder (int type_id) {
+    if (!LogPacketDecoderSlotsBuilt) {
+        int n = ARRAY_SIZE(LogPacketDecoders, LogPacketDecoder);
+        for (int i = 0; i < n; i++)
+            LogPacketDecoderSlots[LogPacketDecoders[i].type_id] = i + 1;
+        LogPacketDecoderSlotsBuilt = true;
+    }
+    if (type_id < 0 || type_id > 0xffff || LogPacketDecoderSlots[type_id] == 0)
+        return NULL;
+    return &LogPacketDecoders[LogPacketDecoderSlots[type_id] - 1];
+}
 
-    case WCDMA_CELL_ID:
-        offset += _decode_by_fmt(WcdmaCellIdFmt,
-                                    ARRAY_SIZE(WcdmaCellIdFmt, Fmt),
-                                    b, offset, length, result);
-        break;
-
-    case WCDMA_Signaling_Messages:
-        offset += _decode_by_fmt(WcdmaSignalingMessagesFmt,
-                                    ARRAY_SIZE(WcdmaSignalingMessagesFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_wcdma_signaling_messages(b, offset, length, result);
-        break;
-
-    case UMTS_NAS_GMM_State:
-        offset += _decode_by_fmt(UmtsNasGmmStateFmt,
-                                    ARRAY_SIZE(UmtsNasGmmStateFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_umts_nas_gmm_state(b, offset, length, result);
-        break;
-
-    case UMTS_NAS_MM_State:
-        offset += _decode_by_fmt(UmtsNasMmStateFmt,
-                                    ARRAY_SIZE(UmtsNasMmStateFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_umts_nas_mm_state(b, offset, length, result);
-        break;
+// Options of the packet being decoded. Packets are decoded one at a time
+// with the GIL held.
+static DecodingOptions g_decoding_options = DEFAULT_DECODING_OPTIONS;
 
-    case UMTS_NAS_MM_REG_State:
-        offset += _decode_by_fmt(UmtsNasMmRegStateFmt,
-                                    ARRAY_SIZE(UmtsNasMmRegStateFmt, Fmt),
-                                    b, offset, length, result);
-        break;
+PyObject *
+decode_qcdm_timestamp (unsigned long long ticks) {
+    const double PER_SECOND = 52428800.0;
+    const double PER_USECOND = 52428800.0 / 1.0e6;
+    const double QCDM_EPOCH_IN_POSIX = 315964800.0;    // 1980-01-06
+    if (g_decoding_options.timestamp_format == TIMESTAMP_TICKS)
+        return PyLong_FromUnsignedLongLong(ticks);
+    int seconds = int(double(ticks) / PER_SECOND);
+    int useconds = (double(ticks) / PER_USECOND) - double(seconds) * 1.0e6;
+    if (g_decoding_options.timestamp_format == TIMESTAMP_EPOCH)
+        return PyFloat_FromDouble(QCDM_EPOCH_IN_POSIX + seconds + useconds / 1.0e6);
+    PyObject *epoch = PyDateTime_FromDateAndTime(1980, 1, 6, 0, 0, 0, 0);
+    PyObject *delta = PyDelta_FromDSU(0, seconds, useconds);
+    PyObject *ret = PyNumber_Add(epoch, delta);
+    Py_DECREF(epoch);
+    Py_DECREF(delta);
+    return ret;
+}
 
-    case UMTS_NAS_OTA:
-        offset += _decode_by_fmt(UmtsNasOtaFmt,
-                                    ARRAY_SIZE(UmtsNasOtaFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_umts_nas_ota(b, offset, length, result);
-        break;
+PyObject *
+decode_byte_stream (const char *p, int length, bool little_endian) {
+    static const char HEX_DIGITS[] = "0123456789abcdef";
+    if (g_decoding_options.byte_stream_format == BYTE_STREAM_BYTES) {
+        PyObject *ret = PyByteArray_FromStringAndSize(NULL, length);
+        if (ret == NULL)
+            return NULL;
+        char *out = PyByteArray_AS_STRING(ret);
+        for (int k = 0; k < length; k++)
+            out[k] = p[little_endian? length - 1 - k: k];
+        return ret;
+    }
+    PyObject *ret = PyString_FromStringAndSize(NULL, 2 + 2 * length);
+    if (ret == NULL)
+        return NULL;
+    char *out = PyString_AS_STRING(ret);
+    *out++ = '0';
+    *out++ = 'x';
+    for (int k = 0; k < length; k++) {
+        unsigned char c = p[little_endian? length - 1 - k: k];
+        *out++ = HEX_DIGITS[c >> 4];
+        *out++ = HEX_DIGITS[c & 0x0F];
+    }
+    return ret;
+}
 
-    case LTE_RRC_OTA_Packet:
-        offset += _decode_by_fmt(LteRrcOtaPacketFmt,
-                                    ARRAY_SIZE(LteRrcOtaPacketFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_rrc_ota(b, offset, length, result);
-        break;
+// Hash table of the strings returned by intern_static_name(), by the
+// addresses of their C strings. Collisions are resolved by linear probing.
+struct StaticNameTable {
+    std::vector<const char *> keys;     // NULL if the slot is empty
+    std::vector<PyObject *> values;
+    size_t n;
+    size_t mask;
+};
 
-    case LTE_RRC_MIB_Message_Log_Packet:
-        offset += _decode_by_fmt(LteRrcMibMessageLogPacketFmt,
-                                    ARRAY_SIZE(LteRrcMibMessageLogPacketFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_rrc_mib(b, offset, length, result);
-        break;
+// Only used with the GIL held
+static StaticNameTable g_static_names;
 
-    case LTE_RRC_Serv_Cell_Info_Log_Packet:
-        offset += _decode_by_fmt(LteRrcServCellInfoLogPacketFmt,
-                                    ARRAY_SIZE(LteRrcServCellInfoLogPacketFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_rrc_serv_cell_info(b, offset, length, result);
-        break;
+static size_t
+hash_address (const char *p) {
+    return ((size_t) p >> 3) * 2654435761u;
+}
 
-    case LTE_NAS_ESM_Plain_OTA_Incoming_Message:
-    case LTE_NAS_ESM_Plain_OTA_Outgoing_Message:
-    case LTE_NAS_EMM_Plain_OTA_Incoming_Message:
-    case LTE_NAS_EMM_Plain_OTA_Outgoing_Message:
-        offset += _decode_by_fmt(LteNasPlainFmt,
-                                    ARRAY_SIZE(LteNasPlainFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_nas_plain(b, offset, length, result);
-        break;
+static void
+insert_static_name (StaticNameTable &table, const char *key, PyObject *value) {
+    size_t slot = hash_address(key) & table.mask;
+    while (table.keys[slot] != NULL)
+        slot = (slot + 1) & table.mask;
+    table.keys[slot] = key;
+    table.values[slot] = value;
+    table.n++;
+}
 
-    case LTE_NAS_EMM_State:
-        offset += _decode_by_fmt(LteNasEmmStateFmt,
-                                    ARRAY_SIZE(LteNasEmmStateFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_nas_emm_state(b, offset, length, result);
-        break;
+PyObject *
+intern_static_name (const char *name) {
+    StaticNameTable &table = g_static_names;
+    if (!table.keys.empty()) {
+        size_t slot = hash_address(name) & table.mask;
+        while (table.keys[slot] != NULL) {
+            if (table.keys[slot] == name)
+                return table.values[slot];
+            slot = (slot + 1) & table.mask;
+        }
+    }
+    PyObject *value = PyString_FromString(name);
+    if (value == NULL)
+        return NULL;
+    PyString_InternInPlace(&value);
+    // Keep the load factor under 1/2
+    if ((table.n + 1) * 2 > table.keys.size()) {
+        StaticNameTable grown;
+        size_t capacity = std::max((size_t) 1024, table.keys.size() * 2);
+        grown.keys.assign(capacity, (const char *) NULL);
+        grown.values.assign(capacity, (PyObject *) NULL);
+        grown.n = 0;
+        grown.mask = capacity - 1;
+        for (size_t i = 0; i < table.keys.size(); i++) {
+            if (table.keys[i] != NULL)
+                insert_static_name(grown, table.keys[i], table.values[i]);
+        }
+        table.keys.swap(grown.keys);
+        table.values.swap(grown.values);
+        table.n = grown.n;
+        table.mask = grown.mask;
+    }
+    insert_static_name(table, name, value);
+    return value;
+}
 
-    case LTE_NAS_ESM_State:
-        offset += _decode_by_fmt(LteNasEsmStateFmt,
-                                    ARRAY_SIZE(LteNasEsmStateFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_nas_esm_state(b, offset, length, result);
-        break;
+// Index of a result list: the position of the first field of each name among
+// the first n_indexed fields
+struct ResultIndex {
+    PyObject *positions;    // dict: field name -> int
+    Py_ssize_t n_indexed;
+};
+
+// Indexes by the addresses of the lists. Each indexed list is referenced
+// here, so that its address is not reused by another list while indexed.
+// Only used with the GIL held.
+typedef std::map<PyObject *, ResultIndex> ResultIndexTable;
+static ResultIndexTable g_result_indexes;
+
+// Lists kept indexed at most, in case clear_result_indexes() is not called
+static const size_t MAX_INDEXED_RESULTS = 256;
+
+static void
+_release_result_index (ResultIndexTable::iterator it) {
+    Py_DECREF(it->second.positions);
+    Py_DECREF(it->first);
+    g_result_indexes.erase(it);
+}
 
-    case LTE_PHY_PDSCH_Demapper_Configuration:
-        offset += _decode_by_fmt(LtePhyPdschDemapperConfigFmt,
-                                    ARRAY_SIZE(LtePhyPdschDemapperConfigFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_phy_pdsch_demapper_config(b, offset, length, result);
-        break;
+int
+find_indexed_result_field (PyObject *result, const char *target) {
+    assert(PyList_CheckExact(result));
+    PyObject *key = intern_static_name(target);
+    if (key == NULL) {
+        PyErr_Clear();
+        return -2;
+    }
 
-    case LTE_PHY_Connected_Mode_LTE_Intra_Freq_Meas_Results:
-        offset += _decode_by_fmt(LtePhyCmlifmrFmt,
-                                    ARRAY_SIZE(LtePhyCmlifmrFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_phy_cmlifmr(b, offset, length, result);
-        break;
+    ResultIndexTable::iterator it = g_result_indexes.find(result);
+    if (it == g_result_indexes.end()) {
+        if (g_result_indexes.size() >= MAX_INDEXED_RESULTS)
+            clear_result_indexes();
+        ResultIndex index;
+        index.positions = PyDict_New();
+        if (index.positions == NULL) {
+            PyErr_Clear();
+            return -2;
+        }
+        index.n_indexed = 0;
+        Py_INCREF(result);
+        it = g_result_indexes.insert(std::make_pair(result, index)).first;
+    }
 
-    case LTE_PHY_Serving_Cell_Measurement_Result:
-        offset += _decode_by_fmt(LtePhySubpktFmt,
-                                    ARRAY_SIZE(LtePhySubpktFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_phy_subpkt(b, offset, length, result);
-        break;
+    ResultIndex &index = it->second;
+    Py_ssize_t n = PyList_GET_SIZE(result);
+    if (n < index.n_indexed) {  // not expected, start over
+        PyDict_Clear(index.positions);
+        index.n_indexed = 0;
+    }
+    for (; index.n_indexed < n; index.n_indexed++) {
+        PyObject *t = PyList_GET_ITEM(result, index.n_indexed);
+        PyObject *name = NULL;
+        if (PyTuple_CheckExact(t) && PyTuple_GET_SIZE(t) > 0)
+            name = PyTuple_GET_ITEM(t, 0);
+        if (name == NULL || !PyString_CheckExact(name)) {
+            _release_result_index(it);
+            return -2;
+        }
+        if (PyDict_GetItem(index.positions, name) != NULL)
+            continue;   // only the first field of a name is found
+        PyObject *pos = PyInt_FromSsize_t(index.n_indexed);
+        int err = (pos == NULL)? -1: PyDict_SetItem(index.positions, name, pos);
+        Py_XDECREF(pos);
+        if (err < 0) {
+            PyErr_Clear();
+            _release_result_index(it);
+            return -2;
+        }
+    }
 
-    case LTE_PHY_IRAT_MDB:
-        offset += _decode_by_fmt(LtePhyIratFmt,
-                                    ARRAY_SIZE(LtePhyIratFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_phy_irat_subpkt(b, offset, length, result);
-        break;
+    PyObject *pos = PyDict_GetItem(index.positions, key);
+    return (pos == NULL)? -1: (int) PyInt_AS_LONG(pos);
+}
 
-    case LTE_PHY_CDMA_MEAS:
-        //It shares similar packet format as LTE_PHY_IRAT_MDB
-        offset += _decode_by_fmt(LtePhyIratFmt,
-                                    ARRAY_SIZE(LtePhyIratFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_phy_irat_cdma_subpkt(b, offset, length, result);
-        break;
+void
+clear_result_indexes () {
+    while (!g_result_indexes.empty())
+        _release_result_index(g_result_indexes.begin());
+}
 
-    case LTE_PDCP_DL_SRB_Integrity_Data_PDU:
-        offset += _decode_by_fmt(LtePdcpDlSrbIntegrityDataPduFmt,
-                                    ARRAY_SIZE(LtePdcpDlSrbIntegrityDataPduFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_pdcp_dl_srb_integrity_data_pdu(b, offset, length, result);
-        break;
+PyObject *
+decode_log_packet (const char *b, size_t length, bool skip_decoding,
+                    const DecodingOptions &options) {
 
-    case LTE_PDCP_UL_SRB_Integrity_Data_PDU:
-        offset += _decode_by_fmt(LtePdcpUlSrbIntegrityDataPduFmt,
-                                    ARRAY_SIZE(LtePdcpUlSrbIntegrityDataPduFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_pdcp_ul_srb_integrity_data_pdu(b, offset, length, result);
-        break;
+    if (PyDateTimeAPI == NULL)  // import datetime module
+        PyDateTime_IMPORT;
+    g_decoding_options = options;
 
-    case LTE_MAC_Configuration:// Jie
-        offset += _decode_by_fmt(LteMacConfigurationFmt, ARRAY_SIZE(LteMacConfigurationFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_mac_configuration_subpkt(b, offset, length, result);
-        break;
+    PyObject *result = NULL;
+    int offset = 0;
 
-    case LTE_MAC_UL_Transport_Block:// Jie
-        offset += _decode_by_fmt(LteMacULTransportBlockFmt, ARRAY_SIZE(LteMacULTransportBlockFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_mac_ul_transportblock_subpkt(b, offset, length, result);
-        break;
+    // Parse Header
+    result = PyList_New(0);
+    offset = 0;
+    offset += _decode_by_fmt(LogPacketHeaderFmt, ARRAY_SIZE(LogPacketHeaderFmt, Fmt),
+                                b, offset, length, result);
+    // PyObject *old_result = result;
+    // result = PyList_GetSlice(result, 1, 4); // remove the duplicate "len1" field
+    // Py_DECREF(old_result);
+    // old_result = NULL;
 
-    case LTE_MAC_DL_Transport_Block:// Jie
-        offset += _decode_by_fmt(LteMacDLTransportBlockFmt,
-                                    ARRAY_SIZE(LteMacDLTransportBlockFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_mac_dl_transportblock_subpkt(b, offset, length, result);
-        break;
+    // Differentiate using type ID
+    LogPacketType type_id = (LogPacketType) _map_result_field_to_name(
+                                result,
+                                "type_id",
+                                LogPacketTypeID_To_Name,
+                                ARRAY_SIZE(LogPacketTypeID_To_Name, ValueName),
+                                "Unsupported");
 
-    case LTE_MAC_UL_Buffer_Status_Internal:// Jie
-        offset += _decode_by_fmt(LteMacULBufferStatusInternalFmt,
-                                    ARRAY_SIZE(LteMacULBufferStatusInternalFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_mac_ul_bufferstatusinternal_subpkt(b, offset, length, result);
-        break;
-    case LTE_MAC_UL_Tx_Statistics:// Jie
-        offset += _decode_by_fmt(LteMacULTxStatisticsFmt,
-                                    ARRAY_SIZE(LteMacULTxStatisticsFmt, Fmt),
-                                    b, offset, length, result);
-        offset += _decode_lte_mac_ul_txstatistics_subpkt(b, offset, length, result);
-        break;
+    if (skip_decoding) {    // skip further decoding
+        return result;
+    }
 
-    case LTE_RLC_UL_Config_Log_Packet:
-        offset += _decode_by_fmt(LteRlcUlConfigLogPacketFmt,
-                ARRAY_SIZE(LteRlcUlConfigLogPacketFmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_rlc_ul_config_log_packet_subpkt(b, offset,
-                length, result);
-        break;
+    const struct LogPacketDecoder *decoder = find_log_packet_decoder(type_id);
+    if (decoder != NULL) {
+        if (decoder->fmt != NULL)
+            offset += _decode_by_fmt(decoder->fmt, decoder->n_fmt,
+                                        b, offset, length, result);
+        if (decoder->decode_payload != NULL)
+            offset += decoder->decode_payload(b, offset, length, result);
+    }
+    clear_result_indexes();
+    return result;
+}
 
-    case LTE_RLC_DL_Config_Log_Packet:
-        offset += _decode_by_fmt(LteRlcDlConfigLogPacketFmt,
-                ARRAY_SIZE(LteRlcDlConfigLogPacketFmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_rlc_dl_config_log_packet_subpkt(b, offset,
-                length, result);
-        break;
+// What a result list is converted into
+enum ConvertedResult {
+    CONVERTED_DICT = 0,
+    CONVERTED_TUPLE,    // of values
+    CONVERTED_RECORD
+};
+
+static PyObject *_convert_result_list (PyObject *result, int converted_to,
+                                        PyObject *raw_msgs, int record_format);
+
+// Convert the value of a field in a result list according to its type.
+// in_list is set if the field is an element of a list.
+// Return: New reference, or NULL on error
+static PyObject *
+_convert_result_value (PyObject *value, const char *type_str, bool in_list,
+                        int record_format) {
+    if (strcmp(type_str, "dict") == 0) {
+        bool to_record = (in_list && record_format == RECORD_RECORD);
+        return _convert_result_list(value,
+                                    (to_record? CONVERTED_RECORD: CONVERTED_DICT),
+                                    NULL, record_format);
+    } else if (strcmp(type_str, "list") == 0) {
+        return _convert_result_list(value, CONVERTED_TUPLE, NULL, record_format);
+    }
+    Py_INCREF(value);
+    return value;
+}
 
-    case LTE_RLC_UL_AM_All_PDU:
-        offset += _decode_by_fmt(LteRlcUlAmAllPduFmt,
-                ARRAY_SIZE(LteRlcUlAmAllPduFmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_rlc_ul_am_all_pdu_subpkt(b, offset,
-                length, result);
-        break;
+// Build a record of the fields of a result list, converted by
+// _convert_result_value().
+// Return: New reference, or NULL on error
+static PyObject *
+_convert_result_list_to_record (PyObject *result, int record_format) {
+    Py_ssize_t n = PyList_GET_SIZE(result);
+    std::vector<PyObject *> names(n), values(n);
+    for (Py_ssize_t i = 0; i < n; i++) {
+        PyObject *name = NULL, *value = NULL;
+        const char *type_str = NULL;
+        PyObject *converted = NULL;
+        if (PyArg_ParseTuple(PyList_GET_ITEM(result, i), "OOs", &name, &value, &type_str))
+            converted = _convert_result_value(value, type_str, false, record_format);
+        if (converted == NULL) {
+            for (Py_ssize_t j = 0; j < i; j++)
+                Py_DECREF(values[j]);
+            return NULL;
+        }
+        names[i] = name;    // borrowed from result
+        values[i] = converted;
+    }
+    return record_new(n > 0? &names[0]: NULL, n > 0? &values[0]: NULL, n);
+}
 
-    case LTE_RLC_DL_AM_All_PDU:
-        offset += _decode_by_fmt(LteRlcDlAmAllPduFmt,
-                ARRAY_SIZE(LteRlcDlAmAllPduFmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_rlc_dl_am_all_pdu_subpkt(b, offset,
-                length, result);
-        break;
+// Convert a result list into a dict, a tuple of values or a record.
+// If raw_msgs is not NULL, "raw_msg/TYPE" fields are appended to it instead.
+// Return: New reference, or NULL on error
+static PyObject *
+_convert_result_list (PyObject *result, int converted_to, PyObject *raw_msgs,
+                        int record_format) {
+    if (!PyList_Check(result)) {
+        PyErr_SetString(PyExc_TypeError, "Result is not a list.");
+        return NULL;
+    }
+    if (converted_to == CONVERTED_RECORD)
+        return _convert_result_list_to_record(result, record_format);
+    bool to_dict = (converted_to == CONVERTED_DICT);
+    Py_ssize_t n = PyList_GET_SIZE(result);
+    PyObject *ret = (to_dict? PyDict_New(): PyTuple_New(n));
+    if (ret == NULL)
+        return NULL;
+    Py_ssize_t n_values = 0;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        PyObject *t = PyList_GET_ITEM(result, i);
+        PyObject *name = NULL, *value = NULL;
+        const char *type_str = NULL;
+        if (!PyArg_ParseTuple(t, "OOs", &name, &value, &type_str)) {
+            Py_DECREF(ret);
+            return NULL;
+        }
+        if (raw_msgs != NULL && strncmp(type_str, "raw_msg/", 8) == 0) {
+            PyList_Append(raw_msgs, t);
+            continue;
+        }
+        PyObject *converted = _convert_result_value(value, type_str, !to_dict,
+                                                    record_format);
+        if (converted == NULL) {
+            Py_DECREF(ret);
+            return NULL;
+        }
+        if (to_dict) {
+            PyDict_SetItem(ret, name, converted);
+            Py_DECREF(converted);
+        } else {
+            PyTuple_SET_ITEM(ret, n_values++, converted);  // steals reference
+        }
+    }
+    return ret;
+}
 
-    case LTE_MAC_Rach_Trigger:
-        offset += _decode_by_fmt(LteMacRachTriggerFmt,
-                ARRAY_SIZE(LteMacRachTriggerFmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_mac_rach_trigger_subpkt(b, offset, length,
-                result);
-        break;
-    case LTE_MAC_Rach_Attempt:
-        offset += _decode_by_fmt(LteMacRachAttempt_Fmt,
-                ARRAY_SIZE(LteMacRachAttempt_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_mac_rach_attempt_subpkt(b, offset, length,
-                result);
-        break;
-    case LTE_PDCP_DL_Config:
-        offset += _decode_by_fmt(LtePdcpDlConfig_Fmt,
-                ARRAY_SIZE(LtePdcpDlConfig_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcp_dl_config_subpkt(b, offset, length, result);
-        break;
-    case LTE_PDCP_UL_Config:
-        offset += _decode_by_fmt(LtePdcpUlConfig_Fmt,
-                ARRAY_SIZE(LtePdcpUlConfig_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcp_ul_config_subpkt(b, offset, length, result);
-        break;
-    case LTE_PDCP_UL_Data_PDU:
-        offset += _decode_by_fmt(LtePdcpUlDataPdu_Fmt,
-                ARRAY_SIZE(LtePdcpUlDataPdu_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcp_ul_data_pdu_subpkt(b, offset, length, result);
-        break;
-    case LTE_PDCP_DL_Stats:
-        offset += _decode_by_fmt(LtePdcpDlStats_Fmt,
-                ARRAY_SIZE(LtePdcpDlStats_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcp_dl_stats_subpkt(b, offset, length, result);
-        break;
-    case LTE_PDCP_UL_Stats:
-        offset += _decode_by_fmt(LtePdcpUlStats_Fmt,
-                ARRAY_SIZE(LtePdcpUlStats_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcp_ul_stats_subpkt(b, offset, length, result);
-        break;
-    case LTE_RLC_UL_Stats:
-        offset += _decode_by_fmt(LteRlcUlStats_Fmt,
-                ARRAY_SIZE(LteRlcUlStats_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_rlc_ul_stats_subpkt(b, offset, length, result);
-        break;
-    case LTE_RLC_DL_Stats:
-        offset += _decode_by_fmt(LteRlcDlStats_Fmt,
-                ARRAY_SIZE(LteRlcDlStats_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_rlc_dl_stats_subpkt(b, offset, length, result);
-        break;
-    case LTE_PDCP_DL_Ctrl_PDU:
-        offset += _decode_by_fmt(LtePdcpDlCtrlPdu_Fmt,
-                ARRAY_SIZE(LtePdcpDlCtrlPdu_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcp_dl_ctrl_pdu_subpkt(b, offset, length, result);
-        break;
-    case LTE_PDCP_UL_Ctrl_PDU:
-        offset += _decode_by_fmt(LtePdcpDlCtrlPdu_Fmt,
-                ARRAY_SIZE(LtePdcpDlCtrlPdu_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcp_ul_ctrl_pdu_subpkt(b, offset, length, result);
-        break;
-    case LTE_PUCCH_Power_Control:
-        offset += _decode_by_fmt(LtePucchPowerControl_Fmt,
-                ARRAY_SIZE(LtePucchPowerControl_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pucch_power_control_payload(b, offset, length, result);
-        break;
-    case LTE_PUSCH_Power_Control:
-        offset += _decode_by_fmt(LtePuschPowerControl_Fmt,
-                ARRAY_SIZE(LtePuschPowerControl_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pusch_power_control_payload(b, offset, length, result);
-        break;
-    case LTE_PDCCH_PHICH_Indication_Report:
-        offset += _decode_by_fmt(LtePdcchPhichIndicationReport_Fmt,
-                ARRAY_SIZE(LtePdcchPhichIndicationReport_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcch_phich_indication_report_payload(b, offset, length, result);
-        break;
-    case _1xEV_Rx_Partial_MultiRLP_Packet:
-        offset += _decode_by_fmt(_1xEVRxPartialMultiRLPPacket_Fmt,
-                ARRAY_SIZE(_1xEVRxPartialMultiRLPPacket_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_1xev_rx_partial_multirlp_packet_payload(b, offset, length, result);
-        break;
-    case _1xEV_Connected_State_Search_Info:
-        offset += _decode_by_fmt(_1xEVConnectedStateSearchInfo_Fmt,
-                ARRAY_SIZE(_1xEVConnectedStateSearchInfo_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_1xev_connected_state_search_info_payload(b, offset, length, result);
-        break;
-    case _1xEV_Connection_Attempt:
-        offset += _decode_by_fmt(_1xEVConnectionAttempt_Fmt,
-                ARRAY_SIZE(_1xEVConnectionAttempt_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_1xev_connection_attempt_payload(b, offset, length, result);
-        break;
-    case _1xEV_Connection_Release:
-        offset += _decode_by_fmt(_1xEVConnectionRelease_Fmt,
-                ARRAY_SIZE(_1xEVConnectionRelease_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_1xev_connection_release_payload(b, offset, length, result);
-        break;
-    case LTE_PDSCH_Stat_Indication:
-        offset += _decode_by_fmt(LtePdschStatIndication_Fmt,
-                ARRAY_SIZE(LtePdschStatIndication_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdsch_stat_indication_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_System_Scan_Results:
-        offset += _decode_by_fmt(LtePhySystemScanResults_Fmt,
-                ARRAY_SIZE(LtePhySystemScanResults_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_system_scan_results_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_BPLMN_Cell_Request:
-        offset += _decode_by_fmt(LtePhyBplmnCellRequest_Fmt,
-                ARRAY_SIZE(LtePhyBplmnCellRequest_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_bplmn_cell_request_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_BPLMN_Cell_Confirm:
-        offset += _decode_by_fmt(LtePhyBplmnCellConfirm_Fmt,
-                ARRAY_SIZE(LtePhyBplmnCellConfirm_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_bplmn_cell_confirm_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_Serving_Cell_COM_Loop:
-        offset += _decode_by_fmt(LtePhyServingCellComLoop_Fmt,
-                ARRAY_SIZE(LtePhyServingCellComLoop_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_serving_cell_com_loop_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_PDCCH_Decoding_Result:
-        offset += _decode_by_fmt(LtePhyPdcchDecodingResult_Fmt,
-                ARRAY_SIZE(LtePhyPdcchDecodingResult_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_pdcch_decoding_result_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_PDSCH_Decoding_Result:
-        offset += _decode_by_fmt(LtePhyPdschDecodingResult_Fmt,
-                ARRAY_SIZE(LtePhyPdschDecodingResult_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_pdsch_decoding_result_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_PUSCH_Tx_Report:
-        offset += _decode_by_fmt(LtePhyPuschTxReport_Fmt,
-                ARRAY_SIZE(LtePhyPuschTxReport_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_pusch_tx_report_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_RLM_Report:
-        offset += _decode_by_fmt(LtePhyRlmReport_Fmt,
-                ARRAY_SIZE(LtePhyRlmReport_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_rlm_report_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_PUSCH_CSF:
-        offset += _decode_by_fmt(LtePhyPuschCsf_Fmt,
-                ARRAY_SIZE(LtePhyPuschCsf_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_pusch_csf_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_CDRX_Events_Info:
-        offset += _decode_by_fmt(LtePhyCdrxEventsInfo_Fmt,
-                ARRAY_SIZE(LtePhyCdrxEventsInfo_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_cdrx_events_info_payload(b, offset, length, result);
-        break;
-    case WCDMA_RRC_States:
-        offset += _decode_wcdma_rrc_states_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_Idle_Neighbor_Cell_Meas:
-        offset += _decode_by_fmt(LtePhyIncm_Fmt,
-                ARRAY_SIZE(LtePhyIncm_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_idle_neighbor_cell_meas_payload(b, offset, length, result);
-        break;
-    case WCDMA_Search_Cell_Reselection_Rank:
-        offset += _decode_by_fmt(WcdmaScrr_Fmt,
-                ARRAY_SIZE(WcdmaScrr_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_wcdma_scrr_payload(b, offset, length, result);
-        break;
-    case GSM_RR_Cell_Information:
-        offset += _decode_by_fmt(GsmRrCellInfo_Fmt,
-                ARRAY_SIZE(GsmRrCellInfo_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_gsm_rci_payload(b, offset, length, result);
-        break;
-    case GSM_Surround_Cell_BA_List:
-        offset += _decode_by_fmt(GsmScbl_Fmt,
-                ARRAY_SIZE(GsmScbl_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_gsm_scbl_payload(b, offset, length, result);
-        break;
-    case GSM_RR_Cell_Reselection_Meas:
-        offset += _decode_by_fmt(GsmRrCellResMeas_Fmt,
-                ARRAY_SIZE(GsmRrCellResMeas_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_gsm_rcrm_payload(b, offset, length, result);
-        break;
-    case Srch_TNG_1x_Searcher_Dump:
-        offset += _decode_by_fmt(SrchTng1xsd_Fmt,
-                ARRAY_SIZE(SrchTng1xsd_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_srch_tng_1xsd_payload(b, offset, length, result);
-        break;
-    case _1xEVDO_Multi_Carrier_Pilot_Sets:
-        offset += _decode_by_fmt(_1xEvdoMcps_Fmt,
-                ARRAY_SIZE(_1xEvdoMcps_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_1xevdo_mcps_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_PUCCH_Tx_Report:
-        offset += _decode_by_fmt(LtePhyPucchTxReport_Fmt,
-                ARRAY_SIZE(LtePhyPucchTxReport_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_pucch_tx_report_payload(b, offset, length, result);
-        break;
-    case LTE_PDCP_DL_Cipher_Data_PDU:
-        offset += _decode_by_fmt(LtePdcpDlCipherDataPdu_Fmt,
-                ARRAY_SIZE(LtePdcpDlCipherDataPdu_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcp_dl_cipher_data_pdu_payload(b, offset, length, result);
-        break;
-    case LTE_PDCP_UL_Cipher_Data_PDU:
-        offset += _decode_by_fmt(LtePdcpUlCipherDataPdu_Fmt,
-                ARRAY_SIZE(LtePdcpUlCipherDataPdu_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_pdcp_ul_cipher_data_pdu_payload(b, offset, length, result);
-        break;
-    case LTE_PHY_PUCCH_CSF:
-        offset += _decode_by_fmt(LtePhyPucchCsf_Fmt,
-                ARRAY_SIZE(LtePhyPucchCsf_Fmt, Fmt),
-                b, offset, length, result);
-        offset += _decode_lte_phy_pucch_csf_payload(b, offset, length, result);
-        break;
-    default:
-        break;
-    };
-    return result;
+PyObject *
+result_list_to_dict (PyObject *result, const DecodingOptions &options) {
+    PyObject *raw_msgs = PyList_New(0);
+    PyObject *d = _convert_result_list(result, CONVERTED_DICT, raw_msgs,
+                                        options.record_format);
+    if (d == NULL) {
+        Py_DECREF(raw_msgs);
+        return NULL;
+    }
+    PyObject *ret = Py_BuildValue("(OOO)", d, raw_msgs, result);
+    Py_DECREF(d);
+    Py_DECREF(raw_msgs);
+    return ret;
 }
 
 /*-----------------------------------------------------------------------
@@ -5571,20 +5686,11 @@ _decode_by_fmt_modem (const Fmt fmt [], int n_fmt,
 
         case QCDM_TIMESTAMP:
             {
-                const double PER_SECOND = 52428800.0;
-                const double PER_USECOND = 52428800.0 / 1.0e6;
                 assert(fmt[i].len == 8);
-                // Convert to a Python long integer object
                 // unsigned long long iiii = *((unsigned long long *) p);
                 unsigned long long iiii = 0;    //Yuanjie: FIX crash on Android
-                int seconds = int(double(iiii) / PER_SECOND);
-                int useconds = (double(iiii) / PER_USECOND) - double(seconds) * 1.0e6;
-                PyObject *epoch = PyDateTime_FromDateAndTime(1980, 1, 6, 0, 0, 0, 0);
-                PyObject *delta = PyDelta_FromDSU(0, seconds, useconds);
-                decoded = PyNumber_Add(epoch, delta);
+                decoded = decode_qcdm_timestamp(iiii);
                 n_consumed += fmt[i].len;
-                Py_DECREF(epoch);
-                Py_DECREF(delta);
                 break;
             }
 
@@ -5612,9 +5718,11 @@ _decode_by_fmt_modem (const Fmt fmt [], int n_fmt,
 
 
 PyObject *
-decode_log_packet_modem (const char *b, size_t length, bool skip_decoding) {
+decode_log_packet_modem (const char *b, size_t length, bool skip_decoding,
+                            const DecodingOptions &options) {
     if (PyDateTimeAPI == NULL)  // import datetime module
         PyDateTime_IMPORT;
+    g_decoding_options = options;
 
     PyObject *result = NULL;
     int offset = 0;
@@ -2558,12 +2558,86 @@ const Fmt ModemDebug_Fmt [] = {
 bool is_log_packet (const char *b, size_t length);
 bool is_debug_packet (const char *b, size_t length);   //Yuanjie: test if it's a debugging message
 
+// Formats of the QCDM timestamps in decoded packets
+enum TimestampFormat {
+    TIMESTAMP_DATETIME = 0, // datetime object
+    TIMESTAMP_EPOCH,        // float, seconds since 1970-01-01 UTC
+    TIMESTAMP_TICKS         // int, raw ticks (1/52428800 s) since 1980-01-06
+};
+
+// Formats of BYTE_STREAM and BYTE_STREAM_LITTLE_ENDIAN fields
+enum ByteStreamFormat {
+    BYTE_STREAM_HEX = 0,    // str, "0x" followed by lowercase hex digits
+    BYTE_STREAM_BYTES       // bytearray, in the order of the hex digits
+};
+
+// Formats of the elements of list fields (e.g. the PDUs of a subpacket) in
+// the dicts built by result_list_to_dict()
+enum RecordFormat {
+    RECORD_DICT = 0,        // dict
+    RECORD_RECORD           // dm_collector_c.Record, see record.h
+};
+
+// How the fields of a packet are decoded. Set per collector.
+struct DecodingOptions {
+    int timestamp_format;   // see TimestampFormat
+    int byte_stream_format; // see ByteStreamFormat
+    int record_format;      // see RecordFormat
+};
+
+const DecodingOptions DEFAULT_DECODING_OPTIONS = {TIMESTAMP_DATETIME, BYTE_STREAM_HEX,
+                                                    RECORD_DICT};
+
 // Given a binary string, try to decode it as a log packet.
 // Return a specailly formatted Python list that stores the decoding result.
 // If skip_decoding is True, only the header would be decoded.
-PyObject * decode_log_packet (const char *b, size_t length, bool skip_decoding);
-
-
-PyObject * decode_log_packet_modem (const char *b, size_t length, bool skip_decoding);
+PyObject * decode_log_packet (const char *b, size_t length, bool skip_decoding,
+                                const DecodingOptions &options = DEFAULT_DECODING_OPTIONS);
+
+
+PyObject * decode_log_packet_modem (const char *b, size_t length, bool skip_decoding,
+                                    const DecodingOptions &options = DEFAULT_DECODING_OPTIONS);
+
+// Convert a QCDM timestamp in the format of the packet being decoded.
+// Return: New reference
+PyObject * decode_qcdm_timestamp (unsigned long long ticks);
+
+// Convert length bytes at p in the format of the packet being decoded. If
+// little_endian is set, the bytes are reversed, so that the most significant
+// byte comes first.
+// Return: New reference
+PyObject * decode_byte_stream (const char *p, int length, bool little_endian);
+
+// Return: Borrowed reference to the interned Python string of name, which is
+// created the first time the address of name is seen, and kept until the
+// interpreter exits. name must not change or be freed, e.g. the field name
+// of a Fmt or the name of a ValueName. Must be called with the GIL held.
+PyObject * intern_static_name (const char *name);
+
+// Find a field by its name in a result list, through an index of the list
+// that is built incrementally as the list grows, so that a decoder looking up
+// fields of a long list does not scan it every time. Fields are only appended
+// to result lists or replaced by fields of the same name, which keeps the
+// index valid. target must be a static name, as in intern_static_name().
+// Must be called with the GIL held.
+// Return: the index of the first field named target, -1 if there is none, or
+// -2 if the list cannot be indexed (an item is not a (name, ...) tuple)
+int find_indexed_result_field (PyObject *result, const char *target);
+
+// Release the indexes built by find_indexed_result_field(). Called when a
+// packet has been decoded, since the lists are no longer under construction.
+void clear_result_indexes ();
+
+// Convert a result list into the nested dict that DMLogPacket.decode()
+// builds from it: "dict" fields become dicts and "list" fields become tuples.
+// Top-level "raw_msg/TYPE" fields are left out of the dict, and returned
+// unchanged in a list, so that they can be dissected by Wireshark.
+// With RECORD_RECORD, the elements of list fields that would be dicts are
+// records instead.
+// The result list is returned as well, since a dict neither keeps the order
+// of the fields nor fields of the same name, which the XML output needs.
+// Return: New reference to (dict, raw_msgs, result), or NULL on error
+PyObject * result_list_to_dict (PyObject *result,
+                                const DecodingOptions &options = DEFAULT_DECODING_OPTIONS);
 
 #endif  // __DM_COLLECTOR_C_LOG_PACKET_H__
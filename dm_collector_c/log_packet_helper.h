@@ -21,11 +21,10 @@
 #define SSTR( x ) static_cast< std::ostringstream & >( \
         ( std::ostringstream() << std::dec << x ) ).str()
 
-// Find a field by its name in a result list.
+// Find a field by its name in a sequence other than a list.
 // Return: i or -1
 static int
-_find_result_index(PyObject *result, const char *target) {
-    assert(PySequence_Check(result));
+_find_result_index_in_sequence(PyObject *result, const char *target) {
     int ret = -1;   // return -1 if fails
 
     Py_INCREF(result);
@@ -48,16 +47,97 @@ _find_result_index(PyObject *result, const char *target) {
     return ret;
 }
 
+// Lists of at least this many fields are searched through an index (see
+// find_indexed_result_field()). Shorter lists are scanned, which is cheaper.
+#define MIN_INDEXED_RESULT_FIELDS 32
+
+// Find a field by its name in a result list.
+// Fields of a short list are scanned through borrowed references, without
+// touching their reference counts.
+// Return: i or -1
+static int
+_find_result_index(PyObject *result, const char *target) {
+    assert(PySequence_Check(result));
+    if (!PyList_CheckExact(result))
+        return _find_result_index_in_sequence(result, target);
+
+    Py_ssize_t n = PyList_GET_SIZE(result);
+    if (n >= MIN_INDEXED_RESULT_FIELDS) {
+        int i = find_indexed_result_field(result, target);
+        return (i != -2)? i: _find_result_index_in_sequence(result, target);
+    }
+    for (Py_ssize_t i = 0; i < n; i++) {
+        PyObject *t = PyList_GET_ITEM(result, i);
+        PyObject *field_name = NULL;
+        if (PyTuple_CheckExact(t) && PyTuple_GET_SIZE(t) > 0)
+            field_name = PyTuple_GET_ITEM(t, 0);
+        if (field_name == NULL || !PyString_CheckExact(field_name))
+            return _find_result_index_in_sequence(result, target);
+        const char *name = PyString_AS_STRING(field_name);
+        if (name[0] == target[0] && strcmp(name, target) == 0)
+            return (int) i;
+    }
+    return -1;
+}
+
+// Return: A new reference to the value of the i-th field of a result list
+static PyObject *
+_get_result_value(PyObject *result, int i) {
+    if (PyList_CheckExact(result)) {
+        PyObject *t = PyList_GET_ITEM(result, i);
+        if (PyTuple_CheckExact(t) && PyTuple_GET_SIZE(t) > 1) {
+            PyObject *ret = PyTuple_GET_ITEM(t, 1);
+            Py_INCREF(ret);
+            return ret;
+        }
+    }
+    PyObject *t = PySequence_GetItem(result, i);
+    PyObject *ret = PySequence_GetItem(t, 1); // return new reference
+    Py_DECREF(t);
+    return ret;
+}
+
+// Build a field of a result list, whose name is an interned string (see
+// intern_static_name()).
+// Return: New reference to (name, value, ""), or NULL on error
+static PyObject *
+_new_result_field(PyObject *name, PyObject *value) {
+    PyObject *empty = intern_static_name("");
+    PyObject *t = PyTuple_New(3);
+    if (name == NULL || value == NULL || empty == NULL || t == NULL) {
+        Py_XDECREF(t);
+        return NULL;
+    }
+    Py_INCREF(name);
+    PyTuple_SET_ITEM(t, 0, name);
+    Py_INCREF(value);
+    PyTuple_SET_ITEM(t, 1, value);
+    Py_INCREF(empty);
+    PyTuple_SET_ITEM(t, 2, empty);
+    return t;
+}
+
+// Replace the value of the i-th field of a result list, whose name is
+// target. The name object of the old field is reused if possible.
+static void
+_set_result_value(PyObject *result, int i, const char *target,
+                    PyObject *new_object) {
+    PyObject *t = PyList_GET_ITEM(result, i);
+    PyObject *name;
+    if (PyTuple_CheckExact(t) && PyTuple_GET_SIZE(t) > 0)
+        name = PyTuple_GET_ITEM(t, 0);
+    else
+        name = intern_static_name(target);
+    PyList_SetItem(result, i, _new_result_field(name, new_object));
+}
+
 // Find a field by its name in a result list.
 // Return: A new reference to the field or NULL
 static PyObject *
 _search_result(PyObject *result, const char *target) {
     int i = _find_result_index(result, target);
     if (i >= 0) {
-        PyObject *t = PySequence_GetItem(result, i);
-        PyObject *ret = PySequence_GetItem(t, 1); // return new reference
-        Py_DECREF(t);
-        return ret;
+        return _get_result_value(result, i);
     } else {
         return NULL;
     }
@@ -94,11 +174,8 @@ static PyObject *
 _replace_result(PyObject *result, const char *target, PyObject *new_object) {
     int i = _find_result_index(result, target);
     if (i >= 0) {
-        PyObject *t = PySequence_GetItem(result, i);
-        PyObject *ret = PySequence_GetItem(t, 1); // return new reference
-        Py_DECREF(t);
-
-        PyList_SetItem(result, i, Py_BuildValue("(sOs)", target, new_object, ""));
+        PyObject *ret = _get_result_value(result, i);
+        _set_result_value(result, i, target, new_object);
         return ret;
     } else {
         return NULL;
@@ -126,9 +203,7 @@ _map_result_field_to_name(PyObject *result, const char *target,
                             const char *not_found) {
     int i = _find_result_index(result, target);
     if (i >= 0) {
-        PyObject *t = PySequence_GetItem(result, i);
-        PyObject *item = PySequence_GetItem(t, 1); // return new reference
-        Py_DECREF(t);
+        PyObject *item = _get_result_value(result, i);
         assert(PyInt_Check(item));
         int val = (int) PyInt_AsLong(item);
         Py_DECREF(item);
@@ -136,9 +211,7 @@ _map_result_field_to_name(PyObject *result, const char *target,
         const char* name = search_name(mapping, n, val);
         if (name == NULL)  // not found
             name = not_found;
-        PyObject *pystr = Py_BuildValue("s", name);
-        PyList_SetItem(result, i, Py_BuildValue("(sOs)", target, pystr, ""));
-        Py_DECREF(pystr);
+        _set_result_value(result, i, target, intern_static_name(name));
         return val;
     } else {
         return -1;
@@ -198,13 +271,7 @@ _decode_by_fmt (const Fmt fmt [], int n_fmt,
         case BYTE_STREAM:
             {
                 assert(fmt[i].len > 0);
-                char hex[10] = {};
-                std::string ascii_data = "0x";
-                for (int k = 0; k < fmt[i].len; k++) {
-                    sprintf(hex, "%02x", p[k] & 0xFF);
-                    ascii_data += hex;
-                }
-                decoded = Py_BuildValue("s", ascii_data.c_str());
+                decoded = decode_byte_stream(p, fmt[i].len, false);
                 n_consumed += fmt[i].len;
                 break;
             }
@@ -212,13 +279,7 @@ _decode_by_fmt (const Fmt fmt [], int n_fmt,
         case BYTE_STREAM_LITTLE_ENDIAN:
             {
                 assert(fmt[i].len > 0);
-                char hex[10] = {};
-                std::string ascii_data = "0x";
-                for (int k = fmt[i].len - 1; k >= 0; k--) {
-                    sprintf(hex, "%02x", p[k] & 0xFF);
-                    ascii_data += hex;
-                }
-                decoded = Py_BuildValue("s", ascii_data.c_str());
+                decoded = decode_byte_stream(p, fmt[i].len, true);
                 n_consumed += fmt[i].len;
                 break;
             }
@@ -258,19 +319,10 @@ _decode_by_fmt (const Fmt fmt [], int n_fmt,
 
         case QCDM_TIMESTAMP:
             {
-                const double PER_SECOND = 52428800.0;
-                const double PER_USECOND = 52428800.0 / 1.0e6;
                 assert(fmt[i].len == 8);
-                // Convert to a Python long integer object
                 unsigned long long iiii = *((unsigned long long *) p);
-                int seconds = int(double(iiii) / PER_SECOND);
-                int useconds = (double(iiii) / PER_USECOND) - double(seconds) * 1.0e6;
-                PyObject *epoch = PyDateTime_FromDateAndTime(1980, 1, 6, 0, 0, 0, 0);
-                PyObject *delta = PyDelta_FromDSU(0, seconds, useconds);
-                decoded = PyNumber_Add(epoch, delta);
+                decoded = decode_qcdm_timestamp(iiii);
                 n_consumed += fmt[i].len;
-                Py_DECREF(epoch);
-                Py_DECREF(delta);
                 break;
             }
 
@@ -329,10 +381,10 @@ _decode_by_fmt (const Fmt fmt [], int n_fmt,
         }
 
         if (decoded != NULL) {
-            PyObject *t = Py_BuildValue("(sOs)",
-                                        fmt[i].field_name, decoded, "");
+            PyObject *t = _new_result_field(intern_static_name(fmt[i].field_name),
+                                            decoded);
             PyList_Append(result, t);
-            Py_DECREF(t);
+            Py_XDECREF(t);
             Py_DECREF(decoded);
         }
     }
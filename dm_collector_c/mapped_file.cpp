@@ -0,0 +1,118 @@
+/* mapped_file.cpp
+ * Implements read-only file mapping on POSIX systems and Windows.
+ */
+
+#include "mapped_file.h"
+
+#include <cerrno>
+
+#ifdef _WIN32
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+#ifdef _WIN32
+
+bool
+mapped_file_open (struct MappedFile *pfile, const char *path) {
+    pfile->data = NULL;
+    pfile->size = 0;
+    pfile->file_handle = NULL;
+    pfile->mapping_handle = NULL;
+
+    HANDLE file = CreateFileA(path, GENERIC_READ, FILE_SHARE_READ, NULL,
+                                OPEN_EXISTING, FILE_FLAG_SEQUENTIAL_SCAN, NULL);
+    if (file == INVALID_HANDLE_VALUE) {
+        errno = ENOENT;
+        return false;
+    }
+    LARGE_INTEGER size;
+    if (!GetFileSizeEx(file, &size)) {
+        CloseHandle(file);
+        errno = EIO;
+        return false;
+    }
+    pfile->file_handle = file;
+    pfile->size = (size_t) size.QuadPart;
+    if (pfile->size == 0)
+        return true;
+
+    HANDLE mapping = CreateFileMappingA(file, NULL, PAGE_READONLY, 0, 0, NULL);
+    if (mapping == NULL) {
+        mapped_file_close(pfile);
+        errno = ENOMEM;
+        return false;
+    }
+    pfile->mapping_handle = mapping;
+    pfile->data = (const char *) MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0);
+    if (pfile->data == NULL) {
+        mapped_file_close(pfile);
+        errno = ENOMEM;
+        return false;
+    }
+    return true;
+}
+
+void
+mapped_file_close (struct MappedFile *pfile) {
+    if (pfile->data != NULL)
+        UnmapViewOfFile(pfile->data);
+    if (pfile->mapping_handle != NULL)
+        CloseHandle((HANDLE) pfile->mapping_handle);
+    if (pfile->file_handle != NULL)
+        CloseHandle((HANDLE) pfile->file_handle);
+    pfile->data = NULL;
+    pfile->size = 0;
+    pfile->file_handle = NULL;
+    pfile->mapping_handle = NULL;
+}
+
+#else
+
+bool
+mapped_file_open (struct MappedFile *pfile, const char *path) {
+    pfile->data = NULL;
+    pfile->size = 0;
+
+    int fd = open(path, O_RDONLY);
+    if (fd < 0)
+        return false;
+    struct stat st;
+    if (fstat(fd, &st) != 0) {
+        int err = errno;
+        close(fd);
+        errno = err;
+        return false;
+    }
+    if (st.st_size == 0) {
+        close(fd);
+        return true;
+    }
+    void *p = mmap(NULL, (size_t) st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    int err = errno;
+    close(fd);  // the mapping stays valid after the descriptor is closed
+    if (p == MAP_FAILED) {
+        errno = err;
+        return false;
+    }
+#ifdef MADV_SEQUENTIAL
+    (void) madvise(p, (size_t) st.st_size, MADV_SEQUENTIAL);
+#endif
+    pfile->data = (const char *) p;
+    pfile->size = (size_t) st.st_size;
+    return true;
+}
+
+void
+mapped_file_close (struct MappedFile *pfile) {
+    if (pfile->data != NULL)
+        munmap((void *) pfile->data, pfile->size);
+    pfile->data = NULL;
+    pfile->size = 0;
+}
+
+#endif
@@ -0,0 +1,25 @@
+/* mapped_file.h
+ * Defines a read-only view of a whole file, backed by mmap() where
+ * available.
+ */
+
+#ifndef __DM_COLLECTOR_C_MAPPED_FILE_H__
+#define __DM_COLLECTOR_C_MAPPED_FILE_H__
+
+#include <cstddef>
+
+struct MappedFile {
+    const char *data;   // NULL if the file is empty
+    size_t size;
+#ifdef _WIN32
+    void *file_handle;
+    void *mapping_handle;
+#endif
+};
+
+// Map a file into memory.
+// Return: successful or not. errno is set on failure.
+bool mapped_file_open (struct MappedFile *pfile, const char *path);
+void mapped_file_close (struct MappedFile *pfile);
+
+#endif // __DM_COLLECTOR_C_MAPPED_FILE_H__
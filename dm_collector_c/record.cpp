@@ -0,0 +1,539 @@
+/* record.cpp
+ * Implements dm_collector_c.Record.
+ */
+
+#include "record.h"
+
+#include <cctype>
+#include <cstddef>
+#include <string>
+#include <vector>
+
+// Field names shared by the records of the same fields. Schemas are created
+// the first time their fields are seen, and are never freed.
+typedef struct {
+    PyObject_HEAD
+    PyObject *input_names;  // tuple of the names passed to record_new()
+    // Positions in input_names of the fields kept, in order. Only the last
+    // field of a name is kept, as a dict would keep it.
+    std::vector<Py_ssize_t> *kept;
+    PyObject *names;        // tuple of the names of the fields kept
+    PyObject *index;        // dict from names to positions
+    PyObject *attributes;   // dict from attribute names to positions
+} RecordSchema;
+
+typedef struct {
+    PyObject_VAR_HEAD
+    RecordSchema *schema;
+    PyObject *values[1];
+} Record;
+
+static PyTypeObject RecordSchemaType = {
+    PyObject_HEAD_INIT(NULL)
+    0,                                      /* ob_size */
+    "dm_collector_c.RecordSchema",          /* tp_name */
+    sizeof(RecordSchema),                   /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    0,                                      /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    0,                                      /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    0,                                      /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    0,                                      /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    "Field names of records.",              /* tp_doc */
+};
+
+// Schemas by input_names, and the last one used
+static PyObject *g_schemas = NULL;
+static RecordSchema *g_last_schema = NULL;
+
+// Name a field as an attribute: "Sys FN" becomes "sys_fn", and "1st SN"
+// becomes "_1st_sn".
+// Return: New reference, or NULL if the name has no letter or digit
+static PyObject *
+attribute_name (PyObject *name) {
+    const char *s = PyString_AS_STRING(name);
+    std::string attr;
+    bool pending_separator = false;
+    for (; *s != '\0'; s++) {
+        unsigned char c = *s;
+        if (isalnum(c)) {
+            if (pending_separator && !attr.empty())
+                attr += '_';
+            pending_separator = false;
+            attr += (char) tolower(c);
+        } else {
+            pending_separator = true;
+        }
+    }
+    if (attr.empty())
+        return NULL;
+    if (isdigit((unsigned char) attr[0]))
+        attr.insert(0, 1, '_');
+    return PyString_FromStringAndSize(attr.data(), attr.size());
+}
+
+// Return: New reference to the schema of input_names, or NULL on error
+static RecordSchema *
+new_schema (PyObject *input_names) {
+    Py_ssize_t n = PyTuple_GET_SIZE(input_names);
+    RecordSchema *schema = PyObject_New(RecordSchema, &RecordSchemaType);
+    if (schema == NULL)
+        return NULL;
+    Py_INCREF(input_names);
+    schema->input_names = input_names;
+    schema->kept = new std::vector<Py_ssize_t>;
+    schema->names = NULL;
+    schema->index = PyDict_New();
+    schema->attributes = PyDict_New();
+    if (schema->index == NULL || schema->attributes == NULL)
+        goto fail;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        PyObject *name = PyTuple_GET_ITEM(input_names, i);
+        if (!PyString_Check(name)) {
+            PyErr_SetString(PyExc_TypeError, "Field names must be strings.");
+            goto fail;
+        }
+        bool is_last = true;
+        for (Py_ssize_t j = i + 1; j < n && is_last; j++) {
+            int eq = PyObject_RichCompareBool(name, PyTuple_GET_ITEM(input_names, j), Py_EQ);
+            if (eq < 0)
+                goto fail;
+            is_last = !eq;
+        }
+        if (is_last)
+            schema->kept->push_back(i);
+    }
+    schema->names = PyTuple_New(schema->kept->size());
+    if (schema->names == NULL)
+        goto fail;
+    for (size_t k = 0; k < schema->kept->size(); k++) {
+        PyObject *name = PyTuple_GET_ITEM(input_names, (*schema->kept)[k]);
+        Py_INCREF(name);
+        PyTuple_SET_ITEM(schema->names, k, name);
+        PyObject *pos = PyInt_FromSsize_t(k);
+        if (pos == NULL || PyDict_SetItem(schema->index, name, pos) < 0) {
+            Py_XDECREF(pos);
+            goto fail;
+        }
+        // Methods are not shadowed, and the first field of an attribute
+        // name takes it.
+        PyObject *attr = attribute_name(name);
+        if (attr != NULL && PyDict_GetItem(RecordType.tp_dict, attr) == NULL
+                && PyDict_GetItem(schema->attributes, attr) == NULL) {
+            if (PyDict_SetItem(schema->attributes, attr, pos) < 0) {
+                Py_DECREF(attr);
+                Py_DECREF(pos);
+                goto fail;
+            }
+        }
+        Py_XDECREF(attr);
+        Py_DECREF(pos);
+        if (PyErr_Occurred())
+            goto fail;
+    }
+    return schema;
+
+fail:
+    // Schemas are only freed here
+    Py_DECREF(schema->input_names);
+    delete schema->kept;
+    Py_XDECREF(schema->names);
+    Py_XDECREF(schema->index);
+    Py_XDECREF(schema->attributes);
+    PyObject_Del(schema);
+    return NULL;
+}
+
+// Return: whether schema was created for names
+static bool
+schema_matches (const RecordSchema *schema, PyObject *const names [], Py_ssize_t n) {
+    if (PyTuple_GET_SIZE(schema->input_names) != n)
+        return false;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        PyObject *a = PyTuple_GET_ITEM(schema->input_names, i);
+        if (a != names[i] && (!PyString_CheckExact(names[i])
+                                || !_PyString_Eq(a, names[i])))
+            return false;
+    }
+    return true;
+}
+
+// Return: Borrowed reference to the schema of names, or NULL on error
+static RecordSchema *
+find_schema (PyObject *const names [], Py_ssize_t n) {
+    if (g_last_schema != NULL && schema_matches(g_last_schema, names, n))
+        return g_last_schema;
+    PyObject *key = PyTuple_New(n);
+    if (key == NULL)
+        return NULL;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        Py_INCREF(names[i]);
+        PyTuple_SET_ITEM(key, i, names[i]);
+    }
+    RecordSchema *schema = (RecordSchema *) PyDict_GetItem(g_schemas, key);
+    if (schema == NULL) {
+        schema = new_schema(key);
+        if (schema == NULL || PyDict_SetItem(g_schemas, key, (PyObject *) schema) < 0) {
+            Py_XDECREF(schema);
+            Py_DECREF(key);
+            return NULL;
+        }
+        Py_DECREF(schema);  // owned by g_schemas
+    }
+    Py_DECREF(key);
+    g_last_schema = schema;
+    return schema;
+}
+
+PyObject *
+record_new (PyObject *const names [], PyObject *values [], Py_ssize_t n) {
+    RecordSchema *schema = find_schema(names, n);
+    Record *self = NULL;
+    if (schema != NULL)
+        self = PyObject_GC_NewVar(Record, &RecordType, schema->kept->size());
+    if (self == NULL) {
+        for (Py_ssize_t i = 0; i < n; i++)
+            Py_DECREF(values[i]);
+        return NULL;
+    }
+    Py_INCREF(schema);
+    self->schema = schema;
+    size_t k = 0;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        if (k < schema->kept->size() && (*schema->kept)[k] == i)
+            self->values[k++] = values[i];
+        else
+            Py_DECREF(values[i]);   // overridden by a later field
+    }
+    PyObject_GC_Track(self);
+    return (PyObject *) self;
+}
+
+// Return: position of the field named key, or -1
+static Py_ssize_t
+record_find (Record *self, PyObject *key) {
+    PyObject *pos = PyDict_GetItem(self->schema->index, key);
+    return (pos == NULL? -1: PyInt_AS_LONG(pos));
+}
+
+// Return: New reference to a dict of the fields, or NULL on error
+static PyObject *
+record_to_dict (Record *self) {
+    PyObject *ret = PyDict_New();
+    if (ret == NULL)
+        return NULL;
+    for (Py_ssize_t i = 0; i < Py_SIZE(self); i++) {
+        if (PyDict_SetItem(ret, PyTuple_GET_ITEM(self->schema->names, i),
+                            self->values[i]) < 0) {
+            Py_DECREF(ret);
+            return NULL;
+        }
+    }
+    return ret;
+}
+
+// Return: New reference to a list of the names, values or (name, value)
+// pairs of the fields, or NULL on error
+static PyObject *
+record_list (Record *self, bool with_names, bool with_values) {
+    PyObject *ret = PyList_New(Py_SIZE(self));
+    if (ret == NULL)
+        return NULL;
+    for (Py_ssize_t i = 0; i < Py_SIZE(self); i++) {
+        PyObject *name = PyTuple_GET_ITEM(self->schema->names, i);
+        PyObject *item;
+        if (with_names && with_values) {
+            item = PyTuple_Pack(2, name, self->values[i]);
+            if (item == NULL) {
+                Py_DECREF(ret);
+                return NULL;
+            }
+        } else {
+            item = (with_names? name: self->values[i]);
+            Py_INCREF(item);
+        }
+        PyList_SET_ITEM(ret, i, item);
+    }
+    return ret;
+}
+
+static PyObject *
+record_iter_list (Record *self, bool with_names, bool with_values) {
+    PyObject *lst = record_list(self, with_names, with_values);
+    if (lst == NULL)
+        return NULL;
+    PyObject *ret = PyObject_GetIter(lst);
+    Py_DECREF(lst);
+    return ret;
+}
+
+static PyObject *
+record_keys (Record *self, PyObject *args) {
+    return record_list(self, true, false);
+}
+
+static PyObject *
+record_values (Record *self, PyObject *args) {
+    return record_list(self, false, true);
+}
+
+static PyObject *
+record_items (Record *self, PyObject *args) {
+    return record_list(self, true, true);
+}
+
+static PyObject *
+record_iterkeys (Record *self, PyObject *args) {
+    return PyObject_GetIter(self->schema->names);
+}
+
+static PyObject *
+record_itervalues (Record *self, PyObject *args) {
+    return record_iter_list(self, false, true);
+}
+
+static PyObject *
+record_iteritems (Record *self, PyObject *args) {
+    return record_iter_list(self, true, true);
+}
+
+static PyObject *
+record_get (Record *self, PyObject *args) {
+    PyObject *key = NULL, *default_value = Py_None;
+    if (!PyArg_UnpackTuple(args, "get", 1, 2, &key, &default_value))
+        return NULL;
+    Py_ssize_t i = record_find(self, key);
+    PyObject *ret = (i < 0? default_value: self->values[i]);
+    Py_INCREF(ret);
+    return ret;
+}
+
+static PyObject *
+record_has_key (Record *self, PyObject *key) {
+    return PyBool_FromLong(record_find(self, key) >= 0);
+}
+
+static PyObject *
+record_asdict (Record *self, PyObject *args) {
+    return record_to_dict(self);
+}
+
+// Records are pickled as dicts.
+static PyObject *
+record_reduce (Record *self, PyObject *args) {
+    PyObject *items = record_list(self, true, true);
+    if (items == NULL)
+        return NULL;
+    return Py_BuildValue("(O(N))", (PyObject *) &PyDict_Type, items);
+}
+
+static PyMethodDef RecordMethods[] = {
+    {"keys", (PyCFunction) record_keys, METH_NOARGS,
+        "Return a list of the field names, in the order they are decoded."},
+    {"values", (PyCFunction) record_values, METH_NOARGS,
+        "Return a list of the field values."},
+    {"items", (PyCFunction) record_items, METH_NOARGS,
+        "Return a list of (name, value) pairs."},
+    {"iterkeys", (PyCFunction) record_iterkeys, METH_NOARGS,
+        "Iterate over the field names."},
+    {"itervalues", (PyCFunction) record_itervalues, METH_NOARGS,
+        "Iterate over the field values."},
+    {"iteritems", (PyCFunction) record_iteritems, METH_NOARGS,
+        "Iterate over (name, value) pairs."},
+    {"get", (PyCFunction) record_get, METH_VARARGS,
+        "Return the value of a field, or default (None) if there is no such field."},
+    {"has_key", (PyCFunction) record_has_key, METH_O,
+        "Return whether there is a field of the given name."},
+    {"_asdict", (PyCFunction) record_asdict, METH_NOARGS,
+        "Return a new dict of the fields. Same as dict(record)."},
+    {"__reduce__", (PyCFunction) record_reduce, METH_NOARGS, NULL},
+    {NULL, NULL, 0, NULL}
+};
+
+static PyObject *
+record_get_fields (Record *self, void *closure) {
+    Py_INCREF(self->schema->names);
+    return self->schema->names;
+}
+
+static PyGetSetDef RecordGetSet[] = {
+    {(char *) "_fields", (getter) record_get_fields, NULL,
+        (char *) "Tuple of the field names.", NULL},
+    {NULL, NULL, NULL, NULL, NULL}
+};
+
+static Py_ssize_t
+record_length (Record *self) {
+    return Py_SIZE(self);
+}
+
+static PyObject *
+record_subscript (Record *self, PyObject *key) {
+    Py_ssize_t i = record_find(self, key);
+    if (i < 0) {
+        PyErr_SetObject(PyExc_KeyError, key);
+        return NULL;
+    }
+    Py_INCREF(self->values[i]);
+    return self->values[i];
+}
+
+static int
+record_contains (Record *self, PyObject *key) {
+    return record_find(self, key) >= 0;
+}
+
+static PyMappingMethods RecordAsMapping = {
+    (lenfunc) record_length,                /* mp_length */
+    (binaryfunc) record_subscript,          /* mp_subscript */
+    0,                                      /* mp_ass_subscript */
+};
+
+static PySequenceMethods RecordAsSequence = {
+    0,                                      /* sq_length */
+    0,                                      /* sq_concat */
+    0,                                      /* sq_repeat */
+    0,                                      /* sq_item */
+    0,                                      /* sq_slice */
+    0,                                      /* sq_ass_item */
+    0,                                      /* sq_ass_slice */
+    (objobjproc) record_contains,           /* sq_contains */
+};
+
+// Fields are found as attributes before methods and other attributes.
+static PyObject *
+record_getattro (Record *self, PyObject *name) {
+    if (PyString_CheckExact(name)) {
+        PyObject *pos = PyDict_GetItem(self->schema->attributes, name);
+        if (pos != NULL) {
+            PyObject *ret = self->values[PyInt_AS_LONG(pos)];
+            Py_INCREF(ret);
+            return ret;
+        }
+    }
+    return PyObject_GenericGetAttr((PyObject *) self, name);
+}
+
+static PyObject *
+record_iter (Record *self) {
+    return PyObject_GetIter(self->schema->names);
+}
+
+// Same as the repr of a dict, in the order of the fields
+static PyObject *
+record_repr (Record *self) {
+    int status = Py_ReprEnter((PyObject *) self);
+    if (status != 0)
+        return (status > 0? PyString_FromString("{...}"): NULL);
+    PyObject *ret = PyString_FromString("{");
+    for (Py_ssize_t i = 0; i < Py_SIZE(self) && ret != NULL; i++) {
+        if (i > 0)
+            PyString_ConcatAndDel(&ret, PyString_FromString(", "));
+        PyString_ConcatAndDel(&ret, PyObject_Repr(PyTuple_GET_ITEM(self->schema->names, i)));
+        PyString_ConcatAndDel(&ret, PyString_FromString(": "));
+        PyString_ConcatAndDel(&ret, PyObject_Repr(self->values[i]));
+    }
+    PyString_ConcatAndDel(&ret, PyString_FromString("}"));
+    Py_ReprLeave((PyObject *) self);
+    return ret;
+}
+
+// Records are equal to dicts and records of the same fields.
+static PyObject *
+record_richcompare (PyObject *a, PyObject *b, int op) {
+    if ((op != Py_EQ && op != Py_NE)
+            || !(PyDict_Check(a) || PyObject_TypeCheck(a, &RecordType))
+            || !(PyDict_Check(b) || PyObject_TypeCheck(b, &RecordType))) {
+        Py_INCREF(Py_NotImplemented);
+        return Py_NotImplemented;
+    }
+    PyObject *da = (PyDict_Check(a)? (Py_INCREF(a), a): record_to_dict((Record *) a));
+    PyObject *db = (PyDict_Check(b)? (Py_INCREF(b), b): record_to_dict((Record *) b));
+    PyObject *ret = NULL;
+    if (da != NULL && db != NULL)
+        ret = PyObject_RichCompare(da, db, op);
+    Py_XDECREF(da);
+    Py_XDECREF(db);
+    return ret;
+}
+
+static int
+record_traverse (Record *self, visitproc visit, void *arg) {
+    for (Py_ssize_t i = 0; i < Py_SIZE(self); i++)
+        Py_VISIT(self->values[i]);
+    return 0;
+}
+
+static int
+record_clear (Record *self) {
+    for (Py_ssize_t i = 0; i < Py_SIZE(self); i++)
+        Py_CLEAR(self->values[i]);
+    return 0;
+}
+
+static void
+record_dealloc (Record *self) {
+    PyObject_GC_UnTrack(self);
+    Py_TRASHCAN_SAFE_BEGIN(self)
+    record_clear(self);
+    Py_DECREF(self->schema);
+    PyObject_GC_Del(self);
+    Py_TRASHCAN_SAFE_END(self)
+}
+
+PyTypeObject RecordType = {
+    PyObject_HEAD_INIT(NULL)
+    0,                                      /* ob_size */
+    "dm_collector_c.Record",                /* tp_name */
+    offsetof(Record, values),               /* tp_basicsize */
+    sizeof(PyObject *),                     /* tp_itemsize */
+    (destructor) record_dealloc,            /* tp_dealloc */
+    0,                                      /* tp_print */
+    0,                                      /* tp_getattr */
+    0,                                      /* tp_setattr */
+    0,                                      /* tp_compare */
+    (reprfunc) record_repr,                 /* tp_repr */
+    0,                                      /* tp_as_number */
+    &RecordAsSequence,                      /* tp_as_sequence */
+    &RecordAsMapping,                       /* tp_as_mapping */
+    PyObject_HashNotImplemented,            /* tp_hash */
+    0,                                      /* tp_call */
+    0,                                      /* tp_str */
+    (getattrofunc) record_getattro,         /* tp_getattro */
+    0,                                      /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    "Read-only mapping of the fields of a decoded element.\n"
+    "\n"
+    "Fields can be read by name or as attributes, e.g. record[\"Sys FN\"]\n"
+    "or record.sys_fn, and dict(record) converts it to a dict.",  /* tp_doc */
+    (traverseproc) record_traverse,         /* tp_traverse */
+    (inquiry) record_clear,                 /* tp_clear */
+    record_richcompare,                     /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    (getiterfunc) record_iter,              /* tp_iter */
+    0,                                      /* tp_iternext */
+    RecordMethods,                          /* tp_methods */
+    0,                                      /* tp_members */
+    RecordGetSet,                           /* tp_getset */
+};
+
+bool
+record_type_ready () {
+    if (PyType_Ready(&RecordSchemaType) < 0 || PyType_Ready(&RecordType) < 0)
+        return false;
+    if (g_schemas == NULL)
+        g_schemas = PyDict_New();
+    return g_schemas != NULL;
+}
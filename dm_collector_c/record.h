@@ -0,0 +1,30 @@
+/* record.h
+ * Defines dm_collector_c.Record, a compact read-only mapping of the fields
+ * of a decoded element (e.g. an RLC PDU), used instead of a dict when the
+ * record format is set to "record".
+ *
+ * The values of a record are stored in an array, in the order they are
+ * decoded. Their names are kept by a schema shared by all records of the
+ * same fields, so a record costs a few words per field, and a field is
+ * found through the schema without building a dict per element. Fields can
+ * be read by name (record["Sys FN"]) or as attributes, named after the
+ * fields in lowercase with other characters replaced by "_" (record.sys_fn).
+ */
+
+#ifndef __DM_COLLECTOR_C_RECORD_H__
+#define __DM_COLLECTOR_C_RECORD_H__
+
+#include <Python.h>
+
+extern PyTypeObject RecordType;
+
+// Must be called before usage, with the module being initialized.
+// Return: successful or not
+bool record_type_ready ();
+
+// Build a record of n fields. The names must be strings; the references of
+// values are stolen, even on error.
+// Return: New reference, or NULL on error
+PyObject *record_new (PyObject *const names [], PyObject *values [], Py_ssize_t n);
+
+#endif // __DM_COLLECTOR_C_RECORD_H__
@@ -1,6 +1,54 @@
 #include "utils.h"
 
 #include <cstring>
+#include <map>
+
+// Arrays up to this size are searched linearly, which is as fast as hashing.
+#define LINEAR_SEARCH_MAX 8
+
+// Hash table of the values of a ValueName array, built the first time the
+// array is searched. Each slot holds 1 + the position of an entry in the
+// array, or 0 if it is empty. Collisions are resolved by linear probing.
+struct ValueNameIndex {
+    int n;  // size of the array
+    std::vector<int> slots;
+    unsigned int mask;
+};
+
+// Indexes are only built and read with the GIL held.
+static std::map<const ValueName *, ValueNameIndex *> g_value_name_indexes;
+
+static unsigned int
+hash_value (int val) {
+    return (unsigned int) val * 2654435761u;
+}
+
+static const ValueNameIndex *
+get_value_name_index (const ValueName id_to_name [], int n) {
+    std::map<const ValueName *, ValueNameIndex *>::iterator it
+        = g_value_name_indexes.find(id_to_name);
+    if (it != g_value_name_indexes.end())
+        return it->second;
+
+    ValueNameIndex *index = new ValueNameIndex;
+    unsigned int capacity = 16;
+    while (capacity < (unsigned int) n * 2)
+        capacity *= 2;
+    index->n = n;
+    index->slots.assign(capacity, 0);
+    index->mask = capacity - 1;
+    for (int i = 0; i < n; i++) {
+        unsigned int slot = hash_value(id_to_name[i].val) & index->mask;
+        // Keep the first entry of a value, as a linear search would find it
+        while (index->slots[slot] != 0
+                && id_to_name[index->slots[slot] - 1].val != id_to_name[i].val)
+            slot = (slot + 1) & index->mask;
+        if (index->slots[slot] == 0)
+            index->slots[slot] = i + 1;
+    }
+    g_value_name_indexes[id_to_name] = index;
+    return index;
+}
 
 // Find multiple IDs coressponding to name, and append all IDs to out_vector
 // Return how many IDs are found
@@ -18,10 +66,23 @@ find_ids (const ValueName id_to_name [], int n, const char *name, IdVector& out_
 
 const char*
 search_name (const ValueName id_to_name [], int n, int val) {
-    for (int i = 0; i < n; i++) {
-        if (id_to_name[i].val == val) {
-            return id_to_name[i].name;
+    const ValueNameIndex *index = NULL;
+    if (n > LINEAR_SEARCH_MAX)
+        index = get_value_name_index(id_to_name, n);
+    if (index == NULL || index->n != n) {
+        for (int i = 0; i < n; i++) {
+            if (id_to_name[i].val == val) {
+                return id_to_name[i].name;
+            }
         }
+        return NULL;
+    }
+    unsigned int slot = hash_value(val) & index->mask;
+    while (index->slots[slot] != 0) {
+        const ValueName &entry = id_to_name[index->slots[slot] - 1];
+        if (entry.val == val)
+            return entry.name;
+        slot = (slot + 1) & index->mask;
     }
     return NULL;
 }
@@ -14,6 +14,9 @@ struct ValueName {
 };
 
 int find_ids (const ValueName id_to_name [], int n, const char *name, IdVector& out_vector);
+// Return: the name of the first entry whose value is val, or NULL.
+// Large arrays are hashed on their first search, so that lookups take
+// constant time. Must be called with the GIL held.
 const char* search_name (const ValueName id_to_name [], int n, int val);
 
 #endif // __DM_COLLECTOR_C_UTILS_H__
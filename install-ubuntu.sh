@@ -22,7 +22,7 @@ WIRESHARK_SRC_PATH=$(pwd)/wireshark-${ws_ver}
 MOBILEINSIGHT_PATH=$(pwd)
 
 echo "Make sure compile environment and other dependencies are installed"
-sudo apt-get -y install pkg-config wget libglib2.0-dev bison flex libpcap-dev
+sudo apt-get -y install pkg-config wget libglib2.0-dev bison flex libpcap-dev zlib1g-dev libzstd-dev
 
 # Download necessary source files to compile ws_dissector
 if [ ! -d "${WIRESHARK_SRC_PATH}" ]; then
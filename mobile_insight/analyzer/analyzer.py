@@ -23,6 +23,71 @@ Author: Yuanjie Li
 from ..element import Element, Event
 #from profile import *
 
+import binascii
+import calendar
+import datetime
+
+_QCDM_TICKS_PER_SECOND = 52428800.0
+_QCDM_EPOCH_IN_POSIX = 315964800.0     # 1980-01-06
+_YEAR_1981_IN_POSIX = 347155200.0
+
+
+def timestamp_to_seconds(timestamp):
+    """
+    Convert the timestamp of a message to seconds since 1970-01-01,
+    whatever the timestamp format of the monitor is (see Monitor.set_timestamp_format())
+
+    :param timestamp: a datetime object, float seconds since 1970-01-01, or int QCDM ticks
+    :returns: float seconds since 1970-01-01, taking the device time as UTC
+    """
+    if isinstance(timestamp, float):
+        return timestamp
+    if isinstance(timestamp, (int, long)):
+        # Truncated to microseconds, as the timestamps decoded by dm_collector_c
+        seconds = int(timestamp / _QCDM_TICKS_PER_SECOND)
+        useconds = int(timestamp / (_QCDM_TICKS_PER_SECOND / 1.0e6) - seconds * 1.0e6)
+        return _QCDM_EPOCH_IN_POSIX + seconds + useconds / 1.0e6
+    return calendar.timegm(timestamp.utctimetuple()) + timestamp.microsecond / 1.0e6
+
+
+def timestamp_delta(later, earlier):
+    """
+    Compute the time between the timestamps of two messages
+
+    :param later: a timestamp in any format accepted by timestamp_to_seconds()
+    :param earlier: a timestamp in any format accepted by timestamp_to_seconds()
+    :returns: float seconds from earlier to later
+    """
+    if isinstance(later, datetime.datetime) and isinstance(earlier, datetime.datetime):
+        return (later - earlier).total_seconds()
+    return timestamp_to_seconds(later) - timestamp_to_seconds(earlier)
+
+
+def is_valid_timestamp(timestamp):
+    """
+    Check whether the timestamp of a message is set by the device.
+    Undefined timestamps fall in 1980, the epoch of QCDM timestamps.
+
+    :param timestamp: a timestamp in any format accepted by timestamp_to_seconds()
+    :returns: True if the timestamp is not in 1980
+    """
+    if isinstance(timestamp, datetime.datetime):
+        return timestamp.year != 1980
+    return timestamp_to_seconds(timestamp) >= _YEAR_1981_IN_POSIX
+
+
+def byte_stream_to_hex(value):
+    """
+    Get the hex string of a byte stream field (e.g. a payload or a mask),
+    whatever the byte stream format of the monitor is (see Monitor.set_byte_stream_format())
+
+    :param value: a hex string such as "0x01ab", or a bytearray
+    :returns: the hex string, starting with "0x"
+    """
+    if isinstance(value, bytearray):
+        return "0x" + binascii.b2a_hex(value)
+    return value
+
 
 class Analyzer(Element):
     """A base class for all the analyzers
@@ -343,7 +343,7 @@ class LteNasAnalyzer(ProtocolAnalyzer):
     def getTimeInterval(self, preTime, curTime):
         # preTime_parse = dt.strptime(preTime, '%Y-%m-%d %H:%M:%S.%f')
         # curTime_parse = dt.strptime(curTime, '%Y-%m-%d %H:%M:%S.%f')
-        return (curTime - preTime).total_seconds() * 1000000.0
+        return timestamp_delta(curTime, preTime) * 1000000.0
 
     def get_qos(self):
         # return self.__esm_status.qos
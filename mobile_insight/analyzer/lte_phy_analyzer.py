@@ -119,11 +119,11 @@ class LtePhyAnalyzer(Analyzer):
             elif log_item["MCS 0"] == "64QAM":
                 self.mcs_64qam_count += 1
 
-            if (log_item['timestamp'] -
-                    self.prev_timestamp_dl).total_seconds() >= self.avg_window:
+            if timestamp_delta(log_item['timestamp'],
+                    self.prev_timestamp_dl) >= self.avg_window:
                 bcast_dict = {}
                 bandwidth = self.lte_dl_bw / \
-                    ((log_item['timestamp'] - self.prev_timestamp_dl).total_seconds() * 1000000.0)
+                    (timestamp_delta(log_item['timestamp'], self.prev_timestamp_dl) * 1000000.0)
                 pred_bandwidth = self.predict_bw()
                 bcast_dict['Bandwidth (Mbps)'] = str(round(bandwidth, 2))
 
@@ -215,14 +215,14 @@ class LtePhyAnalyzer(Analyzer):
         self.lte_ul_grant_utilized += grant_utilized * 8
         self.lte_ul_bw += grant_received * 8
 
-        if (log_item['timestamp'] -
-                self.prev_timestamp_ul).total_seconds() >= self.avg_window:
+        if timestamp_delta(log_item['timestamp'],
+                self.prev_timestamp_ul) >= self.avg_window:
 
             bcast_dict = {}
             bandwidth = self.lte_ul_bw / \
-                ((log_item['timestamp'] - self.prev_timestamp_ul).total_seconds() * 1000000.0)
+                (timestamp_delta(log_item['timestamp'], self.prev_timestamp_ul) * 1000000.0)
             grant_utilization = self.lte_ul_grant_utilized / \
-                ((log_item['timestamp'] - self.prev_timestamp_ul).total_seconds() * 1000000.0)
+                (timestamp_delta(log_item['timestamp'], self.prev_timestamp_ul) * 1000000.0)
             bcast_dict['Bandwidth (Mbps)'] = str(round(bandwidth, 2))
             bcast_dict['Utilized (Mbps)'] = str(round(grant_utilization, 2))
             if self.lte_ul_bw:
@@ -120,8 +120,8 @@ class LteRlcAnalyzer(Analyzer):
                                               "\tAckSN: " +
                                               str(ackItem['ack_sn']) +
                                               "\tTime cost: " +
-                                              str((ackItem['time_stamp'] -
-                                                   log_item['timestamp']).total_seconds()) +
+                                              str(timestamp_delta(ackItem['time_stamp'],
+                                                   log_item['timestamp'])) +
                                               "s\tData TimeStamp: " +
                                               str(log_item['timestamp']) +
                                               "\tAck TimeStamp: " +
@@ -171,8 +171,8 @@ class LteRlcAnalyzer(Analyzer):
                                               "\tAckSN: " +
                                               str(AckSN) +
                                               "\tTime cost: " +
-                                              str((log_item['timestamp'] -
-                                                   snItem['time_stamp']).total_seconds()) +
+                                              str(timestamp_delta(log_item['timestamp'],
+                                                   snItem['time_stamp'])) +
                                               "s\tData TimeStamp: " +
                                               str(snItem['time_stamp']) +
                                               "\tAck TimeStamp: " +
@@ -288,8 +288,8 @@ class LteRlcAnalyzer(Analyzer):
                                               "\tAckSN: " +
                                               str(ackItem['ack_sn']) +
                                               "\tTime cost: " +
-                                              str((ackItem['time_stamp'] -
-                                                   log_item['timestamp']).total_seconds()) +
+                                              str(timestamp_delta(ackItem['time_stamp'],
+                                                   log_item['timestamp'])) +
                                               "s\tData TimeStamp: " +
                                               str(log_item['timestamp']) +
                                               "\tAck TimeStamp: " +
@@ -340,8 +340,8 @@ class LteRlcAnalyzer(Analyzer):
                                               "\tAckSN: " +
                                               str(AckSN) +
                                               "\tTime cost: " +
-                                              str((log_item['timestamp'] -
-                                                   snItem['time_stamp']).total_seconds()) +
+                                              str(timestamp_delta(log_item['timestamp'],
+                                                   snItem['time_stamp'])) +
                                               "s\tData TimeStamp: " +
                                               str(snItem['time_stamp']) +
                                               "\tAck TimeStamp: " +
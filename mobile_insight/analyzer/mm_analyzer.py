@@ -168,9 +168,9 @@ class MmAnalyzer(Analyzer):
 
         # Deal with out-of-order timestamps
         this_ts = log_item["timestamp"]
-        if this_ts.year != 1980:    # Ignore undefined timestamp
+        if is_valid_timestamp(this_ts):    # Ignore undefined timestamp
             if self.__last_valid_timestamp:
-                sec = (this_ts - self.__last_valid_timestamp).total_seconds()
+                sec = timestamp_delta(this_ts, self.__last_valid_timestamp)
                 if sec >= 1200 or sec <= -120:
                     self.__pause(self.__last_valid_timestamp)
             self.__last_valid_timestamp = this_ts
@@ -29,7 +29,7 @@ import datetime
 def string2timestamp(s):
     # dt=datetime.datetime.strptime(s, "%Y-%m-%d %H:%M:%S.%f")
     # return time.mktime(dt.timetuple()) + (dt.microsecond / 1000000.0)
-    return time.mktime(s.timetuple()) + s.microsecond / 1000000.0
+    return timestamp_to_seconds(s)
 
 
 class MobilityMngt(Analyzer):
@@ -43,7 +43,8 @@ class MsgStatistics(Analyzer):
 
     def __msg_callback(self, msg):
 
-        log_item = msg.data.decode()
+        # Header fields are read without decoding the payload
+        log_item = msg.data
 
         if msg.type_id not in self.msg_type_statistics:
             self.msg_type_statistics[msg.type_id] = 1
@@ -45,6 +45,8 @@ class DMCollector(Monitor):
         self.phy_ser_name = None
         self._prefs = prefs
         self._type_names = []
+        # Reassembly buffer, filter and export state of this monitor
+        self._collector = dm_collector_c.Collector()
         # Initialize Wireshark dissector
         DMLogPacket.init(self._prefs)
 
@@ -93,7 +95,7 @@ class DMCollector(Monitor):
             if n not in self._type_names:
                 self._type_names.append(n)
                 self.log_info("Enable collection: " + n)
-        dm_collector_c.set_filtered(self._type_names)
+        self._collector.set_filtered(self._type_names)
 
     def enable_log_all(self):
         """
@@ -102,16 +104,88 @@ class DMCollector(Monitor):
         cls = self.__class__
         self.enable_log(cls.SUPPORTED_TYPES)
 
-    def save_log_as(self, path):
+    def set_timestamp_format(self, timestamp_format):
+        """
+        Configure the format of the timestamps in decoded messages
+
+        :param timestamp_format: "datetime" (default), "epoch" or "ticks". See Monitor.set_timestamp_format()
+        :type timestamp_format: string
+
+        :except ValueError: unsupported timestamp format encountered
+        """
+        self._collector.set_timestamp_format(timestamp_format)
+        Monitor.set_timestamp_format(self, timestamp_format)
+
+    def set_byte_stream_format(self, byte_stream_format):
+        """
+        Configure the format of byte stream fields in decoded messages
+
+        :param byte_stream_format: "hex" (default) or "bytes". See Monitor.set_byte_stream_format()
+        :type byte_stream_format: string
+
+        :except ValueError: unsupported byte stream format encountered
+        """
+        self._collector.set_byte_stream_format(byte_stream_format)
+        Monitor.set_byte_stream_format(self, byte_stream_format)
+
+    def set_record_format(self, record_format):
+        """
+        Configure the format of the elements of list fields in decoded messages
+
+        :param record_format: "dict" (default) or "record". See Monitor.set_record_format()
+        :type record_format: string
+
+        :except ValueError: unsupported record format encountered
+        """
+        self._collector.set_record_format(record_format)
+        Monitor.set_record_format(self, record_format)
+
+    def save_log_as(self, path, max_bytes=0, max_seconds=0):
         """
         Save the log as a mi2log file (for offline analysis)
 
-        :param path: the file name to be saved
+        If max_bytes or max_seconds is set, the log rolls over to numbered files,
+        and a "new_diag_log" event is sent each time a file is finished.
+
+        :param path: the file name to be saved. If it ends with ".gz" or ".zst", the log is compressed with gzip or zstd. If the log rolls over, "%d" in it is replaced by the file number, or "_N" is inserted before the extension
         :type path: string
-        :param log_types: a filter of message types to be saved
-        :type log_types: list of string
+        :param max_bytes: the maximum size of each file in bytes, 0 for no limit
+        :type max_bytes: int
+        :param max_seconds: the maximum duration of each file in seconds, 0 for no limit
+        :type max_seconds: float
+        """
+        # Buffer the exported log in 1 MB, and flush it every second in the
+        # background while capturing
+        self._collector.set_filtered_export(path, self._type_names,
+                                            1024 * 1024, 1.0,
+                                            max_bytes, max_seconds)
+
+    def save_logs_as(self, routes, max_bytes=0, max_seconds=0):
+        """
+        Save the logs of different types to different mi2log files in one pass
+
+        Only the types enabled by enable_log() are collected from the device.
+
+        :param routes: the files to be saved and the message types saved in each of them. An empty list stops saving them
+        :type routes: list of (string, list of string)
+        :param max_bytes: the maximum size of each file in bytes, 0 for no limit
+        :type max_bytes: int
+        :param max_seconds: the maximum duration of each file in seconds, 0 for no limit
+        :type max_seconds: float
+        """
+        self._collector.set_export_routes(routes, 1024 * 1024, 1.0,
+                                          max_bytes, max_seconds)
+
+    def _send_finished_logs(self):
+        """
+        Send a "new_diag_log" event for each log file closed by rotation
         """
-        dm_collector_c.set_filtered_export(path, self._type_names)
+        for filename in self._collector.get_finished_logs():
+            msg = ('filename', filename, "")
+            event = Event(timeit.default_timer(),
+                          "new_diag_log",
+                          DMLogPacket([msg]))
+            self.send(event)
 
     def run(self):
         """
@@ -142,23 +216,25 @@ class DMCollector(Monitor):
             # Read log packets from serial port and decode their contents
             while True:
                 s = phy_ser.read(64)
-                dm_collector_c.feed_binary(s)
-
-                decoded = dm_collector_c.receive_log_packet(self._skip_decoding,
-                                                            True,   # include_timestamp
-                                                            )
-                if decoded:
+                self._collector.feed_binary(s)
+
+                decoded_list = self._collector.receive_log_packets(0,  # drain all frames
+                                                                   self._skip_decoding,
+                                                                   True,   # include_timestamp
+                                                                   "lazy",  # output
+                                                                   )
+                self._send_finished_logs()
+                for decoded in decoded_list:
                     try:
                         # packet = DMLogPacket(decoded)
                         packet = DMLogPacket(decoded[0])
-                        d = packet.decode()
-                        # print d["type_id"], d["timestamp"]
+                        # print packet["type_id"], packet["timestamp"]
                         # xml = packet.decode_xml()
                         # print xml
                         # print ""
                         # Send event to analyzers
                         event = Event(timeit.default_timer(),
-                                      d["type_id"],
+                                      packet["type_id"],
                                       packet)
                         self.send(event)
                     except FormatError as e:
@@ -30,6 +30,8 @@ except ImportError as e:
 
 from ws_dissector import *
 
+from mobile_insight.monitor.dm_collector import dm_collector_c
+
 import itertools
 
 
@@ -40,6 +42,10 @@ class SuperEncoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, datetime):
             return str(obj)
+        if isinstance(obj, bytearray):
+            return "0x" + binascii.b2a_hex(obj)
+        if isinstance(obj, dm_collector_c.Record):
+            return dict(obj)
         # Let the base class default method raise the TypeError
         return json.JSONEncoder.default(self, obj)
 
@@ -59,6 +65,11 @@ class DMLogPacket:
     timestamp, and a payload field that store useful information of a
     phone. This class will decode both the header and payload fields.
 
+    A packet can also be read as a read-only mapping of its fields, e.g.
+    ``packet["timestamp"]``. If it is received with output="lazy", the
+    header fields are read without decoding the payload, which is decoded
+    (and dissected) on the first access to any other field.
+
     This class depends on Wireshark to decode some 3GPP standardized
     messages.
     """
@@ -69,12 +80,93 @@ class DMLogPacket:
         """
         Initialize a log packet.
 
-        :param decoded_list: output of *dm_collector_c* library
-        :type decoded_list: list
+        :param decoded_list: output of *dm_collector_c* library. It is a
+            (dict, raw_msgs, fields) tuple if the packet is received with
+            output="dict", or a (header, frame, formats) tuple with
+            output="lazy".
+        :type decoded_list: list or tuple
+        """
+        self._header = None
+        self._frame = None
+        if isinstance(decoded_list, tuple) and isinstance(decoded_list[1], str):
+            # Only the header is decoded. The payload is decoded from the
+            # frame when needed.
+            self._header, self._frame, self._formats = decoded_list
+            self._decoded_dict = None
+            self._decoded_list = None
+        else:
+            self._load(decoded_list)
+
+    def _load(self, decoded_list, dissected=None):
+        """
+        Preparse the decoded result of a packet.
+
+        :param decoded_list: output of *dm_collector_c* library, as in
+            __init__() except for (header, frame, formats).
+        :type decoded_list: list or tuple
+
+        :param dissected: the raw messages already dissected, as in
+            _preparse_internal_list()
+        :type dissected: list or None
         """
         cls = self.__class__
 
-        self._decoded_list = cls._preparse_internal_list(decoded_list)
+        if isinstance(decoded_list, tuple):
+            # Already converted to a dict by dm_collector_c, except for the
+            # raw messages to be dissected by Wireshark. The fields are kept
+            # in order for decode_xml().
+            d, raw_msgs, fields = decoded_list
+            if dissected is None:
+                dissected = cls._decode_msgs(cls._raw_msgs(raw_msgs))
+            for field_name, val, type_str in cls._preparse_internal_list(raw_msgs,
+                                                                         dissected):
+                d[field_name] = val
+            self._decoded_dict = d
+            self._decoded_list = None
+            self._ordered_fields = fields
+            self._dissected = dissected
+        else:
+            self._ordered_fields = None
+            self._dissected = None
+            self._decoded_dict = None
+            self._decoded_list = cls._preparse_internal_list(decoded_list,
+                                                             dissected)
+
+    @classmethod
+    def _raw_msgs(cls, decoded_list):
+        """
+        :returns: (msg_type, b) of the raw messages in a result list
+        """
+        return [(type_str[len("raw_msg/"):], val)
+                for field_name, val, type_str in decoded_list
+                if type_str.startswith("raw_msg/")]
+
+    @classmethod
+    def preload(cls, packets):
+        """
+        Decode the payloads of packets received with output="lazy", and
+        dissect the messages of all of them in one batch, in parallel if
+        WSDissector runs more than one worker. Other packets are left as
+        they are, and so are the packets not decoded if it fails.
+
+        :param packets: the packets to be decoded
+        :type packets: list of DMLogPacket
+        """
+        pending = [p for p in packets if p._frame is not None]
+        decoded = [dm_collector_c.decode_frame(p._frame, "dict", *p._formats)
+                   for p in pending]
+        msgs = []
+        for d in decoded:
+            if d is not None:
+                msgs.extend(cls._raw_msgs(d[1]))
+        dissected = cls._decode_msgs(msgs)
+        start = 0
+        for p, d in zip(pending, decoded):
+            n = (len(d[1]) if d is not None else 0)
+            p._load(d, dissected[start:start + n])
+            p._frame = None
+            p._header = None
+            start += n
 
     @classmethod
     @static_var("wcdma_sib_types", {0: "RRC_MIB",
@@ -86,16 +178,26 @@ class DMLogPacket:
                                     27: "RRC_SB1",
                                     31: "RRC_SIB19",
                                     })
-    def _preparse_internal_list(cls, decoded_list):
+    def _preparse_internal_list(cls, decoded_list, dissected=None):
+        """
+        Replace the raw messages in a result list with their dissections.
+
+        :param dissected: XML strings of the raw messages in decoded_list,
+            in order. If set to None, they are dissected here in one batch.
+        :type dissected: list or None
+        """
         lst = []
         try:
+            if dissected is None:
+                dissected = cls._decode_msgs(cls._raw_msgs(decoded_list))
+            dissected = iter(dissected)
             # for i in range(len(decoded_list)):
             i = 0
             while i < len(decoded_list):
                 field_name, val, type_str = decoded_list[i]
                 if type_str.startswith("raw_msg/"):
                     msg_type = type_str[len("raw_msg/"):]
-                    decoded = cls._decode_msg(msg_type, val)
+                    decoded = next(dissected)
                     xmls = [decoded, ]
 
                     if msg_type == "RRC_DL_BCCH_BCH":
@@ -218,7 +320,10 @@ class DMLogPacket:
                             "key": field_name})
 
                 if not type_str:
-                    xx = str(xx)
+                    if isinstance(xx, bytearray):   # raw byte stream
+                        xx = "0x" + binascii.b2a_hex(xx)
+                    else:
+                        xx = str(xx)
                     sub_tag.text = xx
                 else:
                     if type_str == "msg":
@@ -238,6 +343,54 @@ class DMLogPacket:
         elif out_type.startswith("xml/"):
             return output_xml
 
+    def _ensure_decoded(self):
+        """
+        Decode the payload of a packet received with output="lazy". If it
+        fails, the packet is left as it is, so the header is still readable
+        and the decoding can be retried.
+        """
+        if self._frame is not None:
+            self._load(dm_collector_c.decode_frame(self._frame, "dict",
+                                                   *self._formats))
+            self._frame = None
+            self._header = None
+
+    def _fields(self):
+        """
+        :returns: the decoded fields as a dict, which must not be modified.
+        """
+        self._ensure_decoded()
+        if self._decoded_dict is None:
+            cls = self.__class__
+            self._decoded_dict = cls._parse_internal_list("dict",
+                                                          self._decoded_list)
+        return self._decoded_dict
+
+    def __getitem__(self, key):
+        if self._header is not None and key in self._header:
+            return self._header[key]
+        return self._fields()[key]
+
+    def __contains__(self, key):
+        if self._header is not None and key in self._header:
+            return True
+        return key in self._fields()
+
+    def get(self, key, default=None):
+        """
+        Get a field of the packet, as decode().get(key, default). Unlike
+        decode(), the value is not copied, and must not be modified.
+        """
+        if key in self:
+            return self[key]
+        return default
+
+    def keys(self):
+        """
+        :returns: the names of the fields of the packet, as decode().keys()
+        """
+        return self._fields().keys()
+
     def decode(self):
         """
         Decode a DM log packet.
@@ -263,9 +416,34 @@ class DMLogPacket:
         """
         cls = self.__class__
 
+        self._ensure_decoded()
+        if self._decoded_dict is not None:
+            return cls._copy_decoded(self._decoded_dict)
         d = cls._parse_internal_list("dict", self._decoded_list)
         return d
 
+    @classmethod
+    def _copy_decoded(cls, d):
+        """
+        Copy a decoded dict, and the dicts nested in it, so that the caller
+        may modify them without affecting the packet. Other values are
+        immutable and shared.
+        """
+        copied = dict(d)
+        for k, v in d.iteritems():
+            if isinstance(v, dict):
+                copied[k] = cls._copy_decoded(v)
+            elif isinstance(v, tuple) and any(isinstance(x, (dict, tuple)) for x in v):
+                copied[k] = cls._copy_decoded_tuple(v)
+        return copied
+
+    @classmethod
+    def _copy_decoded_tuple(cls, t):
+        return tuple(cls._copy_decoded(v) if isinstance(v, dict)
+                     else cls._copy_decoded_tuple(v) if isinstance(v, tuple)
+                     else v
+                     for v in t)
+
     def decode_xml(self):
         """
         Decode the message and convert to a standard XML document.
@@ -274,7 +452,12 @@ class DMLogPacket:
         """
         cls = self.__class__
 
-        xml = cls._parse_internal_list("xml/dict", self._decoded_list)
+        self._ensure_decoded()
+        decoded_list = self._decoded_list
+        if decoded_list is None:
+            decoded_list = cls._preparse_internal_list(self._ordered_fields,
+                                                       self._dissected)
+        xml = cls._parse_internal_list("xml/dict", decoded_list)
         # Zengwen: what about this name?
         xml.tag = "dm_log_packet"
         return ET.tostring(xml)
@@ -304,13 +487,16 @@ class DMLogPacket:
 
         This method should be called before any actual decoding.
 
-        :param prefs: a dict storing the preferences
+        :param prefs: a dict storing the preferences:
+            "ws_dissect_executable_path", "libwireshark_path" and
+            "ws_dissect_workers" (see WSDissector.init_proc())
         :type prefs: dict
         """
         if cls._init_called:
             return
         WSDissector.init_proc(prefs.get("ws_dissect_executable_path", None),
-                              prefs.get("libwireshark_path", None))
+                              prefs.get("libwireshark_path", None),
+                              prefs.get("ws_dissect_workers", 1))
         cls._init_called = True
 
     @classmethod
@@ -344,6 +530,15 @@ class DMLogPacket:
         s = WSDissector.decode_msg(msg_type, b)
         return s
 
+    @classmethod
+    def _decode_msgs(cls, msgs):
+        """
+        Decode a batch of standard messages using WSDissector.
+        """
+        assert cls._init_called
+
+        return WSDissector.decode_msgs(msgs)
+
     @classmethod
     def _wrap_decoded_xml(cls, xmls):
         """
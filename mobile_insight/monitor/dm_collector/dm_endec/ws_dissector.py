@@ -11,9 +11,38 @@ __all__ = ["WSDissector"]
 import os
 import binascii
 import platform
+import Queue
 import struct
 import subprocess
 import sys
+import threading
+
+
+class _Batch(object):
+    """
+    Results of a batch of messages dissected by the worker pool, by their
+    positions in the batch.
+    """
+
+    def __init__(self, n):
+        self.results = [None] * n
+        self.error = None
+        self._remaining = n
+        self._done = threading.Condition()
+
+    def set_result(self, i, result, error=None):
+        with self._done:
+            self.results[i] = result
+            if error is not None and self.error is None:
+                self.error = error
+            self._remaining -= 1
+            if self._remaining == 0:
+                self._done.notify_all()
+
+    def wait(self):
+        with self._done:
+            while self._remaining > 0:
+                self._done.wait()
 
 
 class WSDissector:
@@ -62,23 +91,39 @@ class WSDissector:
         "LTE-PDCP_DL_SRB": 300,
         "LTE-PDCP_UL_SRB": 301,
     }
-    _proc = None
+    _proc = None    # the first worker
+    _procs = []
+    # Messages to be dissected by the worker threads, one per process. Only
+    # used with more than one worker.
+    _tasks = None
+    # Held while the first worker is used without a worker thread
+    _lock = threading.Lock()
+    # Held while _procs is changed
+    _procs_lock = threading.Lock()
+    _popen_args = None
     _init_proc_called = False
 
     @classmethod
-    def init_proc(cls, executable_path, ws_library_path):
+    def init_proc(cls, executable_path, ws_library_path, workers=1):
         """
         Launch the ws_dissector program. Must be called before any actual
-        decoding, and should be called only once.
+        decoding.
+
+        If it is called again with more workers, the pool is grown with the
+        paths of the first call. Otherwise later calls have no effect.
 
         :param executable_path: path to ws_dissector. If set to None, uses the default path.
         :type executable_path: string or None
 
         :param ws_library_path: a directory that contains libwireshark. If set to None, uses the default path.
         :type ws_library_path: string or None
+
+        :param workers: number of ws_dissector processes. The messages of a batch passed to decode_msgs() are dissected by them in parallel
+        :type workers: int
         """
 
         if cls._init_proc_called:
+            cls._add_workers(workers - len(cls._procs))
             return
         if executable_path:
             real_executable_path = executable_path
@@ -96,31 +141,112 @@ class WSDissector:
             if ws_library_path:
                 env["LD_LIBRARY_PATH"] = ws_library_path + \
                     ":" + env.get("LD_LIBRARY_PATH", "")
-        cls._proc = subprocess.Popen([real_executable_path],
-                                     bufsize=-1,
-                                     stdin=subprocess.PIPE,
-                                     stdout=subprocess.PIPE,
-                                     env=env
-                                     )
+        cls._popen_args = ([real_executable_path], env)
+        cls._proc = cls._launch()
+        cls._procs = [cls._proc]
         cls._init_proc_called = True
+        cls._add_workers(workers - 1)
 
     @classmethod
-    def decode_msg(cls, msg_type, b):
+    def _launch(cls):
+        args, env = cls._popen_args
+        return subprocess.Popen(args,
+                                bufsize=-1,
+                                stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                env=env
+                                )
+
+    @classmethod
+    def _add_workers(cls, n):
         """
-        Decode a binary message of type msg_type.
+        Launch n more ws_dissector processes, each served by a daemon thread.
+        """
+        if n <= 0:
+            return
+        with cls._lock:
+            if cls._tasks is None:
+                cls._tasks = Queue.Queue()
+                cls._start_thread(cls._proc)
+        for i in range(n):
+            proc = cls._launch()
+            with cls._procs_lock:
+                cls._procs.append(proc)
+            cls._start_thread(proc)
 
-        :param msg_type: the type of the message to be decoded
-        :type msg_type: string
+    @classmethod
+    def _stop(cls, proc):
+        """
+        Make sure that a ws_dissector process that failed has exited.
+        """
+        if proc.poll() is None:
+            try:
+                proc.kill()
+            except OSError:
+                pass
+        proc.wait()
 
-        :param b: binary data to be decoded
-        :type b: string
+    @classmethod
+    def _relaunch(cls, proc):
+        """
+        Replace an exited ws_dissector process with a new one in the pool.
 
-        :returns: an XML string
+        :returns: the new process. If it cannot be launched, proc is taken out
+            of the pool and None is returned, unless proc is the last one,
+            which is returned so that later messages fail instead of waiting.
         """
-        assert cls._init_proc_called
-        if msg_type not in cls.SUPPORTED_TYPES:
-            return None
+        with cls._procs_lock:
+            try:
+                new_proc = cls._launch()
+            except OSError:
+                new_proc = None
+            if proc not in cls._procs:
+                return new_proc
+            i = cls._procs.index(proc)
+            if new_proc is None:
+                if len(cls._procs) == 1:
+                    return proc
+                del cls._procs[i]
+                if cls._proc is proc:
+                    cls._proc = cls._procs[0]
+                return None
+            cls._procs[i] = new_proc
+            if cls._proc is proc:
+                cls._proc = new_proc
+            return new_proc
+
+    @classmethod
+    def _start_thread(cls, proc):
+        t = threading.Thread(target=cls._serve, args=(proc,))
+        t.daemon = True
+        t.start()
+
+    @classmethod
+    def _serve(cls, proc):
+        """
+        Dissect the messages in the task queue with proc, until the program
+        exits. If proc exits, the message it was dissecting fails, and proc
+        is relaunched; the thread stops if it cannot be relaunched.
+        """
+        while proc is not None:
+            batch, i, msg_type, b = cls._tasks.get()
+            try:
+                result = cls._dissect(proc, msg_type, b)
+            except Exception as e:
+                batch.set_result(i, None, e)
+                if proc.poll() is not None:
+                    proc = cls._relaunch(proc)
+            else:
+                batch.set_result(i, result)
 
+    @classmethod
+    def _dissect(cls, proc, msg_type, b):
+        """
+        Send a message of a supported type to a ws_dissector process.
+
+        :returns: an XML string
+        :raises RuntimeError: the process exits before the message is dissected
+        """
         input_data = struct.pack(
             "!II",  # in network order
             cls.SUPPORTED_TYPES[msg_type],
@@ -128,17 +254,90 @@ class WSDissector:
         )
         input_data += b
 
-        cls._proc.stdin.write(input_data)
-        cls._proc.stdin.flush()
+        try:
+            proc.stdin.write(input_data)
+            proc.stdin.flush()
+        except (IOError, OSError) as e:
+            cls._stop(proc)
+            raise RuntimeError("ws_dissector cannot receive a %s message: %s"
+                               % (msg_type, e))
         result = []
         while True:
-            line = cls._proc.stdout.readline()
+            line = proc.stdout.readline()
+            if not line:
+                cls._stop(proc)
+                raise RuntimeError("ws_dissector exited while dissecting a %s message"
+                                   % msg_type)
             if line.startswith("===___==="):
                 break
             result.append(line)
 
         return "".join(result)
 
+    @classmethod
+    def worker_count(cls):
+        """
+        :returns: the number of ws_dissector processes
+        """
+        return len(cls._procs)
+
+    @classmethod
+    def decode_msg(cls, msg_type, b):
+        """
+        Decode a binary message of type msg_type.
+
+        :param msg_type: the type of the message to be decoded
+        :type msg_type: string
+
+        :param b: binary data to be decoded
+        :type b: string
+
+        :returns: an XML string
+        """
+        return cls.decode_msgs([(msg_type, b)])[0]
+
+    @classmethod
+    def decode_msgs(cls, msgs):
+        """
+        Decode a batch of binary messages. With more than one worker, they are
+        dissected in parallel. It is safe to call this method from several
+        threads.
+
+        :param msgs: (msg_type, b) of each message, as in decode_msg()
+        :type msgs: list
+
+        :returns: a list of XML strings (None for unsupported types), in the order of msgs
+        :raises RuntimeError: a ws_dissector process exits while dissecting
+            a message of the batch. The process is relaunched for later
+            batches.
+        """
+        assert cls._init_proc_called
+        todo = [(i, msg_type, b) for i, (msg_type, b) in enumerate(msgs)
+                if msg_type in cls.SUPPORTED_TYPES]
+        if len(todo) == 0:
+            return [None] * len(msgs)
+        with cls._lock:
+            if cls._tasks is None:
+                results = [None] * len(msgs)
+                for i, msg_type, b in todo:
+                    try:
+                        results[i] = cls._dissect(cls._proc, msg_type, b)
+                    except RuntimeError:
+                        cls._relaunch(cls._proc)
+                        raise
+                return results
+
+        batch = _Batch(len(msgs))
+        for i in range(len(msgs)):
+            if msgs[i][0] not in cls.SUPPORTED_TYPES:
+                batch.set_result(i, None)
+        for i, msg_type, b in todo:
+            cls._tasks.put((batch, i, msg_type, b))
+        batch.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.results
+
 
 # Test decoding
 if __name__ == "__main__":
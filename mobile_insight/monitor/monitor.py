@@ -20,6 +20,9 @@ class Monitor(Element):
         Element.__init__(self)
 
         self._skip_decoding = False
+        self._timestamp_format = "datetime"
+        self._byte_stream_format = "hex"
+        self._record_format = "dict"
 
         self._save_log_path = None
         self._save_file = None
@@ -50,6 +53,33 @@ class Monitor(Element):
         """
         self._skip_decoding = decoding
 
+    def set_timestamp_format(self, timestamp_format):
+        """
+        Configure the format of the timestamps in decoded messages
+
+        :param timestamp_format: "datetime" (default), "epoch" (float seconds since 1970-01-01, taking the device time as UTC) or "ticks" (int, raw QCDM ticks since 1980-01-06). Numeric formats avoid creating a datetime object for every message
+        :type timestamp_format: string
+        """
+        self._timestamp_format = timestamp_format
+
+    def set_byte_stream_format(self, byte_stream_format):
+        """
+        Configure the format of byte stream fields (e.g. payloads and masks) in decoded messages
+
+        :param byte_stream_format: "hex" (default, a str such as "0x01ab") or "bytes" (a bytearray of the same bytes). Raw bytes save formatting hex strings that are never read
+        :type byte_stream_format: string
+        """
+        self._byte_stream_format = byte_stream_format
+
+    def set_record_format(self, record_format):
+        """
+        Configure the format of the elements of list fields (e.g. the PDUs of a subpacket) in decoded messages
+
+        :param record_format: "dict" (default) or "record" (a read-only mapping that takes a fraction of the memory of a dict, and can be converted with dict()). Fields of a record are read as in a dict, or as attributes named after them in lowercase with other characters replaced by "_"
+        :type record_format: string
+        """
+        self._record_format = record_format
+
     # Add an analyzer that needs the message
     def register(self, analyzer):
         """
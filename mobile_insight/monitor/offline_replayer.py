@@ -15,6 +15,16 @@ import timeit
 
 from monitor import Monitor, Event
 from dm_collector import dm_collector_c, DMLogPacket, FormatError
+from dm_collector.dm_endec import WSDissector
+
+# Extensions of the logs read from a directory
+LOG_EXTENSIONS = tuple(ext + compression
+                       for ext in (".mi2log", ".qmdl")
+                       for compression in ("", ".gz", ".zst"))
+
+# Number of packets decoded ahead in one batch, when messages are dissected
+# by more than one worker (see OfflineReplayer.set_dissector_workers())
+DISSECT_BATCH_SIZE = 64
 
 
 class OfflineReplayer(Monitor):
@@ -68,6 +78,11 @@ class OfflineReplayer(Monitor):
         DMLogPacket.init(prefs)
 
         self._type_names = []
+        # Filter and export state of this replayer
+        self._collector = dm_collector_c.Collector()
+        # Time window of replay (None for unbounded)
+        self._start_time = None
+        self._end_time = None
 
     def __del__(self):
         if self.is_android and self.service_context:
@@ -116,7 +131,7 @@ class OfflineReplayer(Monitor):
             if n not in self._type_names:
                 self._type_names.append(n)
                 self.log_info("Enable " + n)
-        dm_collector_c.set_filtered(self._type_names)
+        self._collector.set_filtered(self._type_names)
 
     def enable_log_all(self):
         """
@@ -125,27 +140,169 @@ class OfflineReplayer(Monitor):
         cls = self.__class__
         self.enable_log(cls.SUPPORTED_TYPES)
 
+    def set_timestamp_format(self, timestamp_format):
+        """
+        Configure the format of the timestamps in decoded messages
+
+        :param timestamp_format: "datetime" (default), "epoch" or "ticks". See Monitor.set_timestamp_format()
+        :type timestamp_format: string
+
+        :except ValueError: unsupported timestamp format encountered
+        """
+        self._collector.set_timestamp_format(timestamp_format)
+        Monitor.set_timestamp_format(self, timestamp_format)
+
+    def set_byte_stream_format(self, byte_stream_format):
+        """
+        Configure the format of byte stream fields in decoded messages
+
+        :param byte_stream_format: "hex" (default) or "bytes". See Monitor.set_byte_stream_format()
+        :type byte_stream_format: string
+
+        :except ValueError: unsupported byte stream format encountered
+        """
+        self._collector.set_byte_stream_format(byte_stream_format)
+        Monitor.set_byte_stream_format(self, byte_stream_format)
+
+    def set_record_format(self, record_format):
+        """
+        Configure the format of the elements of list fields in decoded messages
+
+        :param record_format: "dict" (default) or "record". See Monitor.set_record_format()
+        :type record_format: string
+
+        :except ValueError: unsupported record format encountered
+        """
+        self._collector.set_record_format(record_format)
+        Monitor.set_record_format(self, record_format)
+
+    def set_dissector_workers(self, workers):
+        """
+        Configure the number of Wireshark dissector processes, which are shared by all monitors. It can only be increased.
+
+        :param workers: number of ws_dissector processes. With more than one, the packets to be sent to analyzers are decoded ahead in batches of DISSECT_BATCH_SIZE, whose messages are dissected in parallel. Packets are still sent in order
+        :type workers: int
+        """
+        WSDissector.init_proc(None, None, workers)
+
     def set_input_path(self, path):
         """
         Set the replay trace path
 
+        Logs compressed with gzip or zstd (e.g. .mi2log.gz or .qmdl.zst) are decompressed on the fly.
+
         :param path: the replay file path. If it is a directory, the OfflineReplayer will read all logs under this directory (logs in subdirectories are ignored)
         :type path: string
         """
-        dm_collector_c.reset()
         self._input_path = path
         # self._input_file = open(path, "rb")
 
+    def set_time_window(self, start=None, end=None):
+        """
+        Only replay the messages whose device timestamps are within [start, end).
+
+        The frames are located with the index of each log (saved as a .mi2idx file next to the log),
+        so that the frames out of the window, or of types not enabled by enable_log(), are skipped without decoding.
+
+        :param start: the start of the window, or None for the beginning of the logs
+        :type start: datetime.datetime
+        :param end: the end of the window (exclusive), or None for the end of the logs
+        :type end: datetime.datetime
+        """
+        self._start_time = start
+        self._end_time = end
+
     def save_log_as(self, path):
         """
         Save the log as a mi2log file (for offline analysis)
 
-        :param path: the file name to be saved
+        :param path: the file name to be saved. If it ends with ".gz" or ".zst", the log is compressed with gzip or zstd
         :type path: string
-        :param log_types: a filter of message types to be saved
-        :type log_types: list of string
         """
-        dm_collector_c.set_filtered_export(path, self._type_names)
+        self._collector.set_filtered_export(path, self._type_names)
+
+    def save_logs_as(self, routes):
+        """
+        Save the logs of different types to different mi2log files
+
+        All files are written in one pass over the replayed logs,
+        regardless of the message types enabled by enable_log().
+
+        :param routes: the files to be saved and the message types saved in each of them
+        :type routes: list of (string, list of string)
+        """
+        self._collector.set_export_routes(routes)
+
+    def __get_log_list(self):
+        """
+        Return the logs to be replayed, or None if the input path does not exist
+        """
+        log_list = []
+        if os.path.isfile(self._input_path):
+            log_list = [self._input_path]
+        elif os.path.isdir(self._input_path):
+            for file in os.listdir(self._input_path):
+                if file.endswith(LOG_EXTENSIONS):
+                    # log_list.append(self._input_path+"/"+file)
+                    log_list.append(os.path.join(self._input_path, file))
+        else:
+            return None
+
+        log_list.sort()  # Hidden assumption: logs follow the diag_log_TIMSTAMP_XXX format
+        return log_list
+
+    def read_columns(self, type_name, record_path=None):
+        """
+        Decode all messages of one type in the replayed logs into a NumPy structured array, with one column per field
+
+        No event is sent to analyzers, and the messages are not saved by save_log_as().
+        The time window set by set_time_window() is applied. NumPy is required.
+
+        :param type_name: the message type to be decoded
+        :type type_name: string
+        :param record_path: a list field of the messages (e.g. "Records" or "Subpackets.RLCUL PDUs"). If set, each element of the list is a row, instead of each message. See dm_collector_c.ColumnTable for the names of the columns
+        :type record_path: string
+        :returns: a numpy.ndarray with one record per row
+        """
+        import numpy
+
+        table = dm_collector_c.ColumnTable(record_path)
+        for file in self.__get_log_list() or []:
+            for decoded in self._collector.replay_file(file,
+                                                       [type_name],
+                                                       False,  # skip_decoding
+                                                       False,  # include_timestamp
+                                                       self._start_time,
+                                                       self._end_time,
+                                                       ):
+                table.append(decoded)
+        descr, data = table.pack()
+        if len(table) == 0:
+            return numpy.zeros(0, dtype=numpy.dtype(descr))
+        return numpy.frombuffer(data, dtype=numpy.dtype(descr))
+
+    def __read_packets(self, decoded_iter):
+        """
+        Wrap the packets of a replay. If messages are dissected by more than
+        one worker, the packets to be sent are decoded ahead in batches.
+        """
+        if WSDissector.worker_count() <= 1:
+            for decoded in decoded_iter:
+                yield DMLogPacket(decoded[0])
+            return
+        batch = []
+        for decoded in decoded_iter:
+            batch.append(DMLogPacket(decoded[0]))
+            if len(batch) >= DISSECT_BATCH_SIZE:
+                DMLogPacket.preload([p for p in batch
+                                     if p["type_id"] in self._type_names])
+                for packet in batch:
+                    yield packet
+                batch = []
+        DMLogPacket.preload([p for p in batch
+                             if p["type_id"] in self._type_names])
+        for packet in batch:
+            yield packet
 
     def run(self):
         """
@@ -160,56 +317,39 @@ class OfflineReplayer(Monitor):
 
             self.broadcast_info('STARTED',{})
 
-            log_list = []
-            if os.path.isfile(self._input_path):
-                log_list = [self._input_path]
-            elif os.path.isdir(self._input_path):
-                for file in os.listdir(self._input_path):
-                    if file.endswith(".mi2log") or file.endswith(".qmdl"):
-                        # log_list.append(self._input_path+"/"+file)
-                        log_list.append(os.path.join(self._input_path, file))
-            else:
+            log_list = self.__get_log_list()
+            if log_list is None:
                 return
 
-            log_list.sort()  # Hidden assumption: logs follow the diag_log_TIMSTAMP_XXX format
-
             for file in log_list:
                 self.log_info("Loading " + file)
-                self._input_file = open(file, "rb")
-                dm_collector_c.reset()
-                while True:
-                    s = self._input_file.read(64)
-                    if not s:   # EOF encountered
-                        break
-
-                    dm_collector_c.feed_binary(s)
-                    # decoded = dm_collector_c.receive_log_packet()
-                    decoded = dm_collector_c.receive_log_packet(self._skip_decoding,
-                                                                True,   # include_timestamp
-                                                                )
-                    if decoded:
-                        try:
-                            # packet = DMLogPacket(decoded)
-                            packet = DMLogPacket(decoded[0])
-                            # print "DMLogPacket decoded[0]:",str(decoded[0])
-                            d = packet.decode()
-                            # print d["type_id"], d["timestamp"]
-                            # xml = packet.decode_xml()
-                            # print xml
-                            # print ""
-                            # Send event to analyzers
-
-                            if d["type_id"] in self._type_names:
-                                event = Event(timeit.default_timer(),
-                                              d["type_id"],
-                                              packet)
-                                self.send(event)
-
-                        except FormatError as e:
-                            # skip this packet
-                            print "FormatError: ", e
-
-                self._input_file.close()
+                # Frames are read straight from the mapped file, using the
+                # filter (and export) configured by enable_log()/save_log_as()
+                decoded_iter = self._collector.replay_file(file,
+                                                           None,
+                                                           self._skip_decoding,
+                                                           True,   # include_timestamp
+                                                           self._start_time,
+                                                           self._end_time,
+                                                           "lazy",  # output
+                                                           )
+                for packet in self.__read_packets(decoded_iter):
+                    try:
+                        # print packet["type_id"], packet["timestamp"]
+                        # xml = packet.decode_xml()
+                        # print xml
+                        # print ""
+                        # Send event to analyzers
+
+                        if packet["type_id"] in self._type_names:
+                            event = Event(timeit.default_timer(),
+                                          packet["type_id"],
+                                          packet)
+                            self.send(event)
+
+                    except FormatError as e:
+                        # skip this packet
+                        print "FormatError: ", e
 
         except Exception as e:
             import traceback
@@ -27,14 +27,30 @@ PY2EXE_OPTIONS = {
     "bundle_files": 1, # bundle everything
 }
 
+# Compressed logs: gzip is always supported, and zstd if libzstd is installed
+COMPRESSION_MACROS = []
+COMPRESSION_LIBS   = ["z"]
+for prefix in ["/usr", "/usr/local"]:
+    if os.path.isfile(os.path.join(prefix, "include", "zstd.h")):
+        COMPRESSION_MACROS.append(('HAVE_ZSTD', 1))
+        COMPRESSION_LIBS.append("zstd")
+        break
+
 dm_collector_c_module = Extension('mobile_insight.monitor.dm_collector.dm_collector_c',
                                 sources = [ "dm_collector_c/dm_collector_c.cpp",
+                                            "dm_collector_c/column_table.cpp",
+                                            "dm_collector_c/compressed_file.cpp",
+                                            "dm_collector_c/decode_stats.cpp",
                                             "dm_collector_c/export_manager.cpp",
                                             "dm_collector_c/hdlc.cpp",
                                             "dm_collector_c/log_config.cpp",
+                                            "dm_collector_c/log_index.cpp",
                                             "dm_collector_c/log_packet.cpp",
+                                            "dm_collector_c/mapped_file.cpp",
+                                            "dm_collector_c/record.cpp",
                                             "dm_collector_c/utils.cpp",],
-                                define_macros=[ ('EXPOSE_INTERNAL_LOGS', 1), ]
+                                define_macros=[ ('EXPOSE_INTERNAL_LOGS', 1), ] + COMPRESSION_MACROS,
+                                libraries = COMPRESSION_LIBS,
                                 )
 
 def parse_libs(url,suffix):
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# Filename: decode-xml-test.py
+
+"""
+Check that DMLogPacket.decode_xml() gives the same XML document whether a
+packet is received with output="list", "dict" or "lazy", i.e. the fields
+keep their order and fields of the same name are all kept.
+
+The Wireshark dissector is the installed one, unless the
+WS_DISSECT_EXECUTABLE_PATH and LIBWIRESHARK_PATH environment variables are
+set.
+
+Usage:
+python decode-xml-test.py
+"""
+
+import os
+import unittest
+
+from mobile_insight.monitor.dm_collector import dm_collector_c
+from mobile_insight.monitor.dm_collector.dm_endec import DMLogPacket
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test-logs")
+LOGS = ["att.mi2log", "cmcc.mi2log", "tmobile.mi2log"]
+
+
+def replay(path, output):
+    """
+    :returns: the DMLogPacket objects of all packets in a log file
+    """
+    types = list(dm_collector_c.log_packet_types)
+    return [DMLogPacket(decoded)
+            for decoded in dm_collector_c.replay_file(path, types, False, False,
+                                                      None, None, output)]
+
+
+class DecodeXmlTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        DMLogPacket.init({
+            "ws_dissect_executable_path": os.environ.get("WS_DISSECT_EXECUTABLE_PATH"),
+            "libwireshark_path": os.environ.get("LIBWIRESHARK_PATH"),
+        })
+
+    def check_log(self, log_name, output, preload=False):
+        path = os.path.join(LOG_DIR, log_name)
+        expected = [p.decode_xml() for p in replay(path, "list")]
+        packets = replay(path, output)
+        if preload:
+            DMLogPacket.preload(packets)
+        self.assertEqual(len(packets), len(expected))
+        for i, p in enumerate(packets):
+            self.assertEqual(p.decode_xml(), expected[i],
+                             "%s: packet %d differs" % (log_name, i))
+
+    def test_dict(self):
+        for log_name in LOGS:
+            self.check_log(log_name, "dict")
+
+    def test_lazy(self):
+        for log_name in LOGS:
+            self.check_log(log_name, "lazy")
+
+    def test_lazy_preloaded(self):
+        for log_name in LOGS:
+            self.check_log(log_name, "lazy", preload=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+#!/usr/bin/python
+# Filename: hdlc-framing-benchmark.py
+
+"""
+Micro-benchmark of the HDLC framing core of dm_collector_c.
+
+It measures the throughput (bytes/sec) of delimiter scanning, unescaping and
+CRC checking, without decoding, by replaying a mi2log with an empty filter
+and strict CRC checking. The early rejection of filtered-out frames and the
+export path (writing the accepted frames through to a mi2log unchanged) are
+measured as well.
+
+"reference" does the same framing as "feed" in pure Python, one byte at a
+time, as dm_collector_c did before it scanned with memchr() and computed CRCs
+with slicing-by-8 tables. It does not depend on dm_collector_c, so results
+from different machines or builds can be compared as multiples of it.
+
+Results on examples/offline_log_example.mi2log (best of 15), with the
+byte-wise hdlc.cpp ("before") and with memchr() and slicing-by-8 ("after"):
+
+    reference   2.5 MB/s
+    feed      245 MB/s  (98x) -> 663 MB/s (265x)
+    replay    212 MB/s  (85x) -> 661 MB/s (264x)
+    export     30 MB/s  (12x) ->  42 MB/s  (17x)
+
+The export results above were measured when the exported frames were still
+re-encoded and their CRCs recomputed. With the write-through export, export
+reaches 70 MB/s (24x) on the same log.
+
+Usage:
+python hdlc-framing-benchmark.py [LOG_PATH] [REPEAT]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+from mobile_insight.monitor.dm_collector import dm_collector_c
+
+DEFAULT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           "..", "examples", "offline_log_example.mi2log")
+CHUNK_SIZE = 64 * 1024
+
+
+def make_crc_table():
+    """
+    :returns: the table of the CRC-16 used by HDLC frames (polynomial 0x11021,
+        bit reversed)
+    """
+    table = []
+    for i in range(256):
+        crc = i
+        for k in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ 0x8408
+            else:
+                crc >>= 1
+        table.append(crc)
+    return table
+
+
+CRC_TABLE = make_crc_table()
+
+
+def reference_unpack(frame):
+    """
+    Unescape a frame (without its delimiter) and check its CRC, one byte at a
+    time.
+
+    :returns: True if the CRC is correct
+    """
+    unescaped = bytearray()
+    escaped = False
+    for c in frame:
+        if escaped:
+            unescaped.append(c ^ 0x20)
+            escaped = False
+        elif c == 0x7d:
+            escaped = True
+        else:
+            unescaped.append(c)
+    if len(unescaped) <= 2:
+        return False
+    crc = 0xFFFF
+    for c in unescaped[:-2]:
+        crc = CRC_TABLE[(c ^ crc) & 0xFF] ^ (crc >> 8)
+    crc ^= 0xFFFF
+    return crc == unescaped[-2] | (unescaped[-1] << 8)
+
+
+def bench_reference(data):
+    """
+    Scan the log for delimiters, and unescape and check all frames, in pure
+    Python.
+
+    :returns: the number of frames whose CRCs are correct
+    """
+    n_correct = 0
+    frame = bytearray()
+    for c in bytearray(data):
+        if c == 0x7e:
+            if frame and reference_unpack(frame):
+                n_correct += 1
+            frame = bytearray()
+        else:
+            frame.append(c)
+    return n_correct
+
+
+def bench_feed(data):
+    """
+    Feed the whole log in chunks, and unescape and check all frames.
+    """
+    collector = dm_collector_c.Collector()
+    collector.set_filtered([])
+    collector.set_strict_crc(True)
+    for i in range(0, len(data), CHUNK_SIZE):
+        collector.feed_binary(data[i:i + CHUNK_SIZE])
+        collector.receive_log_packets(0, True)
+
+
+def bench_replay(path):
+    """
+    Frame the memory-mapped log with replay_file(), rejecting all frames
+    before they are unescaped.
+    """
+    for decoded in dm_collector_c.replay_file(path, [], True):
+        pass
+
+
+def bench_export(data, out_path):
+    """
+    Frame the log and write every log packet through to out_path, as it is
+    in the log.
+    """
+    collector = dm_collector_c.Collector()
+    collector.set_filtered_export(out_path, dm_collector_c.log_packet_types)
+    for i in range(0, len(data), CHUNK_SIZE):
+        collector.feed_binary(data[i:i + CHUNK_SIZE])
+        collector.receive_log_packets(0, True)
+    # Close the exported file
+    del collector
+
+
+def report(name, nbytes, seconds):
+    print "%-9s %8.1f MB/s  (%.4f s)" % (name, nbytes / seconds / 1e6, seconds)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LOG
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with open(path, "rb") as f:
+        data = f.read()
+    out_fd, out_path = tempfile.mkstemp(suffix=".mi2log")
+    os.close(out_fd)
+
+    print "Log: %s (%d bytes), best of %d" % (path, len(data), repeat)
+    try:
+        report("reference", len(data),
+               min(timeit.repeat(lambda: bench_reference(data), number=1, repeat=repeat)))
+        report("feed", len(data),
+               min(timeit.repeat(lambda: bench_feed(data), number=1, repeat=repeat)))
+        report("replay", len(data),
+               min(timeit.repeat(lambda: bench_replay(path), number=1, repeat=repeat)))
+        report("export", len(data),
+               min(timeit.repeat(lambda: bench_export(data, out_path), number=1, repeat=repeat)))
+    finally:
+        os.remove(out_path)
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# Filename: import-test.py
+
+"""
+Check that the installed mobile_insight package and its dm_collector_c
+extension are imported without help from the current directory.
+
+Usage:
+python import-test.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+def run_in_clean_dir(code):
+    """
+    Run code in a new interpreter whose working directory and script
+    directory contain no module, so that only installed modules are found.
+
+    :returns: (exit status, output)
+    """
+    clean_dir = tempfile.mkdtemp()
+    try:
+        proc = subprocess.Popen([sys.executable, "-c", code],
+                                cwd=clean_dir,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        output = proc.communicate()[0]
+        return proc.returncode, output
+    finally:
+        os.rmdir(clean_dir)
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_import_monitor(self):
+        status, output = run_in_clean_dir(
+            "import mobile_insight.monitor\n"
+            "import mobile_insight.analyzer\n")
+        self.assertEqual(status, 0, output)
+
+    def test_dm_endec_uses_package_extension(self):
+        status, output = run_in_clean_dir(
+            "from mobile_insight.monitor.dm_collector import dm_collector_c\n"
+            "from mobile_insight.monitor.dm_collector.dm_endec import dm_log_packet\n"
+            "assert dm_log_packet.dm_collector_c is dm_collector_c\n")
+        self.assertEqual(status, 0, output)
+
+
+if __name__ == "__main__":
+    unittest.main()